@@ -0,0 +1,198 @@
+"""
+Headless frame-time benchmark of the renderer.
+
+Usage: python benchmarks/frame_benchmark.py [--faces 100000 1000000] [--frames 120] [--modes wireframe filled]
+                                            [--output results.json] [--skip-res]
+
+Renderer runs offscreen with the SDL dummy video driver and without a frame rate cap. Every mesh in
+res/ and synthetic torus meshes with the requested face counts are drawn along the same scripted camera
+path: an orbit around the mesh whose distance swings between close up and far away, so both near-plane
+clipping and the coarse levels of detail are exercised. Per-frame time percentiles and the per-stage
+breakdown from the renderer's profiler are written as JSON (to stdout without --output), so results of
+two commits can be compared. Meshes are loaded through a temporary mesh cache and the first --warmup
+frames, which include compiling the numba kernels, are not measured.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numba
+import numpy as np
+import pygame as pg
+from main import Renderer, STARTUP_ASSETS
+from object3d import Object3D
+
+PERCENTILES = (50, 90, 95, 99)
+
+def check_assets():
+    #Stop with the names of the files Renderer loads at startup that are missing, instead of a traceback from inside it
+    missing = [name for name in STARTUP_ASSETS if not os.path.isfile(os.path.join(ROOT, name))]
+    if missing:
+        sys.exit("Missing assets in %s: %s" % (ROOT, ", ".join(missing)))
+
+def write_synthetic_torus(filename, face_count, materials=8):
+    """
+    Write a closed, outward wound torus made of about face_count triangles, in bands of materials.
+
+    Args:
+    - filename (str): Path of the .obj file, a matching .mtl file is written next to it.
+    - face_count (int): Number of triangles.
+    - materials (int): Number of materials, every one covers a band around the ring.
+    """
+    tube = max(int(np.sqrt(face_count / 4)), 3)
+    ring = max(face_count // (2 * tube), 3)
+    theta = np.repeat(np.arange(ring) * 2 * np.pi / ring, tube)
+    phi = np.tile(np.arange(tube) * 2 * np.pi / tube, ring)
+    xyz = np.stack([(4 + np.cos(phi)) * np.cos(theta), np.sin(phi), (4 + np.cos(phi)) * np.sin(theta)], axis=1)
+    i, j = np.repeat(np.arange(ring), tube), np.tile(np.arange(tube), ring)
+    a, b = i * tube + j + 1, (i + 1) % ring * tube + j + 1
+    c, d = i * tube + (j + 1) % tube + 1, (i + 1) % ring * tube + (j + 1) % tube + 1
+    triangles = np.stack([a, c, b, b, c, d], axis=1).reshape(-1, 3)
+    with open(os.path.splitext(filename)[0] + ".mtl", "w") as mtl:
+        for m in range(materials):
+            mtl.write("newmtl m%d\nKd %.3f %.3f %.3f\n" % (m, m / materials, 0.5, 1 - m / materials))
+    with open(filename, "w") as f:
+        f.write("mtllib %s\n" % os.path.basename(os.path.splitext(filename)[0] + ".mtl"))
+        f.write(("v %.6f %.6f %.6f\n" * len(xyz)) % tuple(xyz.ravel()))
+        for m, band in enumerate(np.array_split(triangles, materials)):
+            f.write("usemtl m%d\n" % m)
+            f.write(("f %d %d %d\n" * len(band)) % tuple(band.ravel()))
+
+def camera_path(camera, center, radius, frame, frames):
+    """
+    Put the camera on its scripted position for a frame, looking at the center of the mesh.
+
+    Args:
+    - camera (Camera): The camera to move.
+    - center (numpy array): World space center of the mesh.
+    - radius (float): Radius of the bounding sphere of the mesh.
+    - frame (int): Frame number.
+    - frames (int): Frames in one loop of the path.
+    """
+    angle = 2 * math.pi * frame / frames
+    # From just outside the bounding sphere to far enough for the coarsest level of detail
+    distance = radius * (5.5 + 4.5 * math.cos(2 * angle))
+    direction = np.array([math.sin(angle), 0.35, -math.cos(angle)])
+    direction /= np.linalg.norm(direction)
+    camera.position = np.array([*(center[:3] + direction * distance), 1.0])
+    camera.look_at(center)
+
+def summarize(values):
+    #Mean, max and percentiles of a list of seconds, in milliseconds
+    values = np.asarray(values) * 1000
+    summary = {"mean": float(values.mean()), "max": float(values.max())}
+    summary.update({"p%d" % p: float(np.percentile(values, p)) for p in PERCENTILES})
+    return summary
+
+def run_mesh(app, filename, mode, frames, warmup):
+    """
+    Load a mesh and draw it along the camera path.
+
+    Returns:
+    - dict: Load time, frame time percentiles and per-stage breakdown of the run.
+    """
+    start = time.perf_counter()
+    app.set_object(app.get_object_from_file(filename))
+    load_seconds = time.perf_counter() - start
+    app.render_mode = mode
+    center, radius = app.object.bounds()
+    camera_path(app.camera, center, radius, 0, frames)
+    for _ in range(warmup):
+        app.draw()
+        app.profiler.end_frame()
+
+    frame_times, stage_times, triangles = [], [], []
+    app.profiler.frames = []
+    for frame in range(frames):
+        camera_path(app.camera, center, radius, frame, frames)
+        start = time.perf_counter()
+        app.draw()
+        pg.display.flip()
+        frame_times.append(time.perf_counter() - start)
+        stage_times.append(app.profiler.end_frame())
+        triangles.append(app.scene.triangles_drawn)
+    stages = sorted({name for frame in stage_times for name in frame})
+    return {
+        "mesh": os.path.relpath(filename, ROOT) if filename.startswith(ROOT) else os.path.basename(filename),
+        "faces": int(app.object.polygon_count),
+        "mode": mode,
+        "load_seconds": load_seconds,
+        "frames": frames,
+        "frame_ms": summarize(frame_times),
+        "fps_mean": float(frames / sum(frame_times)),
+        "stages_ms": {name: summarize([frame.get(name, 0.0) for frame in stage_times]) for name in stages},
+        "triangles_drawn_mean": float(np.mean(triangles)),
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--faces", type=int, nargs="*", default=[100000, 1000000])
+    parser.add_argument("--frames", type=int, default=120)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--modes", nargs="+", default=list(Object3D.RENDER_MODES), choices=Object3D.RENDER_MODES)
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--skip-res", action="store_true", help="only benchmark the synthetic meshes")
+    args = parser.parse_args()
+    check_assets()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Renderer creates its mesh cache from the environment
+        os.environ["OBJVIEWER_CACHE_DIR"] = os.path.join(directory, "cache")
+        app = Renderer()
+        app.profiler.enabled = True
+        meshes = [] if args.skip_res else sorted(os.path.join(ROOT, "res", name)
+                                                 for name in os.listdir(os.path.join(ROOT, "res")) if name.endswith(".obj"))
+        for face_count in args.faces:
+            filename = os.path.join(directory, "synthetic_%d.obj" % face_count)
+            write_synthetic_torus(filename, face_count)
+            meshes.append(filename)
+
+        runs = []
+        for filename in meshes:
+            for mode in args.modes:
+                run = run_mesh(app, filename, mode, args.frames, args.warmup)
+                runs.append(run)
+                print("%-28s %-9s %8d faces  p50 %7.2f ms  p95 %7.2f ms" % (
+                    run["mesh"], mode, run["faces"], run["frame_ms"]["p50"], run["frame_ms"]["p95"]), file=sys.stderr)
+        pg.quit()
+
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "numba": numba.__version__,
+        "pygame": pg.version.ver,
+        "platform": platform.platform(),
+        "resolution": list(app.RES),
+        "frames": args.frames,
+        "runs": runs,
+    }
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
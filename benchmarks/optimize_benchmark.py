@@ -0,0 +1,141 @@
+"""
+Benchmark of the load-time mesh optimization (vertex welding, unique edges and locality order).
+
+Usage: python benchmarks/optimize_benchmark.py [--faces 100000 1000000] [--repeats 10] [--output results.json]
+                                               [--skip-res]
+
+Every mesh in res/ and synthetic tori with the requested face counts are parsed, and drawn offscreen
+(SDL dummy video driver) once as parsed and once after mesh_optimizer.optimize_mesh. Every torus is also
+drawn as a triangle soup, every face with vertices of its own and the faces shuffled, the way some
+exporters write meshes. For every mesh the vertex, face and edge counts before and after, the time the
+optimization took and the time of the transform, classify and raster stages in both render modes are
+reported, with the gain of the optimized mesh. Edges before are the polygon sides the wireframe mode
+drew before the edge list. Results are written as JSON (to stdout without --output).
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numba
+import numpy as np
+from main import Renderer
+from object3d import Object3D, draw_instances
+from loader import parse_model
+from mesh_optimizer import optimize_mesh
+from rasterizer import DEPTH_CLEAR
+from frame_benchmark import write_synthetic_torus, camera_path, git_commit
+
+STAGES = ("transform", "classify", "raster")
+
+def triangle_soup(mesh, seed=0):
+    #The mesh with vertices of its own for every face and the faces in random order
+    counts = np.diff(mesh["face_offsets"])
+    order = np.random.default_rng(seed).permutation(len(counts))
+    offsets = np.zeros(len(order) + 1, dtype=np.int64)
+    np.cumsum(counts[order], out=offsets[1:])
+    corners = np.repeat(mesh["face_offsets"][:-1][order] - offsets[:-1], counts[order]) + np.arange(offsets[-1])
+    return dict(mesh, vertices=mesh["vertices"][mesh["face_indices"][corners]], face_offsets=offsets,
+                face_indices=np.arange(offsets[-1], dtype=np.int32), face_materials=mesh["face_materials"][order])
+
+def time_stages(app, obj, mode, repeats):
+    """
+    Draw an object and time the stages, the fastest run of every stage counts.
+
+    Returns:
+    - dict: Stage name -> milliseconds, "total" for all of them.
+    """
+    app.render_mode = mode
+    runs = []
+    # One untimed run, it compiles the kernels for new array layouts
+    for _ in range(repeats + 1):
+        app.screen.blit(app.skybox_image, (0, 0))
+        app.depth_buffer.fill(DEPTH_CLEAR)
+        obj.front = obj.front_faces(app.camera.position)
+        draw_instances(app, [obj], mode)
+        runs.append(app.profiler.end_frame())
+    best = {name: min(run.get(name, 0.0) for run in runs[1:]) * 1000 for name in STAGES}
+    best["total"] = sum(best.values())
+    return best
+
+def run_mesh(app, name, mesh, repeats):
+    """
+    Optimize a parsed mesh and draw it before and after.
+
+    Returns:
+    - dict: Counts, optimization time and stage times before and after.
+    """
+    objects, optimized = {}, dict(mesh)
+    start = time.perf_counter()
+    counts = optimize_mesh(optimized)
+    seconds = time.perf_counter() - start
+    for key, arrays in (("before", mesh), ("after", optimized)):
+        arrays = {name: value for name, value in arrays.items() if name not in ("edges", "face_edges")}
+        objects[key] = Object3D.from_arrays(app, **arrays)
+    app.set_object(objects["after"])
+    center, radius = objects["after"].bounds()
+    camera_path(app.camera, center, radius, 0, 1)
+    # Both versions use the same backface culling, welding can make a mesh closed that was not before
+    objects["before"].backface_culling = objects["after"].backface_culling
+    run = {"mesh": name, "optimize_ms": seconds * 1000,
+           **{what: {"before": int(before), "after": int(after)} for what, (before, after) in counts.items()}}
+    for mode in Object3D.RENDER_MODES:
+        before, after = (time_stages(app, objects[key], mode, repeats) for key in ("before", "after"))
+        run[mode] = {"before_ms": before, "after_ms": after,
+                     "gain": {stage: before[stage] / after[stage] if after[stage] > 0 else None for stage in before}}
+        print("%-28s %-9s vertices %8d -> %8d  edges %8d -> %8d  transform %6.2f -> %6.2f ms  total %8.2f -> %8.2f ms" % (
+            name, mode, run["vertices"]["before"], run["vertices"]["after"], run["edges"]["before"],
+            run["edges"]["after"], before["transform"], after["transform"], before["total"], after["total"]),
+            file=sys.stderr)
+    return run
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--faces", type=int, nargs="*", default=[100000, 1000000])
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--skip-res", action="store_true", help="only benchmark the synthetic meshes")
+    args = parser.parse_args()
+
+    report = lambda stage, done: None
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["OBJVIEWER_CACHE_DIR"] = os.path.join(directory, "cache")
+        app = Renderer()
+        app.profiler.enabled = True
+        meshes = [] if args.skip_res else [(name, parse_model(os.path.join(ROOT, "res", name), report))
+                                           for name in sorted(os.listdir(os.path.join(ROOT, "res"))) if name.endswith(".obj")]
+        for face_count in args.faces:
+            filename = os.path.join(directory, "synthetic_%d.obj" % face_count)
+            write_synthetic_torus(filename, face_count)
+            mesh = parse_model(filename, report)
+            meshes += [(os.path.basename(filename), mesh), ("soup_%d" % face_count, triangle_soup(mesh))]
+        runs = [run_mesh(app, name, mesh, args.repeats) for name, mesh in meshes]
+
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "numba": numba.__version__,
+        "platform": platform.platform(),
+        "resolution": list(app.RES),
+        "runs": runs,
+    }
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""
+Thread scaling benchmark of the parallel vertex and face kernels.
+
+Usage: python benchmarks/parallel_benchmark.py [--faces 1000000 4000000] [--threads 1 2 4 8 16] [--repeats 10]
+                                               [--crossover 10000 30000 100000 300000] [--output results.json]
+
+Synthetic tori with the requested face counts are drawn offscreen (SDL dummy video driver) with the
+serial kernels and with the parallel ones on 1 to N numba threads (every power of two up to the
+number of threads numba was started with, by default). The time of the back-face test, of the
+transform (model-view-projection product, perspective divide and screen mapping) and of the face
+classification are taken for every run, with the speedup and parallel efficiency relative to the
+serial kernels. The crossover sweep times small meshes on all threads to check the automatic
+serial/parallel thresholds of clipping.py. Results are written as JSON (to stdout without --output).
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numba
+from main import Renderer
+from object3d import draw_instances
+from clipping import PARALLEL_MIN_VERTICES, PARALLEL_MIN_FACES
+from frame_benchmark import write_synthetic_torus, camera_path, git_commit
+
+STAGES = ("facing", "transform", "classify")
+
+def time_kernels(app, obj, parallel, repeats):
+    """
+    Time the kernels on the loaded object with the current numba thread count.
+
+    Args:
+    - app (Renderer): The renderer, its camera is already placed.
+    - obj (Object3D): The object to draw.
+    - parallel (bool): Whether the parallel kernels are used.
+    - repeats (int): Measured runs, the fastest one counts.
+
+    Returns:
+    - dict: Stage name -> milliseconds, "total" for all three.
+    """
+    # One untimed run, the first call of a kernel on new threads is slower
+    runs = []
+    for _ in range(repeats + 1):
+        start = time.perf_counter()
+        obj.front = obj.front_faces(app.camera.position, parallel)
+        facing = time.perf_counter() - start
+        draw_instances(app, [obj], "filled", parallel)
+        stages = app.profiler.end_frame()
+        runs.append({"facing": facing * 1000, "transform": stages["transform"] * 1000,
+                     "classify": stages["classify"] * 1000})
+    runs = runs[1:]
+    best = {name: min(run[name] for run in runs) for name in STAGES}
+    best["total"] = sum(best.values())
+    return best
+
+def load(app, filename):
+    #Load a mesh without levels of detail and look at it from a distance where all of it is in view
+    obj = app.get_object_from_file(filename, lods=False)
+    app.set_object(obj)
+    center, radius = obj.bounds()
+    camera_path(app.camera, center, radius, 0, 1)
+    return obj
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--faces", type=int, nargs="+", default=[1000000, 4000000])
+    parser.add_argument("--threads", type=int, nargs="+", default=None,
+                        help="thread counts (default: powers of two up to NUMBA_NUM_THREADS)")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--crossover", type=int, nargs="*", default=[10000, 30000, 100000, 300000],
+                        help="face counts of the serial/parallel threshold sweep")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    args = parser.parse_args()
+    max_threads = numba.config.NUMBA_NUM_THREADS
+    threads = args.threads or sorted({2 ** i for i in range(max_threads.bit_length()) if 2 ** i <= max_threads} | {max_threads})
+    threads = [t for t in threads if 1 <= t <= max_threads]
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["OBJVIEWER_CACHE_DIR"] = os.path.join(directory, "cache")
+        app = Renderer()
+        app.profiler.enabled = True
+        scaling = []
+        for face_count in args.faces:
+            filename = os.path.join(directory, "synthetic_%d.obj" % face_count)
+            write_synthetic_torus(filename, face_count)
+            obj = load(app, filename)
+            numba.set_num_threads(max_threads)
+            serial = time_kernels(app, obj, False, args.repeats)
+            runs = []
+            for count in threads:
+                numba.set_num_threads(count)
+                run = time_kernels(app, obj, True, args.repeats)
+                run.update(threads=count, speedup=serial["total"] / run["total"],
+                           efficiency=serial["total"] / run["total"] / count)
+                runs.append(run)
+                print("%9d faces %3d threads: %8.2f ms (serial %8.2f ms) speedup %5.2f" % (
+                    obj.polygon_count, count, run["total"], serial["total"], run["speedup"]), file=sys.stderr)
+            scaling.append({"faces": int(obj.polygon_count), "vertices": len(obj.vertices_untouched),
+                            "serial_ms": serial, "parallel": runs})
+
+        # Small meshes on every thread, where the parallel kernels stop paying off
+        numba.set_num_threads(max_threads)
+        crossover = []
+        for face_count in args.crossover:
+            filename = os.path.join(directory, "crossover_%d.obj" % face_count)
+            write_synthetic_torus(filename, face_count)
+            obj = load(app, filename)
+            serial, parallel = time_kernels(app, obj, False, args.repeats), time_kernels(app, obj, True, args.repeats)
+            crossover.append({"faces": int(obj.polygon_count), "vertices": len(obj.vertices_untouched),
+                              "serial_ms": serial["total"], "parallel_ms": parallel["total"]})
+            print("%9d faces: serial %7.3f ms, parallel %7.3f ms" % (
+                obj.polygon_count, serial["total"], parallel["total"]), file=sys.stderr)
+
+    faster = [run["faces"] for run in crossover if run["parallel_ms"] < run["serial_ms"]]
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "numba": numba.__version__,
+        "threading_layer": numba.threading_layer(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "max_threads": max_threads,
+        "thresholds": {"vertices": PARALLEL_MIN_VERTICES, "faces": PARALLEL_MIN_FACES},
+        "scaling": scaling,
+        "crossover": crossover,
+        "smallest_faster_parallel_faces": min(faster) if faster else None,
+    }
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == '__main__':
+    main()
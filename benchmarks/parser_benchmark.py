@@ -0,0 +1,125 @@
+"""
+Throughput benchmark of the chunked .obj parser against the previous line-by-line parser.
+
+Usage: python benchmarks/parser_benchmark.py [--faces 1000000 10000000] [--legacy-limit 2000000] [--keep]
+
+Synthetic grid meshes with the requested face counts are written to a temporary directory and parsed
+by both parsers. The legacy parser is skipped above --legacy-limit faces since it needs minutes and
+several GB of memory there.
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from obj_parser import parse_obj
+
+class Face:
+    #The per-face object the legacy parser creates
+    def __init__(self, vertices, material_name=None):
+        self.vertices = vertices
+        self.material_name = material_name
+
+def legacy_parse(filename):
+    #The line based parser get_object_from_file used before obj_parser
+    vertices, faces_inst, materials = [], [], {}
+    root, _ = os.path.splitext(filename)
+    mtl_filename = root + ".mtl"
+    current_material = None
+    if os.path.exists(mtl_filename):
+        with open(mtl_filename) as mtl_file:
+            for line in mtl_file:
+                if line.startswith('newmtl'):
+                    current_material = line.split()[1]
+                    materials[current_material] = [0, 0, 0]
+                elif line.startswith('Kd'):
+                    materials[current_material] = [float(value) * 255 for value in line.split()[1:]]
+    else:
+        current_material_name = "default"
+        materials["default"] = [0, 0, 0]
+    with open(filename) as f:
+        for line in f:
+            if line.startswith('v '):
+                vertices.append([float(i) for i in line.split()[1:]] + [1])
+            elif line.startswith('usemtl') and os.path.exists(mtl_filename):
+                current_material_name = line.split()[1]
+            elif line.startswith('f'):
+                faces_ = line.split()[1:]
+                faces_inst.append(Face([int(face_.split('/')[0]) - 1 for face_ in faces_], current_material_name))
+    return np.array(vertices), faces_inst, materials
+
+def write_synthetic_obj(filename, face_count, materials=8, run_length=10000, block=200000):
+    """
+    Write a triangulated grid with roughly face_count faces and a usemtl line every run_length faces.
+
+    Args:
+    - filename (str): Path of the .obj file, a matching .mtl file is written next to it.
+    - face_count (int): Number of triangles.
+    - materials (int): Number of materials cycled through.
+    - run_length (int): Faces per usemtl run.
+    - block (int): Records formatted at once.
+    """
+    side = int(np.ceil(np.sqrt(face_count / 2))) + 1
+    with open(os.path.splitext(filename)[0] + ".mtl", "w") as mtl:
+        for m in range(materials):
+            mtl.write("newmtl m%d\nKd %.3f %.3f %.3f\n" % (m, m / materials, 0.5, 1 - m / materials))
+    with open(filename, "w") as f:
+        f.write("mtllib %s\n" % os.path.basename(os.path.splitext(filename)[0] + ".mtl"))
+        for start in range(0, side * side, block):
+            ids = np.arange(start, min(start + block, side * side))
+            xyz = np.stack([ids % side, np.sin(ids * 0.001), ids // side], axis=1).astype(np.float64) * 0.01
+            f.write(("v %.6f %.6f %.6f\n" * len(ids)) % tuple(xyz.ravel()))
+        cells = face_count // 2
+        for start in range(0, cells, block):
+            cell = np.arange(start, min(start + block, cells))
+            a = (cell // (side - 1)) * side + cell % (side - 1) + 1
+            tris = np.stack([a, a + 1, a + side, a + 1, a + side + 1, a + side], axis=1)
+            text = ("f %d %d %d\nf %d %d %d\n" * len(cell)) % tuple(tris.ravel())
+            lines = text.splitlines(True)
+            for run in range(0, len(lines), run_length):
+                face_index = start * 2 + run
+                if face_index % run_length == 0:
+                    f.write("usemtl m%d\n" % ((face_index // run_length) % materials))
+                f.write("".join(lines[run:run + run_length]))
+
+def measure(parse, filename, repeat=1):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(filename)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--faces", type=int, nargs="+", default=[1000000, 10000000])
+    parser.add_argument("--legacy-limit", type=int, default=2000000)
+    parser.add_argument("--keep", action="store_true", help="keep the generated files")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="obj_bench_")
+    parse_obj(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "res", "Tree.obj"))  # compile
+    print("%12s %10s %16s %16s %8s" % ("faces", "MB", "chunked MB/s", "legacy MB/s", "speedup"))
+    for face_count in args.faces:
+        filename = os.path.join(directory, "synthetic_%d.obj" % face_count)
+        write_synthetic_obj(filename, face_count)
+        size_mb = os.path.getsize(filename) / 1e6
+        chunked = measure(parse_obj, filename)
+        if face_count <= args.legacy_limit:
+            legacy = measure(legacy_parse, filename)
+            legacy_text, speedup = "%16.1f" % (size_mb / legacy), "%7.1fx" % (legacy / chunked)
+        else:
+            legacy_text, speedup = "%16s" % "skipped", "%8s" % "-"
+        print("%12d %10.1f %16.1f %s %s" % (face_count, size_mb, size_mb / chunked, legacy_text, speedup))
+        if not args.keep:
+            os.remove(filename)
+            os.remove(os.path.splitext(filename)[0] + ".mtl")
+    if not args.keep:
+        os.rmdir(directory)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Headless startup-time benchmark of the renderer.
+
+Usage: python benchmarks/startup_benchmark.py [--repeats 5] [--target 2.0] [--cold] [--output results.json]
+
+Every run starts a fresh interpreter that imports main, constructs Renderer (loading res/Tree.obj and
+warming up the numba kernels) and draws the first frame, offscreen with the SDL dummy video driver.
+Runs use the numba and mesh caches as a user who started the viewer before would have them, the first
+(untimed) run fills them. With --cold one more run is timed with empty caches, which includes compiling
+every kernel. The median time from starting the interpreter to the first frame is compared with the
+target; the exit code is 1 when it is missed. Results are written as JSON (to stdout without --output),
+including whether heavy optional modules (tkinter, aspose) were imported at startup.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Seconds from starting the interpreter to the first frame, with warm caches
+STARTUP_TARGET = 2.0
+# Modules that should only be imported once a feature needs them
+LAZY_MODULES = ("tkinter", "aspose")
+
+def measure():
+    #Body of a timed run, reports its timings as JSON on stdout
+    start = time.perf_counter()
+    sys.path.insert(0, ROOT)
+    import pygame as pg
+    from main import Renderer
+    imported = time.perf_counter()
+    app = Renderer()
+    constructed = time.perf_counter()
+    app.draw()
+    app.draw_ui()
+    pg.display.flip()
+    drawn = time.perf_counter()
+    print(json.dumps({
+        "import_seconds": imported - start,
+        "init_seconds": constructed - imported,
+        "first_frame_seconds": drawn - constructed,
+        "lazy_modules_imported": [name for name in LAZY_MODULES if name in sys.modules],
+    }))
+
+def timed_run(env):
+    """
+    Start the viewer in a new interpreter.
+
+    Args:
+    - env (dict): Environment of the interpreter.
+
+    Returns:
+    - dict: Timings of the run, "total_seconds" counting from the start of the interpreter.
+    """
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), "--child"], env=env, cwd=ROOT,
+                            capture_output=True, text=True)
+    total = time.perf_counter() - start
+    if result.returncode != 0:
+        sys.exit("The viewer failed to start:\n" + result.stderr)
+    run = json.loads(result.stdout.strip().splitlines()[-1])
+    run["total_seconds"] = total
+    return run
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--target", type=float, default=STARTUP_TARGET, help="seconds to the first frame")
+    parser.add_argument("--cold", action="store_true", help="also time a run with empty numba and mesh caches")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        measure()
+        return 0
+
+    # The timed runs start in other interpreters, the check imports the viewer in this one only
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from frame_benchmark import check_assets
+    check_assets()
+    env = dict(os.environ, SDL_VIDEODRIVER="dummy", SDL_AUDIODRIVER="dummy", PYGAME_HIDE_SUPPORT_PROMPT="1")
+    results = {"python": platform.python_version(), "platform": platform.platform(), "target_seconds": args.target}
+    with tempfile.TemporaryDirectory() as directory:
+        if args.cold:
+            cold_env = dict(env, NUMBA_CACHE_DIR=os.path.join(directory, "numba"),
+                            OBJVIEWER_CACHE_DIR=os.path.join(directory, "cold_cache"))
+            results["cold"] = timed_run(cold_env)
+            print("cold: %.2fs" % results["cold"]["total_seconds"], file=sys.stderr)
+        env["OBJVIEWER_CACHE_DIR"] = os.path.join(directory, "cache")
+        # Fills the caches
+        timed_run(env)
+        runs = []
+        for _ in range(args.repeats):
+            runs.append(timed_run(env))
+            print("warm: %.2fs" % runs[-1]["total_seconds"], file=sys.stderr)
+    results["warm"] = runs
+    results["warm_median"] = {name: median([run[name] for run in runs])
+                              for name in ("total_seconds", "import_seconds", "init_seconds", "first_frame_seconds")}
+    results["within_target"] = results["warm_median"]["total_seconds"] <= args.target
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0 if results["within_target"] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,9 @@
 import pygame as pg
 from matrix_functionality import *
 
+# Keys Camera.control moves or turns the camera with while they are held
+CONTROL_KEYS = (pg.K_w, pg.K_a, pg.K_s, pg.K_d, pg.K_q, pg.K_e, pg.K_LEFT, pg.K_RIGHT, pg.K_UP, pg.K_DOWN)
+
 class Camera:
     def __init__(self, render, position):
         """
@@ -19,13 +22,129 @@ class Camera:
         self.v_fov = self.h_fov * (render.HEIGHT / render.WIDTH)
         self.near_plane = 0.1
         self.far_plane = 100
+        self.frustum_planes = self.view_frustum_planes()
         self.moving_speed = 0.3
         self.rotation_speed = 0.015
+        # Movement stops this far from the surface of objects, unless collisions are turned off (C)
+        self.collisions = True
+        self.collision_radius = 0.5
 
         self.anglePitch = 0
         self.angleYaw = 0
         self.angleRoll = 0
 
+        # Cached matrices, rebuilt by update() only when the position or the angles change
+        self.version = 0
+        self.state_key = None
+        self.view_matrix = None
+        self.view_projection = None
+
+    def view_frustum_planes(self):
+        """
+        Compute the planes of the view frustum in camera space.
+
+        Returns:
+        - numpy.ndarray: (6, 4) array of unit-normal planes (near, far, left, right, bottom, top).
+          A camera space point p is inside the frustum when planes @ p >= 0 for every plane.
+        """
+        th, tv = math.tan(self.h_fov / 2), math.tan(self.v_fov / 2)
+        planes = np.array([
+            [0, 0, 1, -self.near_plane],
+            [0, 0, -1, self.far_plane],
+            [1, 0, th, 0],
+            [-1, 0, th, 0],
+            [0, 1, tv, 0],
+            [0, -1, tv, 0]
+        ], dtype=np.float64)
+        planes[2:] /= np.linalg.norm(planes[2:, :3], axis=1).reshape(-1, 1)
+        return planes
+
+    def spheres_in_frustum(self, centers, radii):
+        """
+        Test bounding spheres against the view frustum.
+
+        Parameters:
+        - centers: (M, 4) camera space sphere centers.
+        - radii: (M,) sphere radii.
+
+        Returns:
+        - numpy.ndarray: (M,) boolean mask, False for spheres completely outside the frustum.
+        """
+        distances = np.asarray(centers) @ self.frustum_planes.T
+        return np.all(distances >= -np.asarray(radii).reshape(-1, 1), axis=1)
+
+    def projected_radii(self, centers, radii):
+        """
+        Approximate on-screen size of bounding spheres, from their distance to the camera position.
+
+        Parameters:
+        - centers: (M, 4) world space sphere centers.
+        - radii: (M,) sphere radii.
+
+        Returns:
+        - numpy.ndarray: (M,) radii in pixels, infinite for spheres containing the camera.
+        """
+        radii = np.asarray(radii, dtype=np.float64)
+        distances = np.linalg.norm(np.asarray(centers)[:, :3] - self.position[:3], axis=1)
+        pixels_per_unit = self.render.H_WIDTH / math.tan(self.h_fov / 2)
+        with np.errstate(divide='ignore'):
+            return np.where(distances > radii, radii * pixels_per_unit / distances, np.inf)
+
+    def screen_bounds(self, centers, radii):
+        """
+        Screen space bounding rectangles of bounding spheres, from the lines through the camera tangent to them.
+
+        Parameters:
+        - centers: (M, 4) camera space sphere centers.
+        - radii: (M,) sphere radii.
+
+        Returns:
+        - numpy.ndarray: (M, 4) left, top, right and bottom in pixels, clamped to the screen. Spheres
+          reaching behind the camera cover the whole screen.
+        """
+        centers, radii = np.asarray(centers, dtype=np.float64), np.asarray(radii, dtype=np.float64)
+        x, y, z = centers[:, 0], centers[:, 1], centers[:, 2]
+        in_front = z > radii
+        with np.errstate(divide='ignore', invalid='ignore'):
+            d = z * z - radii * radii
+            sx = radii * np.sqrt(np.maximum(x * x + d, 0))
+            sy = radii * np.sqrt(np.maximum(y * y + d, 0))
+            # Slopes x/z and y/z of the tangents, divided by the slope at the edge of the screen
+            th, tv = math.tan(self.h_fov / 2), math.tan(self.v_fov / 2)
+            left, right = (x * z - sx) / d / th, (x * z + sx) / d / th
+            bottom, top = (y * z - sy) / d / tv, (y * z + sy) / d / tv
+        hw, hh = self.render.H_WIDTH, self.render.H_HEIGHT
+        bounds = np.stack([hw * (1 + left), hh * (1 - top), hw * (1 + right), hh * (1 - bottom)], axis=1)
+        bounds[~in_front] = [0, 0, self.render.WIDTH, self.render.HEIGHT]
+        return np.clip(bounds, 0, [self.render.WIDTH, self.render.HEIGHT, self.render.WIDTH, self.render.HEIGHT])
+
+    def ray(self, position):
+        """
+        World space ray from the camera through a point of the screen.
+
+        Parameters:
+        - position: (x, y) screen position in pixels.
+
+        Returns:
+        - tuple: (origin, direction) 3-component numpy arrays, direction reaching view z = 1.
+        """
+        self.update()
+        x = (position[0] / self.render.H_WIDTH - 1) * math.tan(self.h_fov / 2)
+        y = (1 - position[1] / self.render.H_HEIGHT) * math.tan(self.v_fov / 2)
+        direction = x * self.right[:3] + y * self.up[:3] + self.forward[:3]
+        return self.position[:3].astype(np.float64), direction
+
+    def look_at(self, target):
+        """
+        Turn the camera towards a point.
+
+        Parameters:
+        - target: World space point (3 components).
+        """
+        look = np.asarray(target[:3], dtype=np.float64) - self.position[:3]
+        self.angleYaw = math.atan2(look[0], look[2])
+        self.anglePitch = math.atan2(-look[1], math.hypot(look[0], look[2]))
+
     def reset_cam_position(self):
         #Reset camera position and rotation to the starting point.
         self.position = np.array([*[-1, 6, -30], 1.0])
@@ -47,23 +166,26 @@ class Camera:
         - 'R': Reset camera position and orientation
         - Arrow keys: Rotate the camera
 
-        The movement and rotation speed are controlled by the 'moving_speed' and 'rotation_speed' attributes.
+        The movement and rotation speed are controlled by the 'moving_speed' and 'rotation_speed' attributes,
+        in units per update step (see Renderer.update).
+        The camera does not move into objects while 'collisions' is on, see collide.
         """
         key = pg.key.get_pressed()
         if key[pg.K_r]:
             self.reset_cam_position()
+        start = self.position[:3].copy()
         if key[pg.K_a]:
-            self.position -= self.right * self.moving_speed
+            self.position[:3] -= self.right[:3] * self.moving_speed
         if key[pg.K_d]:
-            self.position += self.right * self.moving_speed
+            self.position[:3] += self.right[:3] * self.moving_speed
         if key[pg.K_w]:
-            self.position += self.forward * self.moving_speed
+            self.position[:3] += self.forward[:3] * self.moving_speed
         if key[pg.K_s]:
-            self.position -= self.forward * self.moving_speed
+            self.position[:3] -= self.forward[:3] * self.moving_speed
         if key[pg.K_q]:
-            self.position += self.up * self.moving_speed
+            self.position[:3] += self.up[:3] * self.moving_speed
         if key[pg.K_e]:
-            self.position -= self.up * self.moving_speed
+            self.position[:3] -= self.up[:3] * self.moving_speed
         if key[pg.K_LEFT]:
             self.angleYaw -= self.rotation_speed
         if key[pg.K_RIGHT]:
@@ -72,6 +194,42 @@ class Camera:
             self.anglePitch -= self.rotation_speed
         if key[pg.K_DOWN]:
             self.anglePitch += self.rotation_speed
+        if self.collisions and (self.position[:3] != start).any():
+            self.position[:3] = self.collide(start, self.position[:3])
+
+    def controlled(self):
+        """
+        Whether a key of control is held, the camera moves on every update step while it is.
+
+        Returns:
+        - bool: True if any of CONTROL_KEYS is pressed.
+        """
+        key = pg.key.get_pressed()
+        return any(key[k] for k in CONTROL_KEYS)
+
+    def collide(self, start, end):
+        """
+        Limit a movement of the camera so it stays out of the objects of the scene: it stops where it
+        would hit one and slides along its surface for the rest of the movement, see Scene.collide.
+
+        Parameters:
+        - start, end: World space positions before and after the movement (3 components).
+
+        Returns:
+        - numpy.ndarray: The position the camera can move to.
+        """
+        scene = self.render.scene
+        t, normal = scene.collide(start, end, self.collision_radius)
+        if normal is None:
+            return end
+        # The contact point is pushed off the surface a little so the next test starts outside of the object
+        contact = start + t * (end - start) + normal * 1e-3
+        rest = end - contact
+        slide = contact + rest - (rest @ normal) * normal
+        t, normal = scene.collide(contact, slide, self.collision_radius)
+        if normal is None:
+            return slide
+        return contact + t * (slide - contact) + normal * 1e-3
 
     def axiiIdentity(self):
         """
@@ -95,6 +253,22 @@ class Camera:
         self.right = self.right @ rotating
         self.up = self.up @ rotating
 
+    def update(self):
+        """
+        Rebuild the cached matrices if the camera moved or turned since the last call.
+
+        Returns:
+        - int: The camera version, incremented on every change. Callers can key their own caches on it.
+        """
+        state_key = (*self.position, self.anglePitch, self.angleYaw, self.angleRoll)
+        if state_key != self.state_key:
+            self.state_key = state_key
+            self.version += 1
+            self.camera_update_axii()
+            self.view_matrix = self.translate_matrix() @ self.rotate_matrix()
+            self.view_projection = self.view_matrix @ self.render.projection.projection_matrix
+        return self.version
+
     def camera_matrix(self):
         """
         Compute the combined camera transformation matrix.
@@ -102,8 +276,18 @@ class Camera:
         Returns:
         - numpy.ndarray: The combined camera transformation matrix.
         """
-        self.camera_update_axii()
-        return self.translate_matrix() @ self.rotate_matrix()
+        self.update()
+        return self.view_matrix
+
+    def view_projection_matrix(self):
+        """
+        Camera and projection matrices combined.
+
+        Returns:
+        - numpy.ndarray: The world-to-clip-space matrix.
+        """
+        self.update()
+        return self.view_projection
 
     def translate_matrix(self):
         """
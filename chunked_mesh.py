@@ -0,0 +1,417 @@
+"""
+Out-of-core meshes, split into spatial chunks that are paged in while they are in view.
+
+build_chunks sorts the faces of a mesh into the cells of a uniform grid, by the center of every face,
+and lays the mesh out again chunk after chunk: every non-empty cell becomes a chunk with its own copy of
+the vertices its faces use and its own bounding sphere. The result is an ordinary mesh dict over all
+chunks (face_indices point into the chunked vertices) with the chunk table packed in as "chunk_<name>"
+arrays, and with the convex hulls of the chunks as the parts of its hull. It is built a block of faces
+or a chunk at a time into .npy files, so building needs little memory besides the source mesh, which is
+memory-mapped as well when it was parsed into a directory, and the mesh cache memory-maps the result
+(see loader.load_chunked_mesh).
+
+ChunkedObject draws such a mesh without ever reading all of it. Every frame, the chunks whose bounding
+sphere is in the view frustum and big enough on screen are copied out of the memory-mapped arrays into
+objects of their own (nearest first, a few per frame) and drawn like any other object. They are kept
+for the next frames as long as they fit into a memory budget, the chunks drawn least recently are
+dropped first. Pages of the memory-mapped files themselves are left to the operating system, which can
+always reclaim them.
+"""
+
+import os
+from collections import OrderedDict
+import numpy as np
+from numba import njit
+from object3d import *
+from hull import Hull, HULL_DIRECTIONS, extents_to_equations, pack_hull, unpack_hull
+from obj_parser import new_array
+
+# Faces per chunk the grid is sized for, chunks of denser regions get more
+CHUNK_FACES = 1 << 16
+# Faces (or vertices) handled at once while building
+BLOCK_FACES = 1 << 20
+# Names of the arrays of the chunk table in a mesh dict, stored as "chunk_<name>"
+CHUNK_ARRAYS = ("vertex_offsets", "face_offsets", "bounds")
+# Memory the chunks an object keeps in memory may take, in bytes
+CHUNK_MEMORY_BUDGET = 512 << 20
+# Chunks paged in per frame at most, the others follow in the next frames so that moving never stalls
+CHUNK_LOADS_PER_FRAME = 8
+# Chunks smaller than this radius on screen, in pixels, are not drawn
+MIN_CHUNK_PIXELS = 1.0
+
+@njit(cache=True)
+def face_cells(vertices, face_offsets, face_indices, start, end, low, cell_size, dims, out):
+    #Grid cell of the center of every face of start:end, written to out
+    for f in range(start, end):
+        count = max(face_offsets[f + 1] - face_offsets[f], 1)
+        cell = 0
+        for axis in range(3):
+            total = 0.0
+            for k in range(face_offsets[f], face_offsets[f + 1]):
+                total += vertices[face_indices[k], axis]
+            position = (total / count - low[axis]) / cell_size[axis]
+            cell = cell * dims[axis] + int(min(max(position, 0.0), dims[axis] - 1))
+        out[f - start] = cell
+
+@njit(cache=True)
+def place_faces(cells, chunk_of_cell, cursor, destinations):
+    #Position of every face in the chunked layout, the faces of a chunk keep their order. cells may be destinations
+    for i in range(cells.shape[0]):
+        chunk = chunk_of_cell[cells[i]]
+        destinations[i] = cursor[chunk]
+        cursor[chunk] += 1
+
+@njit(cache=True)
+def scatter_faces(face_offsets, face_indices, start, destinations, out_offsets, out_indices):
+    #Copy the corners of the faces from start on to their positions in the chunked layout
+    for i in range(destinations.shape[0]):
+        f = start + i
+        target = out_offsets[destinations[i]] - face_offsets[f]
+        for k in range(face_offsets[f], face_offsets[f + 1]):
+            out_indices[target + k] = face_indices[k]
+
+def grid_dims(low, high, cells):
+    """
+    Size of a grid of about the given number of cubic cells over a box.
+
+    Args:
+    - low, high (numpy arrays): Corners of the box.
+    - cells (int): Number of cells wanted.
+
+    Returns:
+    - numpy array: Cells along every axis, 1 along the axes the box is flat in.
+    """
+    extent = high - low
+    axes = extent > extent.max() * 1e-3
+    if not axes.any():
+        return np.ones(3, dtype=np.int64)
+    size = (np.prod(extent[axes]) / cells) ** (1 / axes.sum())
+    return np.where(axes, np.maximum(np.ceil(extent / size), 1), 1).astype(np.int64)
+
+def build_chunks(mesh, directory=None, chunk_faces=CHUNK_FACES, progress=None):
+    """
+    Lay a mesh out again in spatial chunks, see the module docstring.
+
+    Args:
+    - mesh (dict): Mesh arrays and material names, as returned by obj_parser.parse_obj. They are only
+      read a block at a time, so they may be memory-mapped.
+    - directory (str): Directory the arrays are written to as .npy files (memory-mapped while building,
+      it also gets a scratch file), None to build them in memory.
+    - chunk_faces (int): Faces per chunk the grid is sized for.
+    - progress (callable): Called with the share of the work done so far.
+
+    Returns:
+    - dict: Mesh arrays over all chunks (float32 vertices) and material names, plus the chunk table
+      (see CHUNK_ARRAYS) and the hull arrays (see hull.pack_hull).
+    """
+    report = progress or (lambda done: None)
+    vertices, face_offsets, face_indices = mesh["vertices"], mesh["face_offsets"], mesh["face_indices"]
+    face_count, corner_count = len(face_offsets) - 1, int(face_offsets[-1])
+    blocks = [(start, min(start + BLOCK_FACES, face_count)) for start in range(0, face_count, BLOCK_FACES)]
+
+    # Every face goes to the grid cell its center is in
+    low, high = np.zeros(3), np.zeros(3)
+    for start in range(0, len(vertices), BLOCK_FACES):
+        block = np.asarray(vertices[start:start + BLOCK_FACES, :3], dtype=np.float64)
+        low = block.min(axis=0) if start == 0 else np.minimum(low, block.min(axis=0))
+        high = block.max(axis=0) if start == 0 else np.maximum(high, block.max(axis=0))
+    dims = grid_dims(low, high, max(face_count // chunk_faces, 1))
+    cell_size = np.maximum((high - low) / dims, 1e-12)
+    cells = new_array(directory, "cells", (face_count,), np.int64)
+    counts = np.zeros(int(dims.prod()), dtype=np.int64)
+    for start, end in blocks:
+        face_cells(vertices, face_offsets, face_indices, start, end, low, cell_size, dims, cells[start:end])
+        counts += np.bincount(cells[start:end], minlength=len(counts))
+        report(0.25 * end / face_count)
+
+    # The non-empty cells become the chunks, their faces are moved next to each other (the cells are
+    # overwritten with the positions of the faces)
+    occupied = np.flatnonzero(counts)
+    chunk_of_cell = np.zeros(len(counts), dtype=np.int64)
+    chunk_of_cell[occupied] = np.arange(len(occupied))
+    chunk_face_offsets = np.zeros(len(occupied) + 1, dtype=np.int64)
+    np.cumsum(counts[occupied], out=chunk_face_offsets[1:])
+    cursor = chunk_face_offsets[:-1].copy()
+    out_offsets = new_array(directory, "face_offsets", (face_count + 1,), np.int64)
+    face_materials = new_array(directory, "face_materials", (face_count,), np.int32)
+    out_offsets[0] = 0
+    for start, end in blocks:
+        destinations = cells[start:end]
+        place_faces(destinations, chunk_of_cell, cursor, destinations)
+        out_offsets[1:][destinations] = np.diff(face_offsets[start:end + 1])
+        face_materials[destinations] = mesh["face_materials"][start:end]
+    total = 0
+    for start, end in blocks:
+        sizes = out_offsets[start + 1:end + 1]
+        np.cumsum(sizes, out=sizes)
+        sizes += total
+        total = int(sizes[-1])
+    out_indices = new_array(directory, "face_indices", (corner_count,), np.int32)
+    for start, end in blocks:
+        scatter_faces(face_offsets, face_indices, start, cells[start:end], out_offsets, out_indices)
+        report(0.25 + 0.25 * end / face_count)
+
+    # Every chunk gets its own copy of the vertices it uses, the first pass only counts them
+    chunk_count = len(occupied)
+    corner_ranges = out_offsets[chunk_face_offsets]
+    chunk_vertex_offsets = np.zeros(chunk_count + 1, dtype=np.int64)
+    for c in range(chunk_count):
+        chunk_vertex_offsets[c + 1] = chunk_vertex_offsets[c] + len(np.unique(out_indices[corner_ranges[c]:corner_ranges[c + 1]]))
+    if chunk_vertex_offsets[-1] > np.iinfo(np.int32).max:
+        raise ValueError("%d chunk vertices do not fit into 32-bit face indices" % chunk_vertex_offsets[-1])
+    out_vertices = new_array(directory, "vertices", (int(chunk_vertex_offsets[-1]), 4), np.float32)
+    bounds = np.zeros((chunk_count, 4))
+    extents = np.zeros((chunk_count, len(HULL_DIRECTIONS)))
+    for c in range(chunk_count):
+        corners = out_indices[corner_ranges[c]:corner_ranges[c + 1]]
+        used, local = np.unique(corners, return_inverse=True)
+        first = chunk_vertex_offsets[c]
+        chunk_vertices = np.asarray(vertices[used], dtype=np.float32)
+        out_vertices[first:first + len(used)] = chunk_vertices
+        corners[:] = local + first
+        points = chunk_vertices[:, :3].astype(np.float64)
+        center = (points.min(axis=0) + points.max(axis=0)) / 2
+        bounds[c] = [*center, np.sqrt(((points - center) ** 2).sum(axis=1).max())]
+        extents[c] = (points @ HULL_DIRECTIONS.T).max(axis=0)
+        report(0.5 + 0.5 * (c + 1) / chunk_count)
+
+    del cells
+    if directory is not None:
+        os.remove(os.path.join(directory, "cells.npy"))
+    whole = extents.max(axis=0) if chunk_count else np.zeros(len(HULL_DIRECTIONS))
+    chunked = {"vertices": out_vertices, "face_offsets": out_offsets, "face_indices": out_indices,
+               "face_materials": face_materials, "palette": np.asarray(mesh["palette"], dtype=np.uint8),
+               "material_names": list(mesh["material_names"]), "chunk_vertex_offsets": chunk_vertex_offsets,
+               "chunk_face_offsets": chunk_face_offsets, "chunk_bounds": bounds}
+    chunked.update(pack_hull(Hull(extents_to_equations(whole), extents_to_equations(extents))))
+    return chunked
+
+def object_bytes(obj):
+    #Memory taken by the arrays of an object, of its work buffers and of its hierarchy
+    parts = [vars(obj), vars(obj.work_buffers)] + ([vars(obj.bvh)] if obj.bvh is not None else [])
+    return sum(value.nbytes for part in parts for value in part.values() if isinstance(value, np.ndarray))
+
+class ChunkedObject(Object3D):
+    """
+    An object drawn chunk by chunk from the (memory-mapped) arrays of a chunked mesh, see the module docstring.
+
+    The mesh arrays over all chunks are only read for the chunks paged in and for the picked face, so the
+    object itself has none of the per-face arrays of Object3D, only its transformation; the chunks in
+    memory are Object3D instances placed like it. Back-face culling is off until turned on, telling
+    whether the mesh is closed would mean reading all of it.
+
+    Attributes (on top of the ones of Object3D that concern the transformation):
+    - vertices_untouched, face_offsets, face_indices, face_materials: The mesh arrays over all chunks.
+    - chunk_vertex_offsets, chunk_face_offsets: The vertices and faces of chunk c are the ranges between
+      entries c and c + 1.
+    - chunk_bounds: (C, 4) bounding spheres (center, radius) of the chunks, in the space of the vertices.
+    - resident: Chunks in memory, chunk index -> (Object3D, bytes), least recently drawn first.
+    - resident_bytes: Memory the resident chunks take.
+    - memory_budget: Limit of resident_bytes.
+    - loads_per_frame: Chunks paged in per frame at most, None for no limit.
+    """
+    def __init__(self, render, mesh, memory_budget=CHUNK_MEMORY_BUDGET):
+        """
+        Initialize a chunked object.
+
+        Args:
+        - render: The Renderer instance.
+        - mesh (dict): Chunked mesh arrays, as returned by build_chunks.
+        - memory_budget (int): Memory the chunks in memory may take, in bytes.
+        """
+        self.render = render
+        self.mesh = mesh
+        self.vertices_untouched, self.face_offsets = mesh["vertices"], mesh["face_offsets"]
+        self.face_indices, self.face_materials = mesh["face_indices"], mesh["face_materials"]
+        self.material_names, self.palette = list(mesh["material_names"]), np.asarray(mesh["palette"], dtype=np.uint8)
+        self.materials = {name: list(color) for name, color in zip(self.material_names, self.palette)}
+        self.materials_count = len(self.materials)
+        self.colors = [pg.Color(*map(int, rgb)) for rgb in self.palette]
+        self.polygon_count = len(self.face_materials)
+        self.chunk_vertex_offsets, self.chunk_face_offsets, self.chunk_bounds = (
+            np.asarray(mesh["chunk_" + name]) for name in CHUNK_ARRAYS)
+        # The bounding sphere of the whole mesh is the one around the spheres of the chunks
+        centers, radii = self.chunk_bounds[:, :3], self.chunk_bounds[:, 3:]
+        if len(centers):
+            center = ((centers - radii).min(axis=0) + (centers + radii).max(axis=0)) / 2
+            radius = float((np.linalg.norm(centers - center, axis=1) + radii[:, 0]).max())
+        else:
+            center, radius = np.zeros(3), 0.0
+        self.local_bounds = np.array([*center, 1.0]), radius
+        self.local_box = (np.array([(centers - radii).min(axis=0), (centers + radii).max(axis=0)]) if len(centers)
+                          else np.zeros((2, 3)))
+        self.hull = unpack_hull(dict(mesh))
+        self.hull_key, self.world_hull_planes = None, None
+        self.original_face, self.original_indices = None, None
+        self.bvh = None
+        self.transform = np.identity(4)
+        self.transform_version = 0
+        self.matrices_key = None
+        self.lods, self.lod_instances = [], {}
+        self.backface_culling = False
+        self.font = None
+        self.movement_flag = False
+        self.render_mode = None
+        self.visible = True
+        self.label = ''
+        self.resident = OrderedDict()
+        self.resident_bytes = 0
+        self.memory_budget = memory_budget
+        self.loads_per_frame = CHUNK_LOADS_PER_FRAME
+        self.complete = True
+
+    def instance(self):
+        """
+        Create another instance of this object. The mesh arrays are shared, the chunks in memory are its own.
+
+        Returns:
+        - ChunkedObject: The new instance, with the same transformation as this object.
+        """
+        obj = ChunkedObject(self.render, self.mesh, self.memory_budget)
+        obj.transform = self.transform.copy()
+        obj.backface_culling, obj.render_mode = self.backface_culling, self.render_mode
+        obj.loads_per_frame = self.loads_per_frame
+        return obj
+
+    def page_in(self, chunk):
+        """
+        Copy a chunk out of the mesh arrays into an object of its own, with its work buffers allocated.
+
+        Args:
+        - chunk (int): Index of the chunk.
+
+        Returns:
+        - Object3D: The chunk, its face_indices point into its own vertices.
+        """
+        first_vertex, end_vertex = self.chunk_vertex_offsets[chunk:chunk + 2]
+        first_face, end_face = self.chunk_face_offsets[chunk:chunk + 2]
+        face_offsets = np.array(self.face_offsets[first_face:end_face + 1])
+        face_indices = np.array(self.face_indices[face_offsets[0]:face_offsets[-1]])
+        face_offsets -= face_offsets[0]
+        face_indices -= int(first_vertex)
+        obj = Object3D.from_arrays(self.render, np.array(self.vertices_untouched[first_vertex:end_vertex]),
+                                   face_offsets, face_indices, np.array(self.face_materials[first_face:end_face]),
+                                   self.material_names, self.palette)
+        obj.work_buffers.reserve(len(obj.vertices_untouched), obj.polygon_count, 1, len(obj.edges))
+        return obj
+
+    def place(self, obj):
+        #Make a chunk follow the transformation and the drawing settings of this object
+        obj.transform, obj.transform_version = self.transform, self.transform_version
+        obj.backface_culling, obj.render_mode = self.backface_culling, self.render_mode
+
+    def make_room(self, size, drawn):
+        """
+        Evict the chunks drawn least recently until another one fits into the memory budget.
+
+        Args:
+        - size (int): Bytes of the chunk to make room for.
+        - drawn (int): Chunks drawn in the current frame so far, they are the most recent ones and stay.
+
+        Returns:
+        - bool: Whether the chunk fits.
+        """
+        while self.resident_bytes + size > self.memory_budget and len(self.resident) > drawn:
+            _, (_, evicted) = self.resident.popitem(last=False)
+            self.resident_bytes -= evicted
+        return self.resident_bytes + size <= self.memory_budget
+
+    def visible_chunks(self):
+        """
+        The chunks to draw this frame: those whose bounding sphere is in the view frustum and at least
+        MIN_CHUNK_PIXELS wide on screen, nearest first. Chunks that are not in memory are paged in, up to
+        loads_per_frame of them, evicting the chunks drawn least recently once the memory budget is reached.
+        Chunks that do not fit even then are skipped for this frame. complete tells whether chunks were left
+        for the next frames by the loads_per_frame limit, the picture keeps changing while they are paged in.
+
+        Returns:
+        - list: Object3D instances of the chunks, placed like this object.
+        """
+        camera, profiler = self.render.camera, self.render.profiler
+        camera.update()
+        # The budget may have been lowered since the last frame
+        self.make_room(0, 0)
+        centers = np.column_stack([self.chunk_bounds[:, :3], np.ones(len(self.chunk_bounds))]) @ self.transform
+        radii = self.chunk_bounds[:, 3] * np.linalg.norm(self.transform[:3, :3], axis=1).max()
+        inside = camera.spheres_in_frustum(centers @ camera.view_matrix, radii)
+        inside[inside] = camera.projected_radii(centers[inside], radii[inside]) >= MIN_CHUNK_PIXELS
+        candidates = np.flatnonzero(inside)
+        distances = np.linalg.norm(centers[candidates, :3] - camera.position[:3], axis=1) - radii[candidates]
+        chunks, loads, full = [], 0, False
+        self.complete = True
+        for chunk in candidates[np.argsort(distances)].tolist():
+            if chunk not in self.resident:
+                if full:
+                    continue
+                if self.loads_per_frame is not None and loads >= self.loads_per_frame:
+                    self.complete = False
+                    continue
+                obj = self.page_in(chunk)
+                size = object_bytes(obj)
+                loads += 1
+                if not self.make_room(size, len(chunks)):
+                    #Nothing else fits this frame, the chunks already in memory are still drawn
+                    full = True
+                    continue
+                self.resident[chunk] = (obj, size)
+                self.resident_bytes += size
+            self.resident.move_to_end(chunk)
+            obj = self.resident[chunk][0]
+            self.place(obj)
+            chunks.append(obj)
+        profiler.count("chunks drawn", len(chunks))
+        profiler.count("chunks paged in", loads)
+        profiler.count("chunk memory MB", self.resident_bytes / 1e6)
+        return chunks
+
+    def screen_projection(self, render_mode="wireframe"):
+        """
+        Draw the chunks in view, see visible_chunks.
+
+        Args:
+        - render_mode (str): One of RENDER_MODES.
+
+        Returns:
+        - int: Number of triangles drawn.
+        """
+        with self.render.profiler.stage("cull"):
+            chunks = self.visible_chunks() if self.visible else []
+        return sum(draw_instances(self.render, [obj], render_mode) for obj in chunks)
+
+    def pick(self, origin, direction):
+        """
+        Closest face hit by a world space ray, among the chunks in memory (the ones drawn lately).
+
+        Args:
+        - origin, direction (numpy arrays): Start and direction of the ray (3 components).
+
+        Returns:
+        - tuple: (face index in the faces of all chunks, or -1 if the ray misses, distance along the ray
+          in units of direction).
+        """
+        # Chunks are tested in the order the ray enters their bounding spheres, in the space of the vertices
+        inverse = np.linalg.inv(self.transform)
+        local_origin = np.array([*origin[:3], 1.0]) @ inverse
+        local_origin = local_origin[:3] / local_origin[3]
+        local_direction = (np.array([*direction[:3], 0.0]) @ inverse)[:3]
+        length = np.linalg.norm(local_direction)
+        entries = []
+        for chunk in self.resident:
+            to_center = self.chunk_bounds[chunk, :3] - local_origin
+            along, radius = to_center @ local_direction / length, self.chunk_bounds[chunk, 3]
+            if to_center @ to_center - along ** 2 <= radius ** 2 and along + radius >= 0:
+                entries.append(((along - radius) / length, chunk))
+        best_face, best_t = -1, np.inf
+        for entry, chunk in sorted(entries):
+            if entry >= best_t:
+                break
+            obj, size = self.resident[chunk]
+            self.place(obj)
+            face, t = obj.pick(origin, direction)
+            # The hierarchy built on the first pick counts towards the memory of the chunk
+            grown = object_bytes(obj)
+            self.resident_bytes += grown - size
+            self.resident[chunk] = (obj, grown)
+            if face >= 0 and t < best_t:
+                best_face, best_t = int(face + self.chunk_face_offsets[chunk]), t
+        return best_face, best_t
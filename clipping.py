@@ -0,0 +1,288 @@
+"""
+Face classification against the view frustum and clipping against the near plane.
+
+Vertices are classified by an outcode: one bit per frustum plane they are outside of. A face whose
+vertices are all outside the same plane can never be seen and is culled (as are back faces); a face
+with some vertices behind the near plane is clipped, all other faces are drawn as they are (anything
+reaching past the screen edges is clipped by the drawing code itself).
+
+transform_vertices fuses the per-frame vertex work (model-view-projection product, outcodes, perspective
+divide and screen mapping) into one pass that writes into buffers owned by the caller, so drawing a mesh
+allocates nothing proportional to its size.
+
+Both per-frame kernels have a parallel variant that splits the work into chunks run on all cores (see
+parallel_chunks). The faces are classified in two passes there, counting the faces of every class per
+chunk and then writing them at the offsets of their chunk, so the output is the same as the serial one.
+"""
+
+import numba
+import numpy as np
+from numba import njit, prange
+
+NEAR, FAR, LEFT, RIGHT, BOTTOM, TOP = 1, 2, 4, 8, 16, 32
+# Batches with fewer vertices (faces for the face kernels) than this are processed on one core, starting
+# the threads costs more than it saves for them
+PARALLEL_MIN_VERTICES = 50000
+PARALLEL_MIN_FACES = 50000
+# Chunks per thread of the parallel kernels, a few per thread even out chunks that take longer
+CHUNKS_PER_THREAD = 4
+# Face classes of classify_faces
+CULLED, DRAWN, CLIPPED = 0, 1, 2
+
+def parallel_chunks(count, threshold, parallel=None):
+    """
+    Number of chunks to split a batch into for the parallel kernels.
+
+    Args:
+    - count (int): Vertices or faces in the batch.
+    - threshold (int): Smallest batch worth running in parallel.
+    - parallel (bool): Force the choice, None to decide by the size of the batch.
+
+    Returns:
+    - int: Chunk count, 0 to run the serial kernel.
+    """
+    threads = numba.get_num_threads()
+    if parallel is False or (parallel is None and (threads < 2 or count < threshold)):
+        return 0
+    return max(min(threads * CHUNKS_PER_THREAD, count), 1)
+
+@njit(fastmath=True, cache=True)
+def outcode(x, y, w, near, far):
+    #Outcode of a projected vertex before the perspective divide (w = view z)
+    code = 0
+    if w < near:
+        code |= NEAR
+    if w > far:
+        code |= FAR
+    if x < -w:
+        code |= LEFT
+    if x > w:
+        code |= RIGHT
+    if y < -w:
+        code |= BOTTOM
+    if y > w:
+        code |= TOP
+    return code
+
+@njit(fastmath=True, cache=True)
+def to_screen(x, y, z, w, half_width, half_height, xy, depth, i):
+    #Perspective divide and screen mapping of one vertex, vertices at w = 0 only belong to culled or clipped faces
+    if w == 0:
+        xy[i, 0] = xy[i, 1] = depth[i] = 0.0
+        return
+    xy[i, 0] = half_width * (x / w + 1.0)
+    xy[i, 1] = half_height * (1.0 - y / w)
+    depth[i] = z / w
+
+@njit(fastmath=True, cache=True)
+def transform_vertices(vertices, matrices, near, far, half_width, half_height, clip, codes, xy, depth):
+    """
+    Transform the vertices of every instance of a mesh to clip space, compute their outcodes and map
+    them to the screen, in a single pass writing into preallocated arrays.
+
+    Args:
+    - vertices (numpy array): (N, 4) float32 object space vertices.
+    - matrices (numpy array): (K, 4, 4) model-view-projection matrix of every instance (row vectors).
+    - near, far (float): Distances of the near and far planes.
+    - half_width, half_height (float): Half of the screen resolution.
+    - clip (numpy array): (K * N, 4) output, vertices before the perspective divide, instance after instance.
+    - codes (numpy array): (K * N,) uint8 output, outcodes of the vertices.
+    - xy (numpy array): (K * N, 2) output, screen coordinates.
+    - depth (numpy array): (K * N,) output, normalized depth.
+    """
+    for k in range(matrices.shape[0]):
+        transform_range(vertices, matrices, near, far, half_width, half_height, clip, codes, xy, depth,
+                        k, 0, vertices.shape[0])
+
+@njit(fastmath=True, cache=True)
+def transform_range(vertices, matrices, near, far, half_width, half_height, clip, codes, xy, depth, k, start, end):
+    #transform_vertices for the vertices start to end of instance k
+    n = vertices.shape[0]
+    m = matrices[k]
+    for i in range(start, end):
+        vx, vy, vz, vw = vertices[i, 0], vertices[i, 1], vertices[i, 2], vertices[i, 3]
+        x = vx * m[0, 0] + vy * m[1, 0] + vz * m[2, 0] + vw * m[3, 0]
+        y = vx * m[0, 1] + vy * m[1, 1] + vz * m[2, 1] + vw * m[3, 1]
+        z = vx * m[0, 2] + vy * m[1, 2] + vz * m[2, 2] + vw * m[3, 2]
+        w = vx * m[0, 3] + vy * m[1, 3] + vz * m[2, 3] + vw * m[3, 3]
+        j = k * n + i
+        clip[j, 0], clip[j, 1], clip[j, 2], clip[j, 3] = x, y, z, w
+        codes[j] = outcode(x, y, w, near, far)
+        to_screen(x, y, z, w, half_width, half_height, xy, depth, j)
+
+@njit(fastmath=True, cache=True, parallel=True)
+def transform_vertices_parallel(vertices, matrices, near, far, half_width, half_height, clip, codes, xy, depth, chunks):
+    #transform_vertices on all cores, every instance is split into about chunks / instances chunks
+    n, instances = vertices.shape[0], matrices.shape[0]
+    per_instance = max((chunks + instances - 1) // instances, 1)
+    size = (n + per_instance - 1) // per_instance
+    for c in prange(instances * per_instance):
+        k, part = c // per_instance, c % per_instance
+        transform_range(vertices, matrices, near, far, half_width, half_height, clip, codes, xy, depth,
+                        k, part * size, min((part + 1) * size, n))
+
+@njit(fastmath=True, cache=True)
+def clip_to_screen(clip, half_width, half_height):
+    """
+    Map vertices before the perspective divide to the screen.
+
+    Returns:
+    - tuple: ((N, 2) screen coordinates, (N,) normalized depth).
+    """
+    xy = np.empty((clip.shape[0], 2))
+    depth = np.empty(clip.shape[0])
+    for i in range(clip.shape[0]):
+        to_screen(clip[i, 0], clip[i, 1], clip[i, 2], clip[i, 3], half_width, half_height, xy, depth, i)
+    return xy, depth
+
+@njit(fastmath=True, cache=True)
+def classify_faces(codes, front, vertex_count, face_offsets, face_indices, drawn_faces, drawn_bases,
+                   clipped_faces, clipped_bases):
+    """
+    Classify every face of one or more instances of a mesh as culled, drawn as it is or clipped, writing
+    the faces drawn and the faces clipped to preallocated arrays.
+
+    Args:
+    - codes (numpy array): Vertex outcodes from transform_vertices, instance after instance (K * N).
+    - front (numpy array): Mask of faces turned towards the camera, instance after instance (K * F).
+    - vertex_count (int): Vertices per instance (N).
+    - face_offsets, face_indices (numpy arrays): The mesh faces.
+    - drawn_faces, drawn_bases (numpy arrays): (K * F,) outputs, mesh face and index of the first vertex
+      of its instance for every face drawn as it is.
+    - clipped_faces, clipped_bases (numpy arrays): (K * F,) outputs, the same for every face to clip.
+
+    Returns:
+    - tuple: (number of faces drawn as they are, number of faces to clip).
+    """
+    face_count = face_offsets.shape[0] - 1
+    n_drawn = n_clipped = 0
+    f = base = 0
+    for g in range(front.shape[0]):
+        if front[g]:
+            face_class = classify_face(codes, base, face_offsets, face_indices, f)
+            if face_class == CLIPPED:
+                clipped_faces[n_clipped], clipped_bases[n_clipped] = f, base
+                n_clipped += 1
+            elif face_class == DRAWN:
+                drawn_faces[n_drawn], drawn_bases[n_drawn] = f, base
+                n_drawn += 1
+        # Next face, of the next instance after the last one
+        f += 1
+        if f == face_count:
+            f, base = 0, base + vertex_count
+    return n_drawn, n_clipped
+
+@njit(fastmath=True, cache=True)
+def classify_face(codes, base, face_offsets, face_indices, f):
+    #Class (CULLED, DRAWN or CLIPPED) of a face turned towards the camera, base is the first vertex of its instance
+    all_out, any_out = 0xFF, 0
+    for k in range(face_offsets[f], face_offsets[f + 1]):
+        code = codes[base + face_indices[k]]
+        all_out &= code
+        any_out |= code
+    if all_out:
+        return CULLED
+    return CLIPPED if any_out & NEAR else DRAWN
+
+@njit(fastmath=True, cache=True, parallel=True)
+def classify_faces_parallel(codes, front, vertex_count, face_offsets, face_indices, drawn_faces, drawn_bases,
+                            clipped_faces, clipped_bases, classes, chunks):
+    """
+    classify_faces on all cores, with the same output.
+
+    Args:
+    - classes (numpy array): (K * F,) uint8 scratch array for the class of every face.
+    - chunks (int): Number of chunks the faces are split into.
+    - The other arguments and the result are those of classify_faces.
+    """
+    face_count = face_offsets.shape[0] - 1
+    total = front.shape[0]
+    size = (total + chunks - 1) // chunks
+    # Faces drawn and clipped per chunk, then the position of the first of them in the outputs
+    counts = np.zeros((chunks + 1, 2), dtype=np.int64)
+    for c in prange(chunks):
+        start, end = c * size, min((c + 1) * size, total)
+        f, base = start % max(face_count, 1), start // max(face_count, 1) * vertex_count
+        n_drawn = n_clipped = 0
+        for g in range(start, end):
+            face_class = classify_face(codes, base, face_offsets, face_indices, f) if front[g] else CULLED
+            classes[g] = face_class
+            n_drawn += face_class == DRAWN
+            n_clipped += face_class == CLIPPED
+            f += 1
+            if f == face_count:
+                f, base = 0, base + vertex_count
+        counts[c + 1, 0], counts[c + 1, 1] = n_drawn, n_clipped
+    for c in range(1, chunks + 1):
+        counts[c] += counts[c - 1]
+    for c in prange(chunks):
+        start, end = c * size, min((c + 1) * size, total)
+        f, base = start % max(face_count, 1), start // max(face_count, 1) * vertex_count
+        n_drawn, n_clipped = counts[c, 0], counts[c, 1]
+        for g in range(start, end):
+            if classes[g] == CLIPPED:
+                clipped_faces[n_clipped], clipped_bases[n_clipped] = f, base
+                n_clipped += 1
+            elif classes[g] == DRAWN:
+                drawn_faces[n_drawn], drawn_bases[n_drawn] = f, base
+                n_drawn += 1
+            f += 1
+            if f == face_count:
+                f, base = 0, base + vertex_count
+    return counts[chunks, 0], counts[chunks, 1]
+
+@njit(fastmath=True, cache=True)
+def clip_near(clip, faces, bases, face_offsets, face_indices, near):
+    """
+    Clip faces against the near plane (w = view z = near).
+
+    Clipping happens in clip space, which is a linear transformation of camera space, so the new
+    vertices are interpolated exactly as they would be before the projection. The clipped polygons
+    only index into the returned vertices, which hold copies of the vertices kept as well.
+
+    Args:
+    - clip (numpy array): (N, 4) projected vertices before the perspective divide.
+    - faces (numpy array): Indices of the faces to clip.
+    - bases (numpy array): Index of the first vertex of the instance every face belongs to.
+    - face_offsets, face_indices (numpy arrays): The mesh faces.
+    - near (float): Distance of the near plane.
+
+    Returns:
+    - tuple: (new_vertices, clip_offsets, clip_indices, clip_sources), clip_sources holds the position
+      in faces of the source of every clipped polygon.
+    """
+    total = 0
+    for f in faces:
+        total += face_offsets[f + 1] - face_offsets[f]
+    new_vertices = np.empty((2 * total, 4), dtype=clip.dtype)
+    clip_offsets = np.zeros(faces.shape[0] + 1, dtype=np.int64)
+    clip_indices = np.empty(2 * total, dtype=np.int64)
+    clip_sources = np.empty(faces.shape[0], dtype=np.int64)
+    n_new = n_idx = n_faces = 0
+    for i in range(faces.shape[0]):
+        f, base = faces[i], bases[i]
+        start, end = face_offsets[f], face_offsets[f + 1]
+        first, first_new = n_idx, n_new
+        for k in range(start, end):
+            a = base + face_indices[k]
+            b = base + (face_indices[k + 1] if k + 1 < end else face_indices[start])
+            a_in, b_in = clip[a, 3] >= near, clip[b, 3] >= near
+            if a_in:
+                new_vertices[n_new] = clip[a]
+                clip_indices[n_idx] = n_new
+                n_new += 1
+                n_idx += 1
+            if a_in != b_in:
+                t = (near - clip[a, 3]) / (clip[b, 3] - clip[a, 3])
+                for axis in range(4):
+                    new_vertices[n_new, axis] = clip[a, axis] + t * (clip[b, axis] - clip[a, axis])
+                clip_indices[n_idx] = n_new
+                n_new += 1
+                n_idx += 1
+        if n_idx - first >= 2:
+            clip_sources[n_faces] = i
+            n_faces += 1
+            clip_offsets[n_faces] = n_idx
+        else:
+            n_idx, n_new = first, first_new
+    return new_vertices[:n_new], clip_offsets[:n_faces + 1], clip_indices[:n_idx], clip_sources[:n_faces]
@@ -0,0 +1,91 @@
+"""
+Frame-budget governor: trades detail for frame rate while the view is moving.
+
+The renderer tells the governor what the view of every frame depends on and how long the frame took.
+While moving frames take longer than the frame budget (1 / FPS), the quality steps down QUALITY_LEVELS
+one level at a time: fewer faces, then a lower render resolution, then bounding boxes instead of the
+meshes. Once moving frames are well within the budget it steps back up. A view that has not changed for
+STILL_SECONDS is drawn at full detail, so the picture sharpens as soon as the user stops moving, and the
+level reached is kept for the next movement.
+"""
+
+import time
+
+# Settings of the quality levels from full detail down: (draw every n-th face, scale of the render
+# resolution, draw bounding boxes instead of the meshes)
+QUALITY_LEVELS = ((1, 1.0, False), (2, 1.0, False), (4, 1.0, False), (4, 0.5, False), (1, 1.0, True))
+# Frames taking longer than the budget times this step the quality down
+DEGRADE_OVER = 1.1
+# Frames taking less than the budget times this step the quality up
+RESTORE_UNDER = 0.5
+# Consecutive frames over (or under) the budget before the level changes
+LEVEL_FRAMES = 3
+# Frames under the budget needed before a step up at most, the wait doubles every time a step up
+# is taken back right away so the quality does not flicker between two levels
+MAX_RESTORE_FRAMES = 96
+# Time without any change after which the view counts as still
+STILL_SECONDS = 0.15
+
+class FrameGovernor:
+    """
+    Picks the quality of every frame from the time the previous moving frames took.
+
+    Attributes:
+    - budget: Seconds a frame may take.
+    - enabled: Whether detail is reduced at all, otherwise every frame is drawn at full detail.
+    - level: Quality level of moving frames, an index into QUALITY_LEVELS.
+    - moving: Whether the view of the current frame changed within the last STILL_SECONDS.
+    - view_key: What the view of the previous frame depended on.
+    - changed_at: perf_counter time of the last change of the view.
+    - over, under: Consecutive moving frames over and under the budget.
+    - restore_frames: Frames under the budget needed before the next step up.
+    - raised: Whether the last level change was a step up.
+    """
+    def __init__(self, budget, enabled=True):
+        self.budget = budget
+        self.enabled = enabled
+        self.level = 0
+        self.moving = False
+        self.view_key = None
+        self.changed_at = 0.0
+        self.over = self.under = 0
+        self.restore_frames, self.raised = LEVEL_FRAMES, False
+
+    def begin_frame(self, view_key):
+        """
+        Start a frame.
+
+        Args:
+        - view_key (hashable): Everything the picture depends on besides the quality settings.
+
+        Returns:
+        - tuple: The settings to draw the frame with, one of QUALITY_LEVELS.
+        """
+        now = time.perf_counter()
+        if view_key != self.view_key:
+            self.view_key, self.changed_at = view_key, now
+        self.moving = now - self.changed_at < STILL_SECONDS
+        if not self.moving:
+            #The next movement may start from a different view, steps up get their first chance again
+            self.restore_frames = LEVEL_FRAMES
+        if not self.enabled or not self.moving:
+            return QUALITY_LEVELS[0]
+        return QUALITY_LEVELS[self.level]
+
+    def end_frame(self, seconds):
+        """
+        Close a frame. Moving frames over or under the budget change the level, still ones are ignored.
+
+        Args:
+        - seconds (float): Time the frame took, without waiting for the frame rate cap.
+        """
+        if not self.enabled or not self.moving:
+            return
+        self.over = self.over + 1 if seconds > self.budget * DEGRADE_OVER else 0
+        self.under = self.under + 1 if seconds < self.budget * RESTORE_UNDER else 0
+        if self.over >= LEVEL_FRAMES and self.level < len(QUALITY_LEVELS) - 1:
+            if self.raised:
+                self.restore_frames = min(self.restore_frames * 2, MAX_RESTORE_FRAMES)
+            self.level, self.over, self.raised = self.level + 1, 0, False
+        elif self.under >= self.restore_frames and self.level > 0:
+            self.level, self.under, self.raised = self.level - 1, 0, True
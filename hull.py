@@ -0,0 +1,199 @@
+"""
+Convex hulls of meshes as half-space arrays, for keeping the camera out of objects.
+
+A hull is a set of planes (a, b, c, d) with unit normals, a point p is inside when
+a * x + b * y + c * z + d <= 0 for every plane, the layout of scipy's ConvexHull.equations. The
+planes are those of a discrete oriented polytope: for each of HULL_DIRECTIONS the plane touching the
+mesh from outside. That is the convex hull cut to a fixed number of faces, never smaller than the true
+hull and exact along the 26 directions, built in one pass over the vertices.
+
+A single hull around a whole model (a tree, a room) blocks a lot of empty space, so every mesh also
+gets hulls of its parts: the subtrees of its bounding volume hierarchy down to HULL_PART_DEPTH. The
+whole hull is only used to find the objects a camera movement may reach before testing their parts.
+
+Segments are tested with the Cyrus-Beck algorithm, vectorized over any number of hulls at once.
+"""
+
+import itertools
+import numpy as np
+from numba import njit
+
+# Half-space normals of every hull: the coordinate axes and the diagonals of the faces and corners of a cube
+HULL_DIRECTIONS = np.array([d for d in itertools.product((-1, 0, 1), repeat=3) if any(d)], dtype=np.float64)
+HULL_DIRECTIONS /= np.linalg.norm(HULL_DIRECTIONS, axis=1).reshape(-1, 1)
+# Depth of the hierarchy nodes that get their own hull, up to 2 ** HULL_PART_DEPTH parts
+HULL_PART_DEPTH = 3
+# Names of the arrays in a mesh dict, stored as "hull_<name>"
+HULL_ARRAYS = ("equations", "parts")
+
+@njit(cache=True)
+def part_extents(vertices, face_offsets, face_indices, order, starts, ends, directions):
+    """
+    Farthest reach of groups of faces along every direction.
+
+    Args:
+    - vertices (numpy array): (N, 4) vertices.
+    - face_offsets, face_indices (numpy arrays): The mesh faces.
+    - order (numpy array): Face order, part p covers the faces order[starts[p]:ends[p]].
+    - starts, ends (numpy arrays): (P,) ranges of the parts in order.
+    - directions (numpy array): (K, 3) unit directions.
+
+    Returns:
+    - numpy array: (P, K) largest dot product of a part vertex with every direction, -inf for parts
+      without polygons (lines and points do not block anything).
+    """
+    extents = np.full((starts.shape[0], directions.shape[0]), -np.inf)
+    for p in range(starts.shape[0]):
+        for i in range(starts[p], ends[p]):
+            f = order[i]
+            if face_offsets[f + 1] - face_offsets[f] < 3:
+                continue
+            for k in range(face_offsets[f], face_offsets[f + 1]):
+                v = face_indices[k]
+                for d in range(directions.shape[0]):
+                    reach = vertices[v, 0] * directions[d, 0] + vertices[v, 1] * directions[d, 1] + vertices[v, 2] * directions[d, 2]
+                    if reach > extents[p, d]:
+                        extents[p, d] = reach
+    return extents
+
+def part_ranges(bvh, depth):
+    """
+    Face ranges of the subtrees of a hierarchy at a given depth, leaves above it are parts of their own.
+
+    Args:
+    - bvh (BVH): The hierarchy.
+    - depth (int): Depth of the nodes that become parts.
+
+    Returns:
+    - tuple: ((P,) starts, (P,) ends) in bvh.faces.
+    """
+    nodes, level = [0], 0
+    while level < depth:
+        nodes = [child for node in nodes for child in
+                 ((node,) if bvh.nodes[node, 1] > 0 else (bvh.nodes[node, 0], bvh.nodes[node, 0] + 1))]
+        level += 1
+    starts, ends = [], []
+    for node in nodes:
+        #The faces of a subtree run from its leftmost leaf to the end of its rightmost one
+        first = last = node
+        while bvh.nodes[first, 1] == 0:
+            first = bvh.nodes[first, 0]
+        while bvh.nodes[last, 1] == 0:
+            last = bvh.nodes[last, 0] + 1
+        starts.append(bvh.nodes[first, 0])
+        ends.append(bvh.nodes[last, 0] + bvh.nodes[last, 1])
+    return np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64)
+
+def extents_to_equations(extents):
+    #Planes n.p - reach <= 0 from (..., K) extents
+    normals = np.broadcast_to(HULL_DIRECTIONS, extents.shape + (3,))
+    return np.concatenate([normals, -extents[..., None]], axis=-1)
+
+def transform_equations(equations, transform):
+    """
+    Move hull planes along with the vertices they were built from.
+
+    Args:
+    - equations (numpy array): (..., 4) planes of untransformed vertices.
+    - transform (numpy array): 4x4 model matrix (row vectors, vertices = vertices_untouched @ transform).
+
+    Returns:
+    - numpy array: (..., 4) planes of the transformed vertices, normals rescaled to unit length.
+    """
+    planes = equations @ np.linalg.inv(transform).T
+    return planes / np.linalg.norm(planes[..., :3], axis=-1, keepdims=True)
+
+def segment_entries(equations, start, end, radius=0.0):
+    """
+    Where segments enter convex hulls (Cyrus-Beck clipping), for any number of hulls at once.
+
+    Args:
+    - equations (numpy array): (..., K, 4) planes of the hulls.
+    - start, end (numpy arrays): End points of the segment (3 components).
+    - radius (float): Distance to keep from the hulls, every plane is pushed out by it.
+
+    Returns:
+    - tuple: ((...,) share of the segment before it enters every hull, inf if it misses it and 0 if it
+      starts inside of it; (...,) index of the plane it enters through, -1 if it starts inside or misses).
+    """
+    d0 = equations[..., :3] @ start + equations[..., 3] - radius
+    d1 = equations[..., :3] @ end + equations[..., 3] - radius
+    entering, exiting = (d0 > 0) & (d1 <= 0), (d0 <= 0) & (d1 > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = d0 / (d0 - d1)
+    t_in = np.where(entering, t, 0.0)
+    t_out = np.where(exiting, t, 1.0).min(axis=-1)
+    plane = t_in.argmax(axis=-1)
+    t_in = t_in.max(axis=-1)
+    missed = ((d0 > 0) & (d1 > 0)).any(axis=-1) | (t_in > t_out)
+    inside = ~entering.any(axis=-1) & ~missed
+    return np.where(missed, np.inf, t_in), np.where(missed | inside, -1, plane)
+
+class Hull:
+    """
+    Convex hull of a mesh and of its parts, in the space of the mesh vertices.
+
+    Attributes:
+    - equations: (K, 4) planes of the hull around the whole mesh, see the module docstring.
+    - parts: (P, K, 4) planes of the hulls of its parts, P is 0 for meshes without polygons.
+    """
+    def __init__(self, equations, parts):
+        self.equations = equations
+        self.parts = parts
+
+    @classmethod
+    def build(cls, vertices, face_offsets, face_indices, bvh=None):
+        """
+        Build the hulls of a mesh.
+
+        Args:
+        - vertices (numpy array): (N, 4) vertices.
+        - face_offsets, face_indices (numpy arrays): The mesh faces.
+        - bvh (BVH): Hierarchy of the faces that splits them into parts, None for a single part.
+
+        Returns:
+        - Hull: The new hulls.
+        """
+        face_count = len(face_offsets) - 1
+        if bvh is None or len(bvh.nodes) == 0:
+            order = np.arange(face_count, dtype=np.int32)
+            starts, ends = np.zeros(1, dtype=np.int64), np.full(1, face_count, dtype=np.int64)
+        else:
+            order = bvh.faces
+            starts, ends = part_ranges(bvh, HULL_PART_DEPTH)
+        extents = part_extents(vertices, face_offsets, face_indices, order, starts, ends, HULL_DIRECTIONS)
+        extents = extents[np.isfinite(extents).all(axis=1)]
+        parts = extents_to_equations(extents)
+        whole = extents.max(axis=0) if len(extents) else np.zeros(len(HULL_DIRECTIONS))
+        return cls(extents_to_equations(whole), parts)
+
+    def contains(self, point):
+        """
+        Whether a point is inside the hull of one of the parts.
+
+        Args:
+        - point (numpy array): Point in the space of the mesh vertices (3 or 4 components).
+
+        Returns:
+        - bool: True if it is inside.
+        """
+        distances = self.parts[..., :3] @ np.asarray(point)[:3] + self.parts[..., 3]
+        return bool((distances <= 0).all(axis=1).any())
+
+def pack_hull(hull):
+    #Arrays of the hulls named "hull_<name>", to store them along with the mesh
+    return {"hull_" + name: getattr(hull, name) for name in HULL_ARRAYS}
+
+def unpack_hull(mesh):
+    """
+    Remove the hull arrays from a mesh dict.
+
+    Args:
+    - mesh (dict): Mesh arrays, changed in place.
+
+    Returns:
+    - Hull or None: The hulls, None if the mesh has none.
+    """
+    if "hull_parts" not in mesh:
+        return None
+    return Hull(*(mesh.pop("hull_" + name) for name in HULL_ARRAYS))
@@ -0,0 +1,367 @@
+"""
+Mesh loading, in the calling process, in a background worker process or as a batch.
+
+load_mesh turns a model file into the mesh arrays Object3D.from_arrays takes (with its levels of
+detail packed in), converting, parsing, optimizing (see mesh_optimizer.py) and simplifying it or
+reading it from the mesh cache.
+.fbx and .3ds files are converted into a temporary directory and cached under the content hash of
+the source file like any parsed .obj, so a file is converted only once and nothing is written next to it.
+BackgroundLoader runs load_mesh in a separate process so the render loop keeps running: the worker
+reports its progress and finally sends the arrays back through a queue, and a load can be cancelled
+at any time by terminating the worker. Files too big to hold in memory are split into chunks that are
+drawn out of core instead (see load_chunked_mesh), those stay in the mesh cache and are memory-mapped.
+
+Usage: python loader.py [--workers N] [--obj] DIRECTORY...
+converts (and caches) every .fbx and .3ds file below the given directories ahead of time, with --obj
+also every .obj file.
+"""
+
+import os
+import sys
+import time
+import queue
+import argparse
+import tempfile
+import multiprocessing
+import concurrent.futures
+import numpy as np
+from mesh_cache import MeshCache
+from obj_parser import parse_obj
+from lod import build_lods, pack_lods
+from bvh import BVH, pack_bvh
+from hull import Hull, pack_hull
+from mesh_optimizer import optimize_mesh
+
+# Formats that are converted to .obj with Aspose before parsing
+CONVERTED_FORMATS = (".fbx", ".3ds")
+# Scale applied to converted meshes, .fbx files come out of the conversion a lot bigger than they should be
+CONVERSION_SCALES = {".fbx": 0.02}
+# Model files of this size or bigger are drawn out of core, chunk by chunk (see chunked_mesh.py)
+OUT_OF_CORE_BYTES = 512 << 20
+# Counts returned by mesh_optimizer.optimize_mesh, the rows of the (before, after) "optimize_counts" array of a mesh
+OPTIMIZE_COUNTS = ("vertices", "faces", "edges")
+
+def convert_to_obj(filename, directory):
+    """
+    Convert a .fbx or .3ds file to .obj.
+
+    Args:
+    - filename (str): Path to the source file.
+    - directory (str): Directory the .obj (and .mtl) file is written to.
+
+    Returns:
+    - str: Path to the .obj file.
+    """
+    # Aspose is heavy and only needed for these formats
+    import aspose.threed as a3d
+    scene = a3d.Scene.from_file(filename)
+    root, _ = os.path.splitext(os.path.basename(filename))
+    obj_filename = os.path.join(directory, root + ".obj")
+    scene.save(obj_filename)
+    return obj_filename
+
+def parse_model(filename, report, directory=None):
+    #Convert (if needed) and parse a model file, report is called with (stage, share done or None). With a
+    #directory the arrays are memory-mapped .npy files in it, see obj_parser.parse_obj
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in CONVERTED_FORMATS:
+        report("Converting", None)
+        with tempfile.TemporaryDirectory() as converted:
+            obj_filename = convert_to_obj(filename, converted)
+            report("Parsing", 0.0)
+            mesh = parse_obj(obj_filename, progress=lambda done: report("Parsing", done), directory=directory)
+        mesh["vertices"][:, :3] *= CONVERSION_SCALES.get(extension, 1.0)
+    else:
+        report("Parsing", 0.0)
+        mesh = parse_obj(filename, progress=lambda done: report("Parsing", done), directory=directory)
+    return mesh
+
+def optimize_summary(mesh):
+    """
+    Describe what mesh_optimizer.optimize_mesh did to a built mesh.
+
+    Args:
+    - mesh (dict): Mesh arrays as returned by build_mesh.
+
+    Returns:
+    - str: Counts before and after optimizing, None for meshes without them (chunked meshes).
+    """
+    counts = mesh.get("optimize_counts")
+    if counts is None:
+        return None
+    return ", ".join("%s %d -> %d" % (name, before, after) for name, (before, after) in zip(OPTIMIZE_COUNTS, counts))
+
+def build_mesh(filename, progress=None, lods=True):
+    """
+    Convert (if needed) and parse a model file, weld and reorder its vertices and list its edges (see
+    mesh_optimizer.optimize_mesh) and build its levels of detail, its bounding volume hierarchy and its
+    collision hulls, without the cache.
+
+    Args:
+    - filename (str): Path to a .obj, .fbx or .3ds file.
+    - progress (callable): Called with (stage, share done or None) as loading goes on.
+    - lods (bool): Whether to build the levels of detail, by far the slowest part for big meshes.
+
+    Returns:
+    - dict: Mesh arrays and material names, levels of detail packed in (see lod.pack_lods) and
+      the counts of optimize_mesh as "optimize_counts" (see optimize_summary).
+    """
+    report = progress or (lambda stage, done: None)
+    mesh = parse_model(filename, report)
+    report("Optimizing", None)
+    counts = optimize_mesh(mesh)
+    mesh["optimize_counts"] = np.array([counts[name] for name in OPTIMIZE_COUNTS], dtype=np.int64)
+    report("Optimized: " + optimize_summary(mesh), None)
+    if lods:
+        report("Simplifying", None)
+        mesh.update(pack_lods(build_lods(mesh["vertices"], mesh["face_offsets"], mesh["face_indices"],
+                                         mesh["face_materials"])))
+    # Drawing works on float32 vertices, stored as such they are memory-mapped from the cache without a copy
+    for name in mesh:
+        if name == "vertices" or name.endswith("_vertices"):
+            mesh[name] = mesh[name].astype(np.float32)
+    report("Indexing", None)
+    bvh = BVH.build(mesh["vertices"], mesh["face_offsets"], mesh["face_indices"])
+    mesh.update(pack_bvh(bvh))
+    mesh.update(pack_hull(Hull.build(mesh["vertices"], mesh["face_offsets"], mesh["face_indices"], bvh)))
+    return mesh
+
+def load_mesh(filename, mesh_cache, progress=None, lods=True):
+    """
+    Load the mesh arrays of a model file.
+    Uses the mesh from the mesh cache if the file was loaded before, otherwise builds it (see
+    build_mesh) and caches the result.
+
+    Args:
+    - filename (str): Path to a .obj, .fbx or .3ds file.
+    - mesh_cache (MeshCache): Cache of parsed meshes, None to always build the mesh.
+    - progress (callable): Called with (stage, share done or None) as loading goes on.
+    - lods (bool): Whether the mesh comes with levels of detail, meshes without are cached separately.
+
+    Returns:
+    - dict: Mesh arrays and material names, levels of detail packed in (see lod.pack_lods).
+    """
+    if mesh_cache is None:
+        return build_mesh(filename, progress, lods)
+    extra = "" if lods else "no-lods"
+    mesh = mesh_cache.load(filename, extra)
+    if mesh is None:
+        mesh = build_mesh(filename, progress, lods)
+        if progress is not None:
+            progress("Caching", None)
+        mesh_cache.store(filename, mesh, extra)
+    return mesh
+
+def out_of_core(filename):
+    #Whether a model file is big enough to be drawn out of core
+    return os.path.getsize(filename) >= OUT_OF_CORE_BYTES
+
+def load_chunked_mesh(filename, mesh_cache, progress=None):
+    """
+    Load a model file split into spatial chunks for drawing it out of core, see chunked_mesh.py.
+    Uses the chunks from the mesh cache if the file was chunked before, otherwise parses it into a scratch
+    directory next to the cache entries, builds the chunks there from the memory-mapped parsed arrays and
+    caches them. Neither levels of detail nor a bounding volume hierarchy are built, chunks get their own
+    hierarchy when they are first picked.
+
+    Args:
+    - filename (str): Path to a .obj, .fbx or .3ds file.
+    - mesh_cache (MeshCache): Cache of parsed meshes, None to build the chunks in memory.
+    - progress (callable): Called with (stage, share done or None) as loading goes on.
+
+    Returns:
+    - dict: Chunked mesh arrays, memory-mapped when they come from the cache (see chunked_mesh.build_chunks).
+    """
+    # The chunks come with the drawing code of chunked objects, which the other loads do without
+    from chunked_mesh import build_chunks
+    report = progress or (lambda stage, done: None)
+    if mesh_cache is None:
+        return build_chunks(parse_model(filename, report), progress=lambda done: report("Chunking", done))
+    mesh = mesh_cache.load(filename, "chunks")
+    if mesh is not None:
+        return mesh
+    # The chunks are as big as the mesh, they are built where the cache is rather than in a possibly
+    # memory-backed temporary directory. The parsed mesh goes there as well, so that neither it nor the
+    # chunks are ever all in memory
+    os.makedirs(mesh_cache.cache_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=mesh_cache.cache_dir) as directory:
+        parsed = os.path.join(directory, "parsed")
+        os.mkdir(parsed)
+        mesh = parse_model(filename, report, parsed)
+        chunked = build_chunks(mesh, directory, progress=lambda done: report("Chunking", done))
+        del mesh
+        report("Caching", None)
+        mesh_cache.store(filename, chunked, "chunks")
+        del chunked
+    return mesh_cache.load(filename, "chunks")
+
+def load_worker(filename, mesh_cache, messages, chunked=False):
+    #Entry point of the worker process, every message is a (kind, ...) tuple
+    try:
+        progress = lambda stage, done: messages.put(("progress", stage, done))
+        if chunked:
+            # Chunked meshes stay in the cache, the renderer memory-maps them from there
+            load_chunked_mesh(filename, mesh_cache, progress)
+            messages.put(("done", None))
+            return
+        mesh = load_mesh(filename, mesh_cache, progress)
+        # Memory-mapped arrays are sent as plain arrays
+        messages.put(("done", {name: np.asarray(value) if isinstance(value, np.ndarray) else value
+                               for name, value in mesh.items()}))
+    except Exception as error:
+        messages.put(("error", "%s: %s" % (type(error).__name__, error)))
+
+class BackgroundLoader:
+    """
+    Loads one model at a time in a worker process.
+
+    The worker is started with the "spawn" method, so it does not inherit the pygame/SDL state of the
+    window. Call poll() every frame: it returns the mesh arrays once the worker is done. Chunked meshes
+    are not sent back, the worker only builds them into the mesh cache and poll memory-maps them.
+
+    Attributes:
+    - mesh_cache: The MeshCache the worker reads and fills.
+    - filename: File being loaded, None when idle.
+    - stage: What the worker is doing ("Starting", "Converting", "Parsing", ...).
+    - progress: Share of the current stage done, None if the stage does not report it.
+    - error: Message of the last failed load, None if it succeeded.
+    """
+    def __init__(self, mesh_cache):
+        self.mesh_cache = mesh_cache
+        self.context = multiprocessing.get_context("spawn")
+        self.process = None
+        self.messages = None
+        self.filename = None
+        self.stage, self.progress, self.error = None, None, None
+
+    @property
+    def busy(self):
+        return self.process is not None
+
+    def start(self, filename, chunked=False):
+        """
+        Start loading a file, cancelling the load in flight, if any.
+
+        Args:
+        - filename (str): Path to a .obj, .fbx or .3ds file.
+        - chunked (bool): Whether to load it split into chunks, see load_chunked_mesh.
+        """
+        self.cancel()
+        self.messages = self.context.Queue()
+        self.process = self.context.Process(target=load_worker, args=(filename, self.mesh_cache, self.messages, chunked),
+                                            daemon=True)
+        self.process.start()
+        self.filename = filename
+        self.stage, self.progress, self.error = "Starting", None, None
+
+    def cancel(self):
+        #Stop the load in flight, its result is never delivered
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join()
+            self.messages.close()
+        self.process, self.messages, self.filename = None, None, None
+
+    def poll(self):
+        """
+        Handle the messages of the worker without waiting for any.
+
+        Returns:
+        - tuple or None: (filename, mesh arrays) when the load finished, otherwise None.
+        """
+        while self.process is not None:
+            try:
+                message = self.messages.get_nowait()
+            except queue.Empty:
+                if not self.process.is_alive() and self.process.exitcode != 0:
+                    self.error = "Worker stopped with exit code %s" % self.process.exitcode
+                    self.cancel()
+                return None
+            if message[0] == "progress":
+                self.stage, self.progress = message[1], message[2]
+                continue
+            filename = self.filename
+            self.process.join()
+            self.process, self.messages, self.filename = None, None, None
+            if message[0] == "error":
+                self.error = message[1]
+                return None
+            if message[1] is None:
+                return filename, load_chunked_mesh(filename, self.mesh_cache)
+            return filename, message[1]
+        return None
+
+def find_models(directories, extensions):
+    #Every file below the directories with one of the extensions, in a stable order
+    found = []
+    for directory in directories:
+        for root, _, files in os.walk(directory):
+            found.extend(os.path.join(root, name) for name in files if name.lower().endswith(extensions))
+    return sorted(found)
+
+def preconvert(directories, workers=None, extensions=CONVERTED_FORMATS, mesh_cache=None):
+    """
+    Convert and cache every model file below the given directories, in parallel.
+
+    Worker processes only build the meshes, this process stores them, so the cache index is never
+    written by two processes at once. Files big enough to be drawn out of core are chunked by this
+    process meanwhile, one at a time, and cached under the key the viewer looks them up with (see
+    load_chunked_mesh).
+
+    Args:
+    - directories (list): Directories to search.
+    - workers (int): Number of worker processes, the number of CPUs by default.
+    - extensions (tuple): File extensions to convert.
+    - mesh_cache (MeshCache): The cache to fill, the default one if None.
+
+    Returns:
+    - tuple: (number of files converted, number already cached, number that failed).
+    """
+    mesh_cache = mesh_cache or MeshCache()
+    files = find_models(directories, extensions)
+    chunked = [path for path in files if out_of_core(path)]
+    pending = [path for path in files if path not in chunked and mesh_cache.load(path) is None]
+    pending_chunked = [path for path in chunked if mesh_cache.load(path, "chunks") is None]
+    cached = len(files) - len(pending) - len(pending_chunked)
+    print("%d files found, %d already cached" % (len(files), cached))
+    converted = failed = 0
+    start = time.perf_counter()
+    total = len(pending) + len(pending_chunked)
+    with concurrent.futures.ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {pool.submit(build_mesh, path): path for path in pending}
+        # Chunking works from memory-mapped arrays and is never done by more than one process at a time
+        for done, path in enumerate(pending_chunked, 1):
+            try:
+                mesh = load_chunked_mesh(path, mesh_cache)
+            except Exception as error:
+                failed += 1
+                print("[%d/%d] %s failed: %s: %s" % (done, total, path, type(error).__name__, error))
+                continue
+            converted += 1
+            print("[%d/%d] %s: %d faces in %d chunks" % (done, total, path, len(mesh["face_materials"]),
+                                                         len(mesh["chunk_bounds"])))
+            del mesh
+        for done, future in enumerate(concurrent.futures.as_completed(futures), len(pending_chunked) + 1):
+            path = futures[future]
+            try:
+                mesh = future.result()
+            except Exception as error:
+                failed += 1
+                print("[%d/%d] %s failed: %s: %s" % (done, total, path, type(error).__name__, error))
+                continue
+            mesh_cache.store(path, mesh)
+            converted += 1
+            print("[%d/%d] %s: %d faces (%s)" % (done, total, path, len(mesh["face_materials"]),
+                                                 optimize_summary(mesh)))
+    print("Converted %d files in %.1fs, %d failed" % (converted, time.perf_counter() - start, failed))
+    return converted, cached, failed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert and cache model files ahead of time.")
+    parser.add_argument("directories", nargs="+")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--obj", action="store_true", help="also parse and cache .obj files")
+    args = parser.parse_args()
+    extensions = CONVERTED_FORMATS + ((".obj",) if args.obj else ())
+    _, _, failed = preconvert(args.directories, args.workers, extensions)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,275 @@
+"""
+Level-of-detail generation by quadric edge-collapse decimation.
+
+Every vertex carries a quadric: the sum of the squared distances to the planes of its triangles,
+weighted by their area. Collapsing an edge merges the quadrics of its two vertices and moves the kept
+vertex to the position with the least error. Borders and seams between materials get additional
+planes perpendicular to their faces so the outline of the mesh and of its color regions survives.
+
+The decimation works in passes: every pass prices all edges, then collapses the cheapest ones that
+share no vertex with each other, skipping collapses that would flip a triangle. A chain of levels is
+taken from one run, each with about LOD_RATIO of the triangles of the previous one.
+"""
+
+import numpy as np
+from numba import njit
+
+# Every level keeps about this share of the triangles of the previous one
+LOD_RATIO = 0.25
+LOD_LEVELS = 3
+# Meshes (and levels) smaller than this are not simplified any further
+LOD_MIN_FACES = 64
+# Weight of the border and material seam planes relative to the face planes
+SEAM_WEIGHT = 100.0
+# Selections per pass, collapses that turned a triangle around are banned before the next one
+FLIP_ROUNDS = 4
+# Names of the level arrays in a mesh dict, level n is stored as "lod<n>_<name>"
+LOD_ARRAYS = ("vertices", "face_offsets", "face_indices", "face_materials")
+
+def triangulate(face_offsets, face_indices, face_materials):
+    """
+    Split polygons into triangle fans.
+
+    Args:
+    - face_offsets, face_indices, face_materials (numpy arrays): The mesh faces.
+
+    Returns:
+    - tuple: ((T, 3) vertex indices, (T,) material index) of the triangles, faces with fewer than
+      three vertices are dropped.
+    """
+    counts = np.diff(face_offsets)
+    fans = np.maximum(counts - 2, 0)
+    faces = np.repeat(np.arange(len(counts)), fans)
+    # Position of every triangle within the fan of its face
+    k = np.arange(len(faces)) - np.repeat(np.cumsum(fans) - fans, fans)
+    starts = face_offsets[:-1][faces]
+    triangles = np.stack([face_indices[starts], face_indices[starts + k + 1], face_indices[starts + k + 2]], axis=1)
+    return triangles.astype(np.int64), face_materials[faces]
+
+def triangle_normals(positions, triangles):
+    #Unnormalized normals (twice the area) of the triangles
+    p0, p1, p2 = positions[triangles[:, 0]], positions[triangles[:, 1]], positions[triangles[:, 2]]
+    return np.cross(p1 - p0, p2 - p0)
+
+def plane_quadrics(normals, points, weights):
+    #Quadric of the plane through every point with the given normal, scaled by its weight
+    lengths = np.linalg.norm(normals, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        unit = np.where(lengths.reshape(-1, 1) > 0, normals / lengths.reshape(-1, 1), 0.0)
+    planes = np.concatenate([unit, -np.einsum('ij,ij->i', unit, points).reshape(-1, 1)], axis=1)
+    return weights.reshape(-1, 1, 1) * planes[:, :, None] * planes[:, None, :]
+
+def vertex_quadrics(positions, triangles, materials):
+    """
+    Initial quadric of every vertex.
+
+    Args:
+    - positions (numpy array): (N, 3) vertex positions.
+    - triangles (numpy array): (T, 3) vertex indices.
+    - materials (numpy array): (T,) material index of every triangle.
+
+    Returns:
+    - numpy array: (N, 4, 4) quadrics.
+    """
+    quadrics = np.zeros((len(positions), 4, 4))
+    normals = triangle_normals(positions, triangles)
+    areas = np.linalg.norm(normals, axis=1) / 2
+    face_quadrics = plane_quadrics(normals, positions[triangles[:, 0]], areas)
+    for corner in range(3):
+        np.add.at(quadrics, triangles[:, corner], face_quadrics)
+
+    # Sides of triangles on a border (no neighbour) or on a seam (neighbour of another material)
+    a, b = triangles.reshape(-1), triangles[:, [1, 2, 0]].reshape(-1)
+    keys = np.minimum(a, b) * len(positions) + np.maximum(a, b)
+    side_materials = np.repeat(materials, 3)
+    order = np.argsort(keys, kind='stable')
+    starts = np.flatnonzero(np.r_[True, keys[order][1:] != keys[order][:-1]])
+    counts = np.diff(np.r_[starts, len(keys)])
+    uniform = np.minimum.reduceat(side_materials[order], starts) == np.maximum.reduceat(side_materials[order], starts)
+    seam = np.empty(len(keys), dtype=np.bool_)
+    seam[order] = np.repeat((counts == 1) | ~uniform, counts)
+    if seam.any():
+        sides = np.flatnonzero(seam)
+        edges = positions[b[sides]] - positions[a[sides]]
+        # Plane containing the side and perpendicular to its triangle
+        seam_normals = np.cross(edges, normals[sides // 3])
+        lengths = np.einsum('ij,ij->i', edges, edges)
+        seam_quadrics = plane_quadrics(seam_normals, positions[a[sides]], SEAM_WEIGHT * lengths)
+        np.add.at(quadrics, a[sides], seam_quadrics)
+        np.add.at(quadrics, b[sides], seam_quadrics)
+    return quadrics
+
+def quadric_error(quadrics, points):
+    #v^T Q v of homogeneous points (w = 1)
+    homogeneous = np.concatenate([points, np.ones((len(points), 1))], axis=1)
+    return np.einsum('ei,eij,ej->e', homogeneous, quadrics, homogeneous)
+
+def collapse_targets(positions, quadrics, edge_a, edge_b):
+    """
+    Best position and error for collapsing every edge.
+
+    The optimal position minimizes the merged quadric. It is ill defined on flat or straight parts,
+    so the midpoint and both endpoints are candidates too, and an optimum far away from the edge is rejected.
+
+    Returns:
+    - tuple: ((E, 3) positions, (E,) errors).
+    """
+    merged = quadrics[edge_a] + quadrics[edge_b]
+    pa, pb = positions[edge_a], positions[edge_b]
+    midpoint = (pa + pb) / 2
+    optimum = -np.einsum('eij,ej->ei', np.linalg.pinv(merged[:, :3, :3], rcond=1e-10, hermitian=True), merged[:, :3, 3])
+    far = np.linalg.norm(optimum - midpoint, axis=1) > np.linalg.norm(pb - pa, axis=1)
+    candidates = np.stack([optimum, midpoint, pa, pb])
+    errors = np.stack([quadric_error(merged, candidate) for candidate in candidates])
+    errors[0, far] = np.inf
+    best = np.argmin(errors, axis=0)
+    columns = np.arange(len(edge_a))
+    return candidates[best, columns], errors[best, columns]
+
+@njit(cache=True)
+def select_collapses(order, edge_a, edge_b, limit, vertex_count):
+    #Cheapest edges first, no two collapses may share a vertex within one pass
+    used = np.zeros(vertex_count, dtype=np.bool_)
+    chosen = np.empty(min(limit, order.shape[0]), dtype=np.int64)
+    n = 0
+    for e in order:
+        if n == chosen.shape[0]:
+            break
+        a, b = edge_a[e], edge_b[e]
+        if used[a] or used[b]:
+            continue
+        used[a] = used[b] = True
+        chosen[n] = e
+        n += 1
+    return chosen[:n]
+
+def apply_collapses(positions, triangles, kept, removed, kept_positions):
+    """
+    Move the kept vertex of every chosen edge to its target and merge the removed one into it.
+
+    Returns:
+    - tuple: (moved positions, remapped triangles, mask of the triangles that did not degenerate,
+      mask of the surviving triangles that were turned around).
+    """
+    remap = np.arange(len(positions))
+    remap[removed] = kept
+    moved = positions.copy()
+    moved[kept] = kept_positions
+    new_triangles = remap[triangles]
+    alive = (new_triangles[:, 0] != new_triangles[:, 1]) & (new_triangles[:, 1] != new_triangles[:, 2]) \
+        & (new_triangles[:, 2] != new_triangles[:, 0])
+    facing = np.einsum('ij,ij->i', triangle_normals(positions, triangles), triangle_normals(moved, new_triangles))
+    return moved, new_triangles, alive, alive & (facing < 0)
+
+def collapse_pass(positions, quadrics, triangles, materials, target):
+    """
+    Collapse up to enough edges to bring the mesh down to target triangles.
+
+    Returns:
+    - tuple: (positions, quadrics, triangles, materials) after the pass.
+    """
+    vertex_count = len(positions)
+    a, b = triangles.reshape(-1), triangles[:, [1, 2, 0]].reshape(-1)
+    keys = np.unique(np.minimum(a, b) * vertex_count + np.maximum(a, b))
+    edge_a, edge_b = keys // vertex_count, keys % vertex_count
+    targets, errors = collapse_targets(positions, quadrics, edge_a, edge_b)
+    # An interior collapse removes two triangles
+    limit = max((len(triangles) - target) // 2, 1)
+    order = np.argsort(errors, kind='stable')
+
+    # Collapses that turn a surviving triangle around are banned and the selection is repeated
+    banned = np.zeros(len(edge_a), dtype=np.bool_)
+    for _ in range(FLIP_ROUNDS):
+        chosen = select_collapses(order[~banned[order]], edge_a, edge_b, limit, vertex_count)
+        moved, new_triangles, alive, flipped = apply_collapses(positions, triangles, edge_a[chosen], edge_b[chosen], targets[chosen])
+        if not flipped.any():
+            break
+        touched = np.zeros(vertex_count, dtype=np.bool_)
+        touched[triangles[flipped].reshape(-1)] = True
+        banned[chosen[touched[edge_a[chosen]] | touched[edge_b[chosen]]]] = True
+    else:
+        chosen = chosen[~banned[chosen]]
+        moved, new_triangles, alive, _ = apply_collapses(positions, triangles, edge_a[chosen], edge_b[chosen], targets[chosen])
+
+    quadrics = quadrics.copy()
+    quadrics[edge_a[chosen]] += quadrics[edge_b[chosen]]
+    return moved, quadrics, new_triangles[alive], materials[alive]
+
+def compact(positions, triangles, materials):
+    """
+    Pack a decimated mesh into level arrays, dropping the vertices no triangle uses anymore.
+
+    Returns:
+    - dict: The LOD_ARRAYS of the level.
+    """
+    used, indices = np.unique(triangles, return_inverse=True)
+    return {
+        "vertices": np.concatenate([positions[used], np.ones((len(used), 1))], axis=1),
+        "face_offsets": np.arange(0, 3 * len(triangles) + 1, 3, dtype=np.int64),
+        "face_indices": indices.reshape(-1).astype(np.int32),
+        "face_materials": materials.astype(np.int32)
+    }
+
+def build_lods(vertices, face_offsets, face_indices, face_materials, levels=LOD_LEVELS, ratio=LOD_RATIO,
+               min_faces=LOD_MIN_FACES):
+    """
+    Build a chain of simplified versions of a mesh.
+
+    Args:
+    - vertices (numpy array): (N, 4) homogeneous vertices.
+    - face_offsets, face_indices, face_materials (numpy arrays): The mesh faces.
+    - levels (int): Maximum number of levels.
+    - ratio (float): Share of the triangles every level keeps of the previous one.
+    - min_faces (int): Levels are only built while the previous one has more triangles than this.
+
+    Returns:
+    - list: One dict of LOD_ARRAYS per level, from fine to coarse (level 1 first, level 0 is the mesh itself).
+    """
+    vertices = np.asarray(vertices, dtype=np.float64)
+    triangles, materials = triangulate(np.asarray(face_offsets), np.asarray(face_indices), np.asarray(face_materials))
+    if len(triangles) <= min_faces:
+        return []
+    positions = vertices[:, :3] / vertices[:, 3:]
+    quadrics = vertex_quadrics(positions, triangles, materials)
+    lods, previous = [], len(triangles)
+    while len(lods) < levels and previous > min_faces:
+        target = max(int(previous * ratio), min_faces)
+        while len(triangles) > target:
+            count = len(triangles)
+            positions, quadrics, triangles, materials = collapse_pass(positions, quadrics, triangles, materials, target)
+            if len(triangles) == count:
+                break
+        # A level that barely got smaller is not worth drawing instead of the previous one
+        if len(triangles) > (1 + ratio) / 2 * previous:
+            break
+        lods.append(compact(positions, triangles, materials))
+        previous = len(triangles)
+    return lods
+
+def pack_lods(lods):
+    """
+    Flatten levels into mesh arrays named "lod<n>_<name>", so they can be stored along with the mesh.
+
+    Args:
+    - lods (list): Levels as returned by build_lods.
+
+    Returns:
+    - dict: The level arrays.
+    """
+    return {"lod%d_%s" % (level, name): lod[name] for level, lod in enumerate(lods, 1) for name in LOD_ARRAYS}
+
+def unpack_lods(mesh):
+    """
+    Remove the level arrays from a mesh dict.
+
+    Args:
+    - mesh (dict): Mesh arrays, changed in place.
+
+    Returns:
+    - list: The levels, as returned by build_lods.
+    """
+    lods, level = [], 1
+    while "lod%d_vertices" % level in mesh:
+        lods.append({name: mesh.pop("lod%d_%s" % (level, name)) for name in LOD_ARRAYS})
+        level += 1
+    return lods
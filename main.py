@@ -1,12 +1,32 @@
 import pygame as pg
-from tkinter import Tk, filedialog
 import sys
 from object3d import *
+from scene import Scene
 from camera import *
 from matrix_functionality import *
 from round_button import *
+from mesh_cache import MeshCache
+from loader import load_mesh, load_chunked_mesh, out_of_core, optimize_summary, BackgroundLoader, CONVERTED_FORMATS
+from lod import unpack_lods
+from bvh import BVH, unpack_bvh
+from hull import unpack_hull
+from chunked_mesh import ChunkedObject
+from governor import FrameGovernor, QUALITY_LEVELS
+from rasterizer import new_depth_buffer, DEPTH_CLEAR
+from profiler import Profiler
+from ui_layer import UILayer
 import os
-import aspose.threed as a3d
+import time
+import numba
+
+# Update steps taken at most per frame, a longer stall is dropped instead of caught up with
+MAX_UPDATE_STEPS = 15
+# Files Renderer loads when it starts, relative to the directory of this script
+SKYBOX_FILE = "Skybox.jpg"
+START_OBJECT_FILE = os.path.join("res", "Tree.obj")
+STARTUP_ASSETS = (SKYBOX_FILE, START_OBJECT_FILE)
+# Distance between the left edges of the two columns of the help text
+HELP_COLUMN_WIDTH = 320
 
 class Renderer:
     """
@@ -24,11 +44,29 @@ class Renderer:
     - rotateX_checked, rotateY_checked, rotateZ_checked: Boolean flags for checkbox states.
     - openFile_button, resetObj_button, showHelp_button: Instances of RoundButton class.
     - font: Pygame font for text rendering.
+    - ui: Instance of the UILayer class, caches rendered text and collects the screen areas that changed.
     - script_dir: Script directory for locating resources
     - skybox_image: Background image.
     - camera: Instance of the Camera class for managing the viewpoint.
     - projection: Instance of the Projection class for handling projection.
-    - object: Instance of the Object3D class representing the 3D object to be displayed.
+    - scene: Instance of the Scene class holding every object that is drawn.
+    - object: Instance of the Object3D class representing the loaded 3D object, a member of the scene.
+    - axes: Instance of the Axes class, a (hidden by default) member of the scene.
+    - mesh_cache: Instance of the MeshCache class, keeps parsed meshes on disk between runs.
+    - loader: Instance of the BackgroundLoader class, loads files opened with the file dialog.
+    - load_summary: What optimizing the last loaded file did (see loader.optimize_summary), None if unknown.
+    - render_mode: How objects are drawn, one of Object3D.RENDER_MODES (toggled with F).
+    - depth_buffer: Per-pixel depth used by the filled render mode.
+    - profiler: Instance of the Profiler class, times the stages of every frame while its overlay is shown (P).
+    - overlay_font: Small Pygame font of the profiler overlay.
+    - trace_path: Path of the last trace file saved with T, None before the first one.
+    - picked: (object, face index, seconds the pick took) of the face last clicked, None if there is none.
+    - governor: Instance of the FrameGovernor class, lowers the detail of moving frames over the frame budget (G).
+    - face_stride, resolution_scale, proxy_boxes: Quality settings of the current frame, see governor.QUALITY_LEVELS.
+    - low_resolution: (surface, depth buffer, background) the scene is drawn to at a lower resolution, None until needed.
+    - update_time, update_lag: Time of the last update and simulated time owed since, see update.
+    - frame: (frame key, surface) of the last scene drawn completely, drawn again as long as the key stays the same.
+    - frame_reused: Whether the scene of the current frame was taken from frame instead of drawn.
     """
     def __init__(self):
         """
@@ -36,13 +74,15 @@ class Renderer:
 
         - Initializes Pygame and sets up screen properties.
         - Creates UI elements such as checkboxes, buttons, and initializes fonts.
-        - Calls create_objects to set up the 3D objects in the scene.
+        - Calls create_objects to set up the 3D objects in the scene, showing a loading screen meanwhile.
+        - Warms up the numba kernels, see warm_up.
         """
         pg.init()
         self.RES = self.WIDTH, self.HEIGHT = 900, 600
         self.H_WIDTH, self.H_HEIGHT = self.WIDTH // 2, self.HEIGHT // 2
         self.FPS = 60
         self.screen = pg.display.set_mode(self.RES)
+        pg.display.set_caption("3d Object Viewer")
         self.clock = pg.time.Clock()
         self.show_help, self.rotateX_checked, self.rotateY_checked, self.rotateZ_checked  = False, False, False, False
         
@@ -61,11 +101,74 @@ class Renderer:
 
         self.font = pg.font.Font(None, 30)
         self.text_color = (48, 35, 22)
+        self.ui = UILayer(self.screen, self.font)
         self.script_dir = os.path.dirname(__file__)
-        skybox_path = os.path.join(self.script_dir, "skybox.jpg")
+        skybox_path = os.path.join(self.script_dir, SKYBOX_FILE)
         self.skybox_image = pg.image.load(skybox_path)
         self.skybox_image = pg.transform.scale(self.skybox_image, (900, 600))
+        self.mesh_cache = MeshCache()
+        self.loader = BackgroundLoader(self.mesh_cache)
+        self.load_summary = None
+        self.render_mode = "wireframe"
+        self.depth_buffer = new_depth_buffer(self.WIDTH, self.HEIGHT)
+        self.profiler = Profiler()
+        self.overlay_font = pg.font.Font(None, 20)
+        self.trace_path = None
+        self.picked = None
+        self.governor = FrameGovernor(1 / self.FPS)
+        self.face_stride, self.resolution_scale, self.proxy_boxes = QUALITY_LEVELS[0]
+        self.low_resolution = None
+        self.update_time, self.update_lag = None, 0.0
+        self.frame, self.frame_reused = None, False
+        self.draw_startup("Loading...")
         self.create_objects()
+        self.warm_up()
+
+    def draw_startup(self, status):
+        """
+        Show the background and a status line while the application starts.
+
+        Args:
+        - status (str): Text to show.
+        """
+        self.screen.blit(self.skybox_image, (0, 0))
+        self.draw_text(status, self.text_color, (self.H_WIDTH - 50, self.H_HEIGHT))
+        pg.display.flip()
+
+    def warm_up(self):
+        """
+        Compile the numba kernels of the per-frame path before the first frame, or load them from numba's
+        on-disk cache. A small object with one triangle in front of the camera and one reaching behind it is
+        drawn in every render mode and picked, so neither the first frame, the first faces crossing the near plane
+        nor the first click hitch.
+        """
+        self.camera.update()
+        position, forward = self.camera.position[:3], self.camera.forward[:3]
+        right, up = self.camera.right[:3], self.camera.up[:3]
+        points = [position + 2 * forward - right, position + 2 * forward + right, position + 2 * forward + up,
+                  position - forward - right, position + 2 * forward + right, position + 2 * forward - up]
+        obj = Object3D(self, [(*point, 1) for point in points], [Face([0, 1, 2], 'm'), Face([3, 4, 5], 'm')],
+                       {'m': (255, 255, 255)})
+        obj.backface_culling = False
+        obj.bvh = BVH.build(obj.vertices_untouched, obj.face_offsets, obj.face_indices)
+        # The parallel kernels only run with more than one thread, big meshes would hitch on them otherwise
+        kernels = (False, True) if numba.get_num_threads() > 1 else (False,)
+        # Meshes from the mesh cache are memory-mapped read-only, numba compiles those separately
+        for writeable in (True, False):
+            for array in (obj.vertices_untouched, obj.face_offsets, obj.face_indices, obj.face_materials, obj.palette,
+                          obj.edges, obj.face_edges, obj.bvh.bounds, obj.bvh.nodes, obj.bvh.faces):
+                array.flags.writeable = writeable
+            for mode in Object3D.RENDER_MODES:
+                for parallel in kernels:
+                    draw_instances(self, [obj], mode, parallel)
+            obj.pick(self.camera.position, self.camera.forward)
+        # Hulls are only built at load or once for objects created in code, the collision test is plain numpy
+        obj.world_hull()
+        # Culling is off above so that every face is drawn, the back-face test is warmed up on its own
+        obj.backface_culling = True
+        for parallel in kernels:
+            obj.front_faces(self.camera.position, parallel)
+        self.depth_buffer.fill(DEPTH_CLEAR)
 
     def handle_button_click(self, button):
         """
@@ -102,54 +205,69 @@ class Renderer:
         """
         self.camera = Camera(self, [-1, 6, -30])
         self.projection = Projection(self)
-        obj_path = os.path.join(self.script_dir, 'res/Tree.obj')
-        self.object = self.get_object_from_file(obj_path)
+        self.scene = Scene(self)
+        self.axes = self.scene.add(Axes(self))
+        self.axes.scale(5)
+        self.axes.visible = False
+        self.object = None
+        obj_path = os.path.join(self.script_dir, START_OBJECT_FILE)
+        self.set_object(self.get_object_from_file(obj_path))
         self.object.translate([0, 0, 0])
+
+    def set_object(self, obj):
+        """
+        Make obj the loaded object, replacing the previous one in the scene.
+
+        Args:
+        - obj (Object3D): The new object.
+        """
+        self.scene.replace(self.object, obj)
+        self.object = obj
+        self.picked = None
  
-    def get_object_from_file(self, filename):
+    def get_object_from_file(self, filename, lods=True):
         """
-        Load a 3D object from a file. Reads the .obj (and .mtl, if exists) file.
+        Load a 3D object from a file, blocking until it is loaded. See loader.load_mesh, files of
+        loader.OUT_OF_CORE_BYTES or more are loaded in chunks with loader.load_chunked_mesh instead.
 
         Args:
         - filename (str): Path to the .obj file.
+        - lods (bool): Whether to load the object with its levels of detail.
 
         Returns:
         - Object3D: Instance of the Object3D class representing the loaded 3D object.
         """
-        vertices, faces_inst, materials = [], [], {}
-        root, _ = os.path.splitext(filename)
-        mtl_filename = root + ".mtl"
-        current_material = None
-        if os.path.exists(mtl_filename):
-            with open(mtl_filename) as mtl_file:
-                for line in mtl_file:
-                    if line.startswith('newmtl'):
-                        current_material = line.split()[1]
-                        materials[current_material] = pg.Color('black')  # Default color, used if the material has no Kd line
-                    elif line.startswith('Kd'):
-                        rgb_values = [float(value) * 255 for value in line.split()[1:]]
-                        materials[current_material] = rgb_values
-        else: 
-            #In case there is no .mtl file, a default material is used since it is needed to create a Face instance
-            current_material_name = "default"
-            materials["default"] = [0,0,0]
-        with open(filename) as f:
-            for line in f:
-                if line.startswith('v '):
-                    vertices.append([float(i) for i in line.split()[1:]] + [1])
-                elif line.startswith('usemtl') and os.path.exists(mtl_filename):
-                    current_material_name = line.split()[1]
-                elif line.startswith('f'):
-                    faces_ = line.split()[1:]
-                    faces_inst.append(Face([int(face_.split('/')[0]) - 1 for face_ in faces_], current_material_name))
-        return Object3D(self, vertices, faces_inst, materials)
-    
+        if out_of_core(filename):
+            return self.object_from_mesh(load_chunked_mesh(filename, self.mesh_cache))
+        return self.object_from_mesh(load_mesh(filename, self.mesh_cache, lods=lods))
+
+    def object_from_mesh(self, mesh):
+        """
+        Create a 3D object from loaded mesh arrays.
+
+        Args:
+        - mesh (dict): Mesh arrays as returned by loader.load_mesh.
+
+        Returns:
+        - Object3D: The new object, with its levels of detail, or a ChunkedObject for chunked meshes.
+        """
+        if "chunk_bounds" in mesh:
+            return ChunkedObject(self, mesh)
+        mesh = dict(mesh)
+        mesh.pop("optimize_counts", None)
+        lods = unpack_lods(mesh)
+        bvh, hull = unpack_bvh(mesh), unpack_hull(mesh)
+        obj = Object3D.from_arrays(self, **mesh)
+        obj.set_lods(lods)
+        obj.bvh, obj.hull = bvh, hull
+        return obj
+
     def open_new_file(self):
         """
         Open a file dialog to load a new 3D object.
 
         - Supports .obj, .fbx, and .3ds file formats.
-        - Converts .fbx and .3ds files to .obj format using Aspose if needed.
+        - The file is loaded in the background (see finish_loading), a load already in flight is cancelled.
         """
         file_types = [
             ("OBJ Files", "*.obj"),
@@ -157,22 +275,49 @@ class Renderer:
             ("3DS Files", "*.3ds"),
             ("All Files", "*.*")
         ]
+        # Tk is only needed for the dialog, importing it is left until it is opened
+        from tkinter import filedialog
         file_path = filedialog.askopenfilename(filetypes=file_types)
-        if file_path and file_path.endswith(".obj"):
-            self.object = self.get_object_from_file(file_path)
-        #If it's a .fbx or .3ds file, it should first be converted to .obj
-        elif file_path and (file_path.endswith(".fbx") or file_path.endswith(".3ds")):
-            scene = a3d.Scene.from_file(file_path)
-            root, _ = os.path.splitext(file_path)
-            obj_filename = root + ".obj"
-            scene.save(obj_filename)
-            self.object = self.get_object_from_file(obj_filename)
-            if(file_path.endswith(".fbx")):
-                #.fbx objects get scaled up a lot after conversion, so we need to account for that and scale them down
-                self.object.scale(0.02)
-                self.object.vertices_untouched = self.object.vertices
+        if file_path and file_path.lower().endswith((".obj",) + CONVERTED_FORMATS):
+            self.load_summary = None
+            self.loader.start(file_path, out_of_core(file_path))
+
+    def finish_loading(self):
+        #Swap in the object loaded in the background, once it is ready
+        loaded = self.loader.poll()
+        if loaded is None:
+            return
+        file_path, mesh = loaded
+        if file_path.lower().endswith(".3ds"):
+            self.camera.reset_cam_position()
+        summary = optimize_summary(mesh)
+        self.load_summary = "Loaded %s: %s" % (os.path.basename(file_path), summary) if summary else None
+        self.set_object(self.object_from_mesh(mesh))
+
+    def draw_loading(self):
+        """
+        Draw the progress of the background load, or the error or the optimizing counts of the last one,
+        in the bottom left corner of the window.
+        """
+        x, y = self.openFile_button.rect.x, self.HEIGHT - 70
+        if self.loader.busy:
+            bar = pg.Rect(x, y, 300, 12)
+            self.ui.add_dirty(bar)
+            pg.draw.rect(self.screen, self.text_color, bar, 1)
+            if self.loader.progress is not None:
+                pg.draw.rect(self.screen, self.text_color, (bar.x, bar.y, round(bar.width * self.loader.progress), bar.height))
             else:
-                self.camera.reset_cam_position()
+                #Stages without progress get a sliding block
+                offset = pg.time.get_ticks() // 4 % (bar.width - 60)
+                pg.draw.rect(self.screen, self.text_color, (bar.x + offset, bar.y, 60, bar.height))
+            status = "Loading %s: %s" % (os.path.basename(self.loader.filename), self.loader.stage)
+            if self.loader.progress is not None:
+                status += " %d%%" % round(100 * self.loader.progress)
+            self.draw_text(status + " (Esc - cancel)", self.text_color, (x, y + 16))
+        elif self.loader.error:
+            self.draw_text("Loading failed: " + self.loader.error, self.text_color, (x, y + 16))
+        elif self.load_summary:
+            self.draw_text(self.load_summary, self.text_color, (x, y + 16))
 
     def draw_text(self, text, color, position):
         """
@@ -183,26 +328,137 @@ class Renderer:
         - color (tuple): RGB color tuple.
         - position (tuple): (x, y) position of the text on the screen.
         """
-        surface = self.font.render(text, True, color)
-        self.screen.blit(surface, position)
+        self.ui.text(text, color, position)
+
+    def update(self):
+        """
+        Move the camera and the loaded object by fixed UPDATE_STEP steps, as many as fit into the time
+        passed since the last call, so that they move at the same speed at any frame rate. The remaining
+        time is carried over to the next call, time beyond MAX_UPDATE_STEPS steps is dropped.
+        """
+        now = time.perf_counter()
+        if self.update_time is None:
+            self.update_time = now
+        self.update_lag = min(self.update_lag + now - self.update_time, MAX_UPDATE_STEPS * UPDATE_STEP)
+        self.update_time = now
+        while self.update_lag >= UPDATE_STEP:
+            self.update_lag -= UPDATE_STEP
+            self.camera.control()
+            self.object.update(self.rotateX_checked, self.rotateY_checked, self.rotateZ_checked, UPDATE_STEP)
+
+    def view_key(self):
+        #Everything the picture of the scene depends on besides the quality settings, see governor.py
+        return (self.camera.update(), self.render_mode, self.scene.use_lods, self.scene.version,
+                tuple((id(obj), obj.state_key) for obj in self.scene.objects))
+
+    def frame_key(self):
+        #Everything the pixels of the scene depend on, see draw
+        picked = self.picked[:2] if self.picked is not None else None
+        return (self.view_key(), self.face_stride, self.resolution_scale, self.proxy_boxes, picked, self.RES)
+
+    def idle(self):
+        """
+        Whether the next frame will look like the current one unless an event comes in: the scene was
+        reused, the governor has drawn the still view at full detail, nothing is loading (its progress bar
+        moves), the profiler overlay is hidden (its numbers change every frame), no rotation is ticked and
+        no camera control key is held (the update steps move them without any event).
+
+        Returns:
+        - bool: True if the main loop can wait for the next event instead of drawing.
+        """
+        rotating = self.rotateX_checked or self.rotateY_checked or self.rotateZ_checked
+        return (self.frame_reused and not self.governor.moving and not self.loader.busy
+                and not self.profiler.enabled and not rotating and not self.camera.controlled())
+
+    def set_target(self, screen, depth_buffer, skybox_image):
+        #Make the scene draw to another surface, the resolution attributes follow its size
+        self.screen, self.depth_buffer, self.skybox_image = screen, depth_buffer, skybox_image
+        self.RES = self.WIDTH, self.HEIGHT = screen.get_size()
+        self.H_WIDTH, self.H_HEIGHT = self.WIDTH // 2, self.HEIGHT // 2
+
+    def low_resolution_target(self, scale):
+        #Surface, depth buffer and background for drawing the scene at a fraction of the window size, made once per size
+        size = (max(round(self.WIDTH * scale), 2), max(round(self.HEIGHT * scale), 2))
+        if self.low_resolution is None or self.low_resolution[0].get_size() != size:
+            self.low_resolution = (pg.Surface(size), new_depth_buffer(*size), pg.transform.scale(self.skybox_image, size))
+        return self.low_resolution
 
     def draw(self):
         """
-        Draw the 3D scene and the loaded object on the screen.
+        Draw the 3D scene (the loaded object and every other scene member) on the screen.
+        With a resolution_scale below 1 the scene is drawn to a smaller surface that is scaled up to the
+        window, with proxy_boxes only the bounding boxes of the objects are drawn (see governor.py).
+        As long as nothing the scene depends on changed (see frame_key), the last frame is copied to the
+        screen instead. Frames with chunks still to be paged in are not kept, the next ones draw more of them.
         """
-        self.screen.blit(self.skybox_image, (0, 0))
-        self.object.draw(self.rotateX_checked, self.rotateY_checked, self.rotateZ_checked)
+        key = self.frame_key()
+        self.frame_reused = self.frame is not None and self.frame[0] == key
+        self.profiler.count("frame reused", self.frame_reused)
+        if self.frame_reused:
+            with self.profiler.stage("background"):
+                self.screen.blit(self.frame[1], (0, 0))
+            return
+        window_target = (self.screen, self.depth_buffer, self.skybox_image)
+        if self.resolution_scale < 1:
+            self.set_target(*self.low_resolution_target(self.resolution_scale))
+        with self.profiler.stage("background"):
+            self.screen.blit(self.skybox_image, (0, 0))
+            self.depth_buffer.fill(DEPTH_CLEAR)
+        if self.proxy_boxes:
+            self.scene.draw_boxes()
+        else:
+            self.scene.draw(self.render_mode)
+        if self.screen is not window_target[0]:
+            scaled = self.screen
+            self.set_target(*window_target)
+            with self.profiler.stage("raster"):
+                pg.transform.scale(scaled, self.RES, self.screen)
+            self.ui.add_dirty(self.screen.get_rect())
+        else:
+            self.ui.add_dirty(self.scene.drawn_rect)
+        with self.profiler.stage("raster"):
+            self.draw_picked()
+        if self.scene.complete:
+            #The surface of the previous frame is reused when the window size did not change
+            surface = self.frame[1] if self.frame is not None and self.frame[1].get_size() == self.RES else pg.Surface(self.RES)
+            surface.blit(self.screen, (0, 0))
+            self.frame = (key, surface)
+        else:
+            self.frame = None
+
+    def pick(self, position):
+        """
+        Select the face under a point of the screen, see Scene.pick.
+
+        Args:
+        - position (tuple): (x, y) screen position in pixels.
+        """
+        start = time.perf_counter()
+        obj, face = self.scene.pick(position)
+        self.picked = (obj, face, time.perf_counter() - start) if obj is not None else None
+
+    def draw_picked(self):
+        #Outline the picked face, unless part of it is behind the near plane
+        if self.picked is None:
+            return
+        obj, face = self.picked[:2]
+        if obj not in self.scene.objects or not obj.visible:
+            return
+        indices = obj.face_indices[obj.face_offsets[face]:obj.face_offsets[face + 1]]
+        clip = obj.vertices_untouched[indices].astype(np.float64) @ obj.transform @ self.camera.view_projection_matrix()
+        w = clip[:, 3]
+        if len(clip) < 2 or (w < self.camera.near_plane).any():
+            return
+        points = np.column_stack([self.H_WIDTH * (clip[:, 0] / w + 1), self.H_HEIGHT * (1 - clip[:, 1] / w)])
+        self.ui.add_dirty(pg.draw.lines(self.screen, (255, 220, 0), True, points.tolist(), 3))
 
     def draw_checkboxes(self):
         """
         Draw the checkboxes and a checkmark if a checkbox is checked
         """
-        self.rotateX_checkbox.draw()
-        self.rotateY_checkbox.draw()
-        self.rotateZ_checkbox.draw()
-
         for checkbox, checked in zip([self.rotateX_checkbox, self.rotateY_checkbox, self.rotateZ_checkbox], 
                                      [self.rotateX_checked, self.rotateY_checked, self.rotateZ_checked]):
+            self.ui.add(("checkbox", checkbox.state_key, checked), checkbox.draw())
             pg.draw.rect(self.screen, 'black', checkbox.rect, 2)
             if checked:
                 pg.draw.line(self.screen, 'black', (checkbox.rect.left + 5, checkbox.rect.centery),
@@ -210,70 +466,182 @@ class Renderer:
                 pg.draw.line(self.screen, 'black', (checkbox.rect.centerx - 5, checkbox.rect.bottom - 5),
                              (checkbox.rect.right - 5, checkbox.rect.top + 5), 2)
 
+    def draw_ui(self):
+        """
+        Draw the checkboxes, buttons, help text and informational text over the scene.
+        """
+        self.draw_text("Rotate (x) ", (self.text_color), (self.openFile_button.rect.x + 5, self.openFile_button.rect.y + 40))
+        self.draw_text("Rotate (y) ", (self.text_color), (self.openFile_button.rect.x + 5, self.openFile_button.rect.y + 70))
+        self.draw_text("Rotate (z)", (self.text_color), (self.openFile_button.rect.x + 5, self.openFile_button.rect.y + 100))
+        
+        self.draw_checkboxes()
+        #Drawing the help text if Help button is pressed, it makes way for the progress of a load
+        if self.show_help and not self.loader.busy:
+            lines = ["W - move forward", "A - move left", "S - move backward", 
+                     "D - move right", "Q - move up", "E - move down", "R - reset camera",
+                     "Arrow keys - rotate the camera", "F - toggle wireframe/filled",
+                     "B - toggle back-face culling", "X - show/hide world axes",
+                     "L - toggle levels of detail", "Esc - cancel loading a file",
+                     "P - show/hide the profiler", "T - save a trace of the frames",
+                     "Click - inspect a face", "C - toggle camera collisions",
+                     "G - toggle adaptive quality", "Help - hide this text"]
+            x, y = self.showHelp_button.rect.x, self.showHelp_button.rect.y + 40
+            self.draw_text("Controls:", (self.text_color), (x, y))
+            #Two columns under the title, a single one would run past the bottom of the window
+            rows = (len(lines) + 1) // 2
+            for i, line in enumerate(lines):
+                self.draw_text(line, (self.text_color), (x + HELP_COLUMN_WIDTH * (i // rows), y + 20 * (1 + i % rows)))
+
+        for button in (self.openFile_button, self.resetObj_button, self.showHelp_button):
+            self.ui.add(("button", button.state_key), button.draw())
+        self.draw_loading()
+
+        #Drawing informational text
+        self.draw_text("Discovered material count: " + str(self.object.materials_count), 
+                       (self.text_color), 
+                       (self.openFile_button.rect.x + 560, self.openFile_button.rect.y + 5))
+        self.draw_text("Triangles drawn: " + str(self.scene.triangles_drawn), 
+                       (self.text_color), 
+                       (self.openFile_button.rect.x + 600, self.openFile_button.rect.y + 35))
+        if self.picked is not None:
+            obj, face, seconds = self.picked
+            #The numbers of the face and its vertices in the model file, the loaded mesh is reordered
+            source, indices = obj.source_face(face)
+            self.draw_text("Face %d: %s" % (source, obj.material_names[obj.face_materials[face]]),
+                           (self.text_color),
+                           (self.openFile_button.rect.x + 560, self.openFile_button.rect.y + 65))
+            self.draw_text("Vertices: %s (%.2f ms)" % (", ".join(map(str, indices)), seconds * 1000),
+                           (self.text_color),
+                           (self.openFile_button.rect.x + 560, self.openFile_button.rect.y + 95))
+        self.draw_text("FPS: " + str(round(self.clock.get_fps())), 
+                       (self.text_color), 
+                       (self.openFile_button.rect.x + 780, self.openFile_button.rect.y + 560))
+
+    def toggle_profiler(self):
+        #Show/hide the profiler overlay, timing only runs while it is shown
+        self.profiler.enabled = not self.profiler.enabled
+        if self.profiler.enabled:
+            self.profiler.reset()
+
+    def save_trace(self):
+        #Write the profiler history next to the working directory, see Profiler.export_trace
+        filename = time.strftime("trace_%Y%m%d_%H%M%S.json")
+        self.trace_path = self.profiler.export_trace(filename)
+
+    def draw_profiler_overlay(self):
+        """
+        Draw the profiler overlay above the FPS readout: mean and 95th percentile of every stage,
+        the frame counters and a histogram of the frame times.
+        """
+        stages = self.profiler.stage_summary()
+        counts = self.profiler.count_summary()
+        rows = [("stage", "mean ms", "p95 ms")]
+        rows += [(name, "%.2f" % mean, "%.2f" % p95) for name, (mean, p95) in stages.items()]
+        rows += [(name, "", str(round(value))) for name, value in counts.items()]
+        if self.trace_path:
+            rows.append((os.path.basename(self.trace_path), "", ""))
+        line_height, histogram_height, width = 15, 40, 250
+        height = len(rows) * line_height + histogram_height + 15
+        panel = pg.Surface((width, height), pg.SRCALPHA)
+        panel.fill((255, 255, 255, 190))
+        for i, row in enumerate(rows):
+            #Label on the left, numbers right-aligned in two columns
+            for text, right in zip(row, (None, 180, width - 5)):
+                if text:
+                    surface = self.overlay_font.render(text, True, self.text_color)
+                    x = 5 if right is None else right - surface.get_width()
+                    panel.blit(surface, (x, 5 + i * line_height))
+        bins, edges = self.profiler.frame_histogram()
+        if bins.max() > 0:
+            bar_width = (width - 10) / len(bins)
+            for i, count in enumerate(bins):
+                bar_height = round(histogram_height * count / bins.max())
+                pg.draw.rect(panel, self.text_color, (5 + i * bar_width, height - 5 - bar_height,
+                                                      max(bar_width - 1, 1), bar_height))
+            label = "%.1f - %.1f ms" % (edges[0], edges[-1])
+            panel.blit(self.overlay_font.render(label, True, self.text_color), (width - 95, height - histogram_height - 5))
+        self.ui.add_dirty(self.screen.blit(panel, (self.WIDTH - width - 10, self.HEIGHT - height - 45)))
+
     def run(self):
         """
         Main rendering loop for the application.
 
         - Continuously renders the scene and handles user input.
+        - Moves the camera and the object in fixed time steps, independent of the frame rate (see update).
+        - Lowers the detail of moving frames that take longer than the frame budget (see governor.py).
+        - Reuses the last frame while nothing changed and sleeps until the next event once idle (see idle).
         - Manages the display of checkboxes, buttons, and help text.
+        - Times every part of the frame with the profiler while its overlay is shown.
         """
         while True:
-            self.draw()
-            self.camera.control() #enabling camera controls
-            for event in pg.event.get():
-                if event.type == pg.QUIT:
-                    pg.quit()
-                    sys.exit()
-                elif event.type == pg.MOUSEBUTTONDOWN:
-                    for i, button in enumerate(self.buttons):
-                        if button.rect.collidepoint(event.pos):
+            frame_start = time.perf_counter()
+            with self.profiler.stage("loading"):
+                self.finish_loading()
+            with self.profiler.stage("input"):
+                for event in pg.event.get():
+                    if event.type == pg.QUIT:
+                        self.loader.cancel()
+                        pg.quit()
+                        sys.exit()
+                    elif event.type == pg.MOUSEBUTTONDOWN:
+                        clicked = [button for button in self.buttons if button.rect.collidepoint(event.pos)]
+                        for button in clicked:
                             self.handle_button_click(button)
-                elif event.type == pg.MOUSEMOTION:
-                    for i, button in enumerate(self.buttons):
-                        button.is_hovered = button.rect.collidepoint(event.pos)
-
-            # Drawing the checkboxes
-            self.rotateX_checkbox.draw()
-            self.rotateY_checkbox.draw()
-            self.rotateZ_checkbox.draw() 
-            pg.draw.rect(self.screen, 'black', self.rotateX_checkbox.rect, 2)
-            pg.draw.rect(self.screen, 'black', self.rotateY_checkbox.rect, 2)
-            pg.draw.rect(self.screen, 'black', self.rotateZ_checkbox.rect, 2)
-
-            self.draw_text("Rotate (x) ", (self.text_color), (self.openFile_button.rect.x + 5, self.openFile_button.rect.y + 40))
-            self.draw_text("Rotate (y) ", (self.text_color), (self.openFile_button.rect.x + 5, self.openFile_button.rect.y + 70))
-            self.draw_text("Rotate (z)", (self.text_color), (self.openFile_button.rect.x + 5, self.openFile_button.rect.y + 100))
-            
-            self.draw_checkboxes()
-            #Drawing the help text if Help button is pressed
-            if self.show_help:
-                lines = ["Controls:", "W - move forward", "A - move left", "S - move backward", 
-                         "D - move right", "Q - move up", "E - move down", "R - reset camera",
-                         "Arrow keys rotate the camera accordingly", "Hide this text by pressing the Help button",
-                         "If .fbx object is too small, open the created .obj"]
-                sk = 20
-                for line in lines:
-                    sk+=20
-                    self.draw_text(line, (self.text_color), (self.showHelp_button.rect.x, self.showHelp_button.rect.y+sk))
-
-            self.openFile_button.draw()
-            self.resetObj_button.draw()
-            self.showHelp_button.draw()
-
-            #Drawing informational text
-            self.draw_text("Discovered material count: " + str(self.object.materials_count), 
-                           (self.text_color), 
-                           (self.openFile_button.rect.x + 560, self.openFile_button.rect.y + 5))
-            self.draw_text("Polygon count: " + str(self.object.polygon_count), 
-                           (self.text_color), 
-                           (self.openFile_button.rect.x + 630, self.openFile_button.rect.y + 35))
-            self.draw_text("FPS: " + str(round(self.clock.get_fps())), 
-                           (self.text_color), 
-                           (self.openFile_button.rect.x + 780, self.openFile_button.rect.y + 560))
-            
-            pg.display.set_caption("3d Object Viewer")
-            pg.display.flip()
-            self.clock.tick(self.FPS)
+                        if not clicked and event.button == 1:
+                            self.pick(event.pos)
+                    elif event.type == pg.KEYDOWN and event.key == pg.K_f:
+                        modes = Object3D.RENDER_MODES
+                        self.render_mode = modes[(modes.index(self.render_mode) + 1) % len(modes)]
+                    elif event.type == pg.KEYDOWN and event.key == pg.K_b:
+                        self.object.backface_culling = not self.object.backface_culling
+                    elif event.type == pg.KEYDOWN and event.key == pg.K_x:
+                        self.axes.visible = not self.axes.visible
+                    elif event.type == pg.KEYDOWN and event.key == pg.K_c:
+                        self.camera.collisions = not self.camera.collisions
+                    elif event.type == pg.KEYDOWN and event.key == pg.K_g:
+                        self.governor.enabled = not self.governor.enabled
+                    elif event.type == pg.KEYDOWN and event.key == pg.K_l:
+                        self.scene.use_lods = not self.scene.use_lods
+                    elif event.type == pg.KEYDOWN and event.key == pg.K_p:
+                        self.toggle_profiler()
+                    elif event.type == pg.KEYDOWN and event.key == pg.K_t:
+                        self.save_trace()
+                    elif event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE:
+                        self.loader.cancel()
+                    elif event.type in (pg.VIDEOEXPOSE, pg.WINDOWEXPOSED):
+                        self.ui.full_redraw = True
+                    elif event.type == pg.MOUSEMOTION:
+                        for i, button in enumerate(self.buttons):
+                            button.is_hovered = button.rect.collidepoint(event.pos)
+
+            with self.profiler.stage("update"):
+                self.update() #camera controls and object movement
+                self.face_stride, self.resolution_scale, self.proxy_boxes = self.governor.begin_frame(self.view_key())
+            self.profiler.count("quality level", self.governor.level if self.governor.enabled and self.governor.moving else 0)
+            self.draw()
+
+            with self.profiler.stage("ui"):
+                self.draw_ui()
+                if self.profiler.enabled:
+                    self.draw_profiler_overlay()
+
+            # Only the areas that changed since the last frame are pushed to the window
+            with self.profiler.stage("flip"):
+                rects = self.ui.end_frame()
+                if rects is None:
+                    pg.display.flip()
+                else:
+                    pg.display.update(rects)
+            self.governor.end_frame(time.perf_counter() - frame_start)
+            self.profiler.end_frame()
+            # Waiting for the frame rate cap is counted in the next frame
+            with self.profiler.stage("wait"):
+                if self.idle():
+                    #Nothing moves until the next event, it is put back for the input handling of the next frame
+                    pg.event.post(pg.event.wait())
+                    #The time slept is not caught up with by the update steps, they start again from now
+                    self.update_time = time.perf_counter()
+                self.clock.tick(self.FPS)
 
 if __name__ == '__main__':
     app = Renderer()
@@ -0,0 +1,198 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import numpy as np
+
+# Arrays of a parsed mesh, every one of them is stored as its own .npy file so it can be memory-mapped
+MESH_ARRAYS = ("vertices", "face_offsets", "face_indices", "face_materials", "palette")
+CACHE_VERSION = 9
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "3dObjectViewer", "meshes")
+DEFAULT_MAX_BYTES = 1 << 30
+
+def file_hash(paths, extra="", chunk_size=1 << 20):
+    """
+    Hash the content of one or more files.
+
+    Args:
+    - paths (list): Files to hash, in order.
+    - extra (str): Additional key material mixed into the hash.
+    - chunk_size (int): Read size in bytes.
+
+    Returns:
+    - str: Hex digest of the combined content.
+    """
+    digest = hashlib.blake2b(extra.encode(), digest_size=16)
+    for path in paths:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class MeshCache:
+    """
+    Persistent on-disk cache of parsed meshes.
+
+    Every entry is a directory named after the content hash of the source files, holding one .npy
+    file per mesh array plus the material names. A repeat load memory-maps those files instead of
+    parsing text again. The index maps a source path to the mtime and size it had when it was hashed,
+    so an unchanged file is found without reading it; a touched but identical file is rehashed and
+    still hits. Entries are evicted least recently used first once the cache grows over max_bytes.
+
+    Attributes:
+    - cache_dir: Directory holding the entries and index.json.
+    - max_bytes: Size limit of all entries together.
+    - mmap: Whether loaded arrays are memory-mapped (read-only) instead of read into memory.
+    """
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES, mmap=True):
+        self.cache_dir = cache_dir or os.environ.get("OBJVIEWER_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes
+        self.mmap = mmap
+        self.index_path = os.path.join(self.cache_dir, "index.json")
+
+    def source_files(self, filename):
+        #The .obj file and its .mtl file (if it exists), both are part of the key
+        root, _ = os.path.splitext(filename)
+        mtl_filename = root + ".mtl"
+        return [filename, mtl_filename] if os.path.exists(mtl_filename) else [filename]
+
+    def source_stats(self, filename):
+        return [[os.path.abspath(path), os.stat(path).st_mtime_ns, os.stat(path).st_size]
+                for path in self.source_files(filename)]
+
+    def read_index(self):
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {"version": CACHE_VERSION, "sources": {}, "entries": {}}
+        if index.get("version") != CACHE_VERSION:
+            return {"version": CACHE_VERSION, "sources": {}, "entries": {}}
+        return index
+
+    def write_index(self, index):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.index_path + ".%d.tmp" % os.getpid()
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def key(self, filename, index, extra=""):
+        """
+        Find the content hash of a source file, rehashing only when its mtime or size changed.
+
+        Args:
+        - filename (str): Path to the .obj file.
+        - index (dict): The cache index, updated in place.
+        - extra (str): Additional key material (e.g. parser options).
+
+        Returns:
+        - str: Entry key.
+        """
+        source_key = os.path.abspath(filename) + extra
+        stats = self.source_stats(filename)
+        known = index["sources"].get(source_key)
+        if known and known["stats"] == stats:
+            return known["hash"]
+        content_hash = file_hash(self.source_files(filename), extra)
+        index["sources"][source_key] = {"stats": stats, "hash": content_hash}
+        return content_hash
+
+    def load(self, filename, extra=""):
+        """
+        Load a cached mesh.
+
+        Args:
+        - filename (str): Path to the .obj file.
+        - extra (str): Additional key material used when the mesh was stored.
+
+        Returns:
+        - dict or None: The mesh arrays, or None if the file is not cached.
+        """
+        index = self.read_index()
+        entry_key = self.key(filename, index, extra)
+        entry = index["entries"].get(entry_key)
+        entry_dir = os.path.join(self.cache_dir, entry_key)
+        mesh = None
+        if entry is not None:
+            try:
+                mesh = self.read_entry(entry_dir, entry)
+            except (OSError, ValueError):
+                index["entries"].pop(entry_key, None)
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            else:
+                entry["last_used"] = time.time()
+        self.write_index(index)
+        return mesh
+
+    def read_entry(self, entry_dir, entry):
+        mesh = {}
+        for name in entry["arrays"]:
+            mesh[name] = np.load(os.path.join(entry_dir, name + ".npy"), mmap_mode="r" if self.mmap else None)
+        with open(os.path.join(entry_dir, "materials.json")) as f:
+            mesh["material_names"] = json.load(f)
+        return mesh
+
+    def store(self, filename, mesh, extra=""):
+        """
+        Store a parsed mesh and evict old entries if the cache is over its size limit.
+
+        Args:
+        - filename (str): Path to the .obj file the mesh was parsed from.
+        - mesh (dict): Mesh arrays (see MESH_ARRAYS) plus material_names, extra arrays are stored too.
+        - extra (str): Additional key material.
+        """
+        index = self.read_index()
+        entry_key = self.key(filename, index, extra)
+        entry_dir = os.path.join(self.cache_dir, entry_key)
+        tmp_dir = entry_dir + ".%d.tmp" % os.getpid()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        arrays, size = [], 0
+        for name, value in mesh.items():
+            if isinstance(value, np.ndarray):
+                np.save(os.path.join(tmp_dir, name + ".npy"), np.ascontiguousarray(value))
+                arrays.append(name)
+                size += os.path.getsize(os.path.join(tmp_dir, name + ".npy"))
+        with open(os.path.join(tmp_dir, "materials.json"), "w") as f:
+            json.dump(list(mesh["material_names"]), f)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
+        index["entries"][entry_key] = {"arrays": arrays, "size": size, "last_used": time.time()}
+        self.evict(index, entry_key)
+        self.write_index(index)
+
+    def evict(self, index, keep=None):
+        #Drop least recently used entries until the cache fits into max_bytes, except keep (the entry just stored,
+        #a mesh drawn out of core may be bigger than the whole cache)
+        entries = index["entries"]
+        total = sum(entry["size"] for entry in entries.values())
+        for entry_key in sorted(entries, key=lambda k: entries[k]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if entry_key == keep:
+                continue
+            total -= entries.pop(entry_key)["size"]
+            shutil.rmtree(os.path.join(self.cache_dir, entry_key), ignore_errors=True)
+        live = set(entries)
+        index["sources"] = {k: v for k, v in index["sources"].items() if v["hash"] in live}
+
+    def clear(self):
+        #Remove every cached mesh
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def size(self):
+        return sum(entry["size"] for entry in self.read_index()["entries"].values())
+
+if __name__ == '__main__':
+    cache = MeshCache()
+    if "--clear" in sys.argv[1:]:
+        cache.clear()
+        print("Cleared", cache.cache_dir)
+    else:
+        print("Mesh cache:", cache.cache_dir)
+        print("Entries:", len(cache.read_index()["entries"]), "Size: %.1f MB" % (cache.size() / 1e6))
+        print("Usage: python mesh_cache.py [--clear]")
@@ -0,0 +1,173 @@
+"""
+Load-time optimization of parsed meshes: vertex welding, unique edges and a cache-friendly order.
+
+Exported .obj files often repeat vertices (a corner shared by faces of different groups is written
+once per group) and keep vertices no face uses. optimize_mesh welds vertices closer than WELD_TOLERANCE
+(relative to the size of the mesh) by snapping them to a grid of that spacing, drops the unused ones
+and the faces that collapse to less than a triangle, and renumbers the rest. Faces are then put in
+Morton order of their first corner and vertices in the order the faces first use them, so the per-face
+gathers of classification and rasterization read memory that is close together.
+
+build_edges lists every edge of a mesh once, with the edge of every polygon corner. The wireframe mode
+draws the edges of the faces in view from it, instead of the outline of every face, which drew every
+edge between two faces twice.
+"""
+
+import numpy as np
+from numba import njit
+
+# Vertices closer than this share of the longest side of the bounding box are welded into one
+WELD_TOLERANCE = 1e-6
+# Bits per axis of the Morton code faces are ordered by
+MORTON_BITS = 10
+
+def build_edges(face_offsets, face_indices):
+    """
+    List the edges of a mesh once each, whichever way round and by however many faces they are used.
+
+    Args:
+    - face_offsets, face_indices (numpy arrays): The mesh faces.
+
+    Returns:
+    - tuple: ((E, 2) int32 vertex indices of the edges, lower index first, (len(face_indices),) int32
+      edge from every polygon corner to the next corner of its face).
+    """
+    if len(face_indices) == 0:
+        return np.zeros((0, 2), dtype=np.int32), np.zeros(0, dtype=np.int32)
+    # The next corner of every corner, wrapping around to the first corner of its face
+    following = np.arange(1, len(face_indices) + 1)
+    following[face_offsets[1:] - 1] = face_offsets[:-1]
+    a, b = face_indices.astype(np.int64), face_indices[following].astype(np.int64)
+    vertex_count = int(face_indices.max()) + 1
+    keys = np.minimum(a, b) * vertex_count + np.maximum(a, b)
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    first = np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]
+    face_edges = np.empty(len(keys), dtype=np.int32)
+    face_edges[order] = np.cumsum(first) - 1
+    unique_keys = sorted_keys[first]
+    edges = np.column_stack([unique_keys // vertex_count, unique_keys % vertex_count]).astype(np.int32)
+    return edges, face_edges
+
+@njit(cache=True)
+def drop_repeated_corners(face_offsets, face_indices, sources):
+    #Remove corners repeating the previous one of their face, and faces of three or more corners left with less.
+    #sources holds a value per corner that is kept along with the corners
+    face_count = face_offsets.shape[0] - 1
+    offsets = np.empty(face_count + 1, dtype=np.int64)
+    indices = np.empty_like(face_indices)
+    kept_sources = np.empty_like(sources)
+    keep = np.zeros(face_count, dtype=np.bool_)
+    offsets[0] = 0
+    n = kept = 0
+    for f in range(face_count):
+        start = n
+        for k in range(face_offsets[f], face_offsets[f + 1]):
+            if n == start or indices[n - 1] != face_indices[k]:
+                indices[n] = face_indices[k]
+                kept_sources[n] = sources[k]
+                n += 1
+        while n - start > 1 and indices[n - 1] == indices[start]:
+            n -= 1
+        if n - start < 3 and face_offsets[f + 1] - face_offsets[f] >= 3:
+            n = start
+            continue
+        keep[f] = True
+        kept += 1
+        offsets[kept] = n
+    return offsets[:kept + 1], indices[:n], keep, kept_sources[:n]
+
+def weld_vertices(vertices, face_offsets, face_indices, tolerance=WELD_TOLERANCE):
+    """
+    Merge the vertices that fall into the same cell of a grid with a spacing of tolerance times the
+    longest side of the bounding box, and drop the vertices no face uses.
+
+    Args:
+    - vertices (numpy array): (N, 4) homogeneous vertices.
+    - face_offsets, face_indices (numpy arrays): The mesh faces.
+    - tolerance (float): Grid spacing relative to the size of the mesh, 0 welds exact duplicates only.
+
+    Returns:
+    - tuple: (vertices, face_offsets, face_indices, (F,) mask of the faces kept, old vertex index of
+      every corner kept). Welded vertices take the position of the first of them.
+    """
+    used = np.unique(face_indices)
+    if len(used) == 0:
+        return vertices[:0], face_offsets, face_indices, np.ones(len(face_offsets) - 1, dtype=np.bool_), face_indices
+    positions = vertices[used, :3].astype(np.float64)
+    low = positions.min(axis=0)
+    step = float((positions.max(axis=0) - low).max()) * tolerance
+    cells = np.round((positions - low) / step).astype(np.int64) if step > 0 else positions
+    _, first, inverse = np.unique(cells, axis=0, return_index=True, return_inverse=True)
+    remap = np.zeros(len(vertices), dtype=np.int32)
+    remap[used] = inverse.reshape(-1)
+    face_offsets, welded_indices, keep, sources = drop_repeated_corners(face_offsets, remap[face_indices], face_indices)
+    return vertices[used[first]], face_offsets, welded_indices, keep, sources
+
+def morton_codes(points, bits=MORTON_BITS):
+    #Z-order curve position of every point within the bounding box of all of them
+    low, high = points.min(axis=0), points.max(axis=0)
+    scale = np.where(high > low, ((1 << bits) - 1) / np.maximum(high - low, 1e-30), 0.0)
+    cells = ((points - low) * scale).astype(np.int64)
+    codes = np.zeros(len(points), dtype=np.int64)
+    for bit in range(bits):
+        for axis in range(3):
+            codes |= ((cells[:, axis] >> bit) & 1) << (3 * bit + axis)
+    return codes
+
+def reorder_faces(face_offsets, face_indices, order):
+    """
+    Put the faces of a mesh in another order.
+
+    Args:
+    - face_offsets, face_indices (numpy arrays): The mesh faces.
+    - order (numpy array): Old index of every new face.
+
+    Returns:
+    - tuple: (face_offsets, face_indices) of the reordered faces.
+    """
+    counts = np.diff(face_offsets)[order]
+    offsets = np.zeros(len(order) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    corners = np.repeat(face_offsets[:-1][order] - offsets[:-1], counts) + np.arange(offsets[-1])
+    return offsets, face_indices[corners]
+
+def optimize_mesh(mesh, tolerance=WELD_TOLERANCE):
+    """
+    Weld the vertices of a parsed mesh, drop unused vertices and collapsed faces, reorder both for
+    locality and add its edge list (see the module docstring).
+
+    Args:
+    - mesh (dict): Mesh arrays as returned by obj_parser.parse_obj, changed in place. "edges" and
+      "face_edges" are added, see build_edges, and "original_face" and "original_indices", the index of
+      every face and the vertex index of every corner in the parsed mesh (the model file).
+    - tolerance (float): See weld_vertices.
+
+    Returns:
+    - dict: (before, after) counts of "vertices", "faces" and "edges", edges before are the polygon
+      sides the wireframe mode used to draw.
+    """
+    vertices, face_offsets, face_indices = mesh["vertices"], mesh["face_offsets"], mesh["face_indices"]
+    stats = {"vertices": [len(vertices)], "faces": [len(face_offsets) - 1], "edges": [len(face_indices)]}
+    vertices, welded_offsets, face_indices, keep, original_indices = weld_vertices(vertices, face_offsets,
+                                                                                   face_indices, tolerance)
+    face_offsets, face_materials, original_face = welded_offsets, mesh["face_materials"][keep], np.flatnonzero(keep)
+    if len(face_indices):
+        order = np.argsort(morton_codes(vertices[face_indices[face_offsets[:-1]], :3]), kind="stable")
+        face_offsets, face_indices = reorder_faces(welded_offsets, face_indices, order)
+        _, original_indices = reorder_faces(welded_offsets, original_indices, order)
+        face_materials, original_face = face_materials[order], original_face[order]
+        # Vertices in the order of their first use, every vertex is used after welding
+        _, first_use = np.unique(face_indices, return_index=True)
+        vertex_order = np.argsort(first_use, kind="stable")
+        remap = np.empty(len(vertices), dtype=np.int32)
+        remap[vertex_order] = np.arange(len(vertices), dtype=np.int32)
+        vertices, face_indices = vertices[vertex_order], remap[face_indices]
+    edges, face_edges = build_edges(face_offsets, face_indices)
+    mesh.update(vertices=np.ascontiguousarray(vertices), face_offsets=face_offsets,
+                face_indices=np.ascontiguousarray(face_indices, dtype=np.int32), face_materials=face_materials,
+                edges=edges, face_edges=face_edges, original_face=original_face.astype(np.int32),
+                original_indices=np.ascontiguousarray(original_indices, dtype=np.int32))
+    for name, after in (("vertices", len(vertices)), ("faces", len(face_materials)), ("edges", len(edges))):
+        stats[name].append(after)
+    return {name: tuple(counts) for name, counts in stats.items()}
@@ -0,0 +1,418 @@
+"""
+Chunked .obj/.mtl parser.
+
+The file is read in large chunks that always end on a line break. Every chunk is scanned twice by
+numba kernels working on the raw bytes: the first pass counts the records so the output arrays can be
+allocated once, the second pass tokenizes the v/vt/vn/f records straight into them. No Python object
+is created per line or per face; only the (few) usemtl names are decoded in Python.
+Given a directory, parse_obj counts the records of the whole file first and tokenizes every chunk
+straight into memory-mapped .npy files, so files bigger than memory can be parsed (see
+loader.load_chunked_mesh).
+"""
+
+import os
+import re
+import numpy as np
+from numba import njit
+
+CHUNK_SIZE = 32 << 20
+# Faces given their material at once
+MATERIAL_BLOCK = 1 << 20
+
+# Record kinds returned by line_kind
+OTHER, VERTEX, TEXCOORD, NORMAL, FACE, USEMTL = 0, 1, 2, 3, 4, 5
+# Names of the face index kinds parse_records reports invalid indices of
+INDEX_NAMES = {VERTEX: "vertex", TEXCOORD: "texture coordinate", NORMAL: "normal"}
+# Records counted by count_records, in the order it returns their counts ("corner" for the face corners)
+RECORD_KINDS = ("v", "vt", "vn", "f", "corner", "usemtl")
+# Arrays parse_records writes: name -> (record kind, shape of a record, dtype). "face_offsets" gets the
+# size of every face, which parse_obj turns into the offset of its end
+ARRAY_LAYOUTS = {
+    "vertices": ("v", (4,), np.float64),
+    "texcoords": ("vt", (2,), np.float64),
+    "normals": ("vn", (3,), np.float64),
+    "face_offsets": ("f", (), np.int64),
+    "face_indices": ("corner", (), np.int32),
+    "face_texcoords": ("corner", (), np.int32),
+    "face_normals": ("corner", (), np.int32),
+}
+# Arrays parse_obj only returns with attributes
+ATTRIBUTE_ARRAYS = ("texcoords", "normals", "face_texcoords", "face_normals")
+
+@njit(cache=True)
+def is_space(c):
+    return c == 32 or c == 9 or c == 13
+
+@njit(cache=True)
+def line_kind(buf, i, n):
+    #Classify the line starting at i, returns the kind and the index right after the keyword
+    while i < n and is_space(buf[i]):
+        i += 1
+    if i + 1 < n and buf[i] == 118:  # 'v'
+        c = buf[i + 1]
+        if is_space(c):
+            return VERTEX, i + 1
+        if i + 2 < n and is_space(buf[i + 2]):
+            if c == 116:  # 't'
+                return TEXCOORD, i + 2
+            if c == 110:  # 'n'
+                return NORMAL, i + 2
+    elif i + 1 < n and buf[i] == 102 and is_space(buf[i + 1]):  # 'f'
+        return FACE, i + 1
+    elif i + 6 < n and buf[i] == 117 and buf[i + 1] == 115 and buf[i + 2] == 101 and buf[i + 3] == 109 \
+            and buf[i + 4] == 116 and buf[i + 5] == 108 and is_space(buf[i + 6]):  # 'usemtl'
+        return USEMTL, i + 6
+    return OTHER, i
+
+@njit(cache=True)
+def line_end(buf, i, n):
+    while i < n and buf[i] != 10:
+        i += 1
+    return i
+
+@njit(cache=True)
+def parse_float(buf, i, end):
+    #Parse a float starting at i (after optional blanks), returns the value and the index after it
+    while i < end and is_space(buf[i]):
+        i += 1
+    negative = False
+    if i < end and (buf[i] == 45 or buf[i] == 43):
+        negative = buf[i] == 45
+        i += 1
+    mantissa, exponent, digits = 0, 0, 0
+    while i < end and 48 <= buf[i] <= 57:
+        if digits < 18:
+            mantissa = mantissa * 10 + (buf[i] - 48)
+            digits += 1
+        else:
+            exponent += 1
+        i += 1
+    if i < end and buf[i] == 46:  # '.'
+        i += 1
+        while i < end and 48 <= buf[i] <= 57:
+            if digits < 18:
+                mantissa = mantissa * 10 + (buf[i] - 48)
+                digits += 1
+                exponent -= 1
+            i += 1
+    if i < end and (buf[i] == 101 or buf[i] == 69):  # 'e' / 'E'
+        i += 1
+        exp_negative = False
+        if i < end and (buf[i] == 45 or buf[i] == 43):
+            exp_negative = buf[i] == 45
+            i += 1
+        e = 0
+        while i < end and 48 <= buf[i] <= 57:
+            e = e * 10 + (buf[i] - 48)
+            i += 1
+        exponent += -e if exp_negative else e
+    value = mantissa * 10.0 ** exponent if exponent >= 0 else mantissa / 10.0 ** (-exponent)
+    return -value if negative else value, i
+
+@njit(cache=True)
+def parse_int(buf, i, end):
+    #Parse a (possibly negative) integer at i, returns the value and the index after it
+    negative = False
+    if i < end and (buf[i] == 45 or buf[i] == 43):
+        negative = buf[i] == 45
+        i += 1
+    value = 0
+    while i < end and 48 <= buf[i] <= 57:
+        value = value * 10 + (buf[i] - 48)
+        i += 1
+    return -value if negative else value, i
+
+@njit(cache=True)
+def resolve_index(index, count):
+    #.obj indices are 1-based, negative ones count back from the last record read so far. -1 for an index
+    #that is 0 or out of the records read so far
+    if 0 < index <= count:
+        return index - 1
+    if -count <= index < 0:
+        return count + index
+    return -1
+
+@njit(cache=True)
+def comment_start(buf, i, end):
+    #End of the records of a line, a '#' starts a comment running to the end of the line
+    while i < end and buf[i] != 35:
+        i += 1
+    return i
+
+@njit(cache=True)
+def is_index_end(buf, start, i, end):
+    #Whether parse_int read a whole index from start to i: some digits, followed by the end, a blank or '/'
+    return i > start and 48 <= buf[i - 1] <= 57 and (i >= end or is_space(buf[i]) or buf[i] == 47)
+
+@njit(cache=True)
+def count_records(buf):
+    """
+    First pass over a chunk: count the records so the output arrays can be allocated up front.
+
+    Returns:
+    - tuple: (vertices, texcoords, normals, faces, face corners, usemtl lines)
+    """
+    n = buf.shape[0]
+    n_v = n_vt = n_vn = n_f = n_idx = n_mtl = 0
+    i = 0
+    while i < n:
+        kind, j = line_kind(buf, i, n)
+        end = line_end(buf, j, n)
+        if kind == VERTEX:
+            n_v += 1
+        elif kind == TEXCOORD:
+            n_vt += 1
+        elif kind == NORMAL:
+            n_vn += 1
+        elif kind == USEMTL:
+            n_mtl += 1
+        elif kind == FACE:
+            n_f += 1
+            end = comment_start(buf, j, end)
+            in_token = False
+            for k in range(j, end):
+                blank = is_space(buf[k])
+                if not blank and not in_token:
+                    n_idx += 1
+                in_token = not blank
+        i = line_end(buf, end, n) + 1
+    return n_v, n_vt, n_vn, n_f, n_idx, n_mtl
+
+@njit(cache=True)
+def parse_records(buf, v_base, vt_base, vn_base, f_base, vertices, texcoords, normals,
+                  face_sizes, face_indices, face_texcoords, face_normals, mtl_lines, mtl_faces):
+    """
+    Second pass over a chunk: tokenize the records into the preallocated arrays.
+
+    Args:
+    - buf (numpy array): uint8 view of the chunk.
+    - v_base, vt_base, vn_base, f_base (int): Records read from the previous chunks, used to resolve
+      negative indices and to number the faces following a usemtl line.
+    - The remaining arguments are the output arrays sized by count_records.
+
+    Returns:
+    - tuple: (OTHER, 0) if every face index is valid, otherwise the kind of the records (VERTEX,
+      TEXCOORD or NORMAL) of the first index that is not a number, is 0 or refers past the records read
+      so far, and the position of that index in buf. Parsing stops there.
+    """
+    n = buf.shape[0]
+    n_v = n_vt = n_vn = n_f = n_idx = n_mtl = 0
+    i = 0
+    while i < n:
+        kind, j = line_kind(buf, i, n)
+        end = line_end(buf, j, n)
+        if kind == VERTEX:
+            for axis in range(3):
+                vertices[n_v, axis], j = parse_float(buf, j, end)
+            vertices[n_v, 3] = 1.0
+            n_v += 1
+        elif kind == TEXCOORD:
+            for axis in range(2):
+                texcoords[n_vt, axis], j = parse_float(buf, j, end)
+            n_vt += 1
+        elif kind == NORMAL:
+            for axis in range(3):
+                normals[n_vn, axis], j = parse_float(buf, j, end)
+            n_vn += 1
+        elif kind == USEMTL:
+            mtl_lines[n_mtl] = j
+            mtl_faces[n_mtl] = f_base + n_f
+            n_mtl += 1
+        elif kind == FACE:
+            end = comment_start(buf, j, end)
+            size = 0
+            while True:
+                while j < end and is_space(buf[j]):
+                    j += 1
+                if j >= end:
+                    break
+                start = j
+                index, j = parse_int(buf, j, end)
+                face_indices[n_idx] = resolve_index(index, v_base + n_v)
+                if face_indices[n_idx] < 0 or not is_index_end(buf, start, j, end):
+                    return VERTEX, start
+                face_texcoords[n_idx] = -1
+                face_normals[n_idx] = -1
+                if j < end and buf[j] == 47:  # '/'
+                    j += 1
+                    if j < end and buf[j] != 47 and not is_space(buf[j]):
+                        start = j
+                        index, j = parse_int(buf, j, end)
+                        face_texcoords[n_idx] = resolve_index(index, vt_base + n_vt)
+                        if face_texcoords[n_idx] < 0 or not is_index_end(buf, start, j, end):
+                            return TEXCOORD, start
+                    if j < end and buf[j] == 47:
+                        start = j + 1
+                        index, j = parse_int(buf, j + 1, end)
+                        face_normals[n_idx] = resolve_index(index, vn_base + n_vn)
+                        if face_normals[n_idx] < 0 or not is_index_end(buf, start, j, end):
+                            return NORMAL, start
+                n_idx += 1
+                size += 1
+            face_sizes[n_f] = size
+            n_f += 1
+        i = line_end(buf, end, n) + 1
+    return OTHER, 0
+
+def read_chunks(filename, chunk_size=CHUNK_SIZE):
+    #Yield the file in chunks that end on a line break
+    remainder = b""
+    with open(filename, "rb") as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            data = remainder + data
+            cut = data.rfind(b"\n") + 1
+            if cut == 0:
+                remainder = data
+                continue
+            remainder = data[cut:]
+            yield data[:cut]
+    if remainder:
+        yield remainder + b"\n"
+
+def parse_mtl(filename):
+    """
+    Read the diffuse colors of a .mtl file.
+
+    Args:
+    - filename (str): Path to the .mtl file.
+
+    Returns:
+    - dict: Material name -> RGB list in the 0-255 range, black if the material has no Kd line.
+    """
+    materials, current_material = {}, None
+    with open(filename, errors="replace") as mtl_file:
+        for line in mtl_file:
+            line = line.strip()
+            if line.startswith('newmtl'):
+                current_material = line.split(maxsplit=1)[1] if len(line.split()) > 1 else ''
+                materials[current_material] = [0, 0, 0]
+            elif line.startswith('Kd') and current_material is not None:
+                materials[current_material] = [float(value) * 255 for value in line.split()[1:4]]
+    return materials
+
+def build_palette(materials):
+    """
+    Turn a materials dictionary into a list of names and an RGB palette.
+
+    Args:
+    - materials (dict): Material name -> color (RGB list or pg.Color).
+
+    Returns:
+    - tuple: (material_names, palette) where palette is a (M, 3) uint8 numpy array.
+    """
+    material_names = list(materials) or ["default"]
+    palette = np.zeros((len(material_names), 3), dtype=np.uint8)
+    for i, name in enumerate(material_names):
+        color = materials.get(name, (0, 0, 0))
+        palette[i] = np.clip([round(float(c)) for c in tuple(color)[:3]], 0, 255)
+    return material_names, palette
+
+def new_array(directory, name, shape, dtype):
+    #An array written to <name>.npy in directory and memory-mapped, or a plain array without one
+    if directory is None:
+        return np.empty(shape, dtype=dtype)
+    return np.lib.format.open_memmap(os.path.join(directory, name + ".npy"), mode="w+", dtype=dtype, shape=shape)
+
+def parse_obj(filename, attributes=False, chunk_size=CHUNK_SIZE, progress=None, directory=None):
+    """
+    Parse a 3D object file. Reads the .obj (and .mtl, if exists) file.
+    A face index that is not a number, is 0 or refers past the records read so far raises a ValueError
+    naming its line, a '#' ends the indices of a face line.
+
+    Args:
+    - filename (str): Path to the .obj file.
+    - attributes (bool): Also return texture coordinates and normals with their per-corner indices.
+    - chunk_size (int): Number of bytes tokenized at once.
+    - progress (callable): Called with the share of the file parsed so far after every chunk.
+    - directory (str): Directory the arrays are written to as memory-mapped .npy files, None to return
+      them in memory. With a directory the file is read twice, a first pass counts the records of all of
+      it, and no more than a chunk is ever held in memory.
+
+    Returns:
+    - dict: Mesh arrays (vertices, face_offsets, face_indices, face_materials, palette) and material_names.
+      With attributes, also texcoords, normals, face_texcoords and face_normals (-1 where a corner has none).
+    """
+    root, _ = os.path.splitext(filename)
+    mtl_filename = root + ".mtl"
+    materials = parse_mtl(mtl_filename) if os.path.exists(mtl_filename) else {}
+    if not materials:
+        #In case there is no (or an empty) .mtl file, a default material is used for every face
+        materials["default"] = [0, 0, 0]
+    material_names, palette = build_palette(materials)
+    material_index = {name: i for i, name in enumerate(material_names)}
+    use_materials = os.path.exists(mtl_filename)
+
+    kept = ("vertices", "face_offsets", "face_indices") + (ATTRIBUTE_ARRAYS if attributes else ())
+    stored = None
+    if directory is not None:
+        totals = np.zeros(len(RECORD_KINDS), dtype=np.int64)
+        for chunk in read_chunks(filename, chunk_size):
+            totals += count_records(np.frombuffer(chunk, dtype=np.uint8))
+        # face_offsets starts with a 0, the chunks write the offsets of the ends of their faces after it
+        stored = {name: new_array(directory, name, (totals[RECORD_KINDS.index(kind)] + (name == "face_offsets"),
+                                                    *shape), dtype)
+                  for name, (kind, shape, dtype) in ARRAY_LAYOUTS.items() if name in kept}
+        stored["face_offsets"][0] = 0
+    parts = {name: [] for name in kept}
+    material_runs = [(0, 0)]
+    bases = np.zeros(len(RECORD_KINDS), dtype=np.int64)
+    file_size, parsed, line_base = max(os.path.getsize(filename), 1), 0, 0
+    for chunk in read_chunks(filename, chunk_size):
+        buf = np.frombuffer(chunk, dtype=np.uint8)
+        counts = count_records(buf)
+        arrays = {}
+        for name, (kind, shape, dtype) in ARRAY_LAYOUTS.items():
+            k = RECORD_KINDS.index(kind)
+            if stored is not None and name in stored:
+                start = bases[k] + (name == "face_offsets")
+                arrays[name] = stored[name][start:start + counts[k]]
+            else:
+                arrays[name] = np.empty((counts[k], *shape), dtype=dtype)
+        n_mtl = counts[RECORD_KINDS.index("usemtl")]
+        mtl_lines, mtl_faces = np.empty(n_mtl, dtype=np.int64), np.empty(n_mtl, dtype=np.int64)
+        v_base, vt_base, vn_base, f_base, idx_base, _ = bases
+        error, position = parse_records(buf, v_base, vt_base, vn_base, f_base, arrays["vertices"],
+                                        arrays["texcoords"], arrays["normals"], arrays["face_offsets"],
+                                        arrays["face_indices"], arrays["face_texcoords"], arrays["face_normals"],
+                                        mtl_lines, mtl_faces)
+        if error != OTHER:
+            token = re.match(rb"[^\s/]*", chunk[position:position + 64]).group().decode(errors="replace")
+            raise ValueError("%s, line %d: invalid %s index %r" % (
+                filename, line_base + chunk.count(b"\n", 0, position) + 1, INDEX_NAMES[error], token))
+        # The sizes of the faces become the offsets of their ends
+        ends = arrays["face_offsets"]
+        np.cumsum(ends, out=ends)
+        ends += idx_base
+        if use_materials:
+            for start, first_face in zip(mtl_lines, mtl_faces):
+                name = chunk[start:chunk.find(b"\n", start)].split()[:1]
+                name = name[0].decode(errors="replace") if name else ''
+                material_runs.append((int(first_face), material_index.get(name, 0)))
+        if stored is None:
+            for name in kept:
+                parts[name].append(arrays[name])
+        bases += counts
+        line_base += chunk.count(b"\n")
+        parsed += len(chunk)
+        if progress is not None:
+            progress(min(parsed / file_size, 1.0))
+
+    if stored is None:
+        stored = {name: np.concatenate([np.empty((0, *shape), dtype=dtype)] + parts[name])
+                  for name, (kind, shape, dtype) in ARRAY_LAYOUTS.items() if name in kept}
+        stored["face_offsets"] = np.r_[np.zeros(1, dtype=np.int64), stored["face_offsets"]]
+
+    # Every usemtl line starts a run of faces sharing one material, the faces are looked up in the runs a
+    # block at a time
+    face_count = int(bases[RECORD_KINDS.index("f")])
+    run_starts = np.array([start for start, _ in material_runs], dtype=np.int64)
+    run_materials = np.array([material for _, material in material_runs], dtype=np.int32)
+    face_materials = new_array(directory, "face_materials", (face_count,), np.int32)
+    for start in range(0, face_count, MATERIAL_BLOCK):
+        end = min(start + MATERIAL_BLOCK, face_count)
+        runs = np.searchsorted(run_starts, np.arange(start, end), side="right") - 1
+        face_materials[start:end] = run_materials[runs]
+    return dict(stored, face_materials=face_materials, material_names=material_names, palette=palette)
@@ -1,13 +1,308 @@
+import copy
 import pygame as pg
-from numba import njit
 from matrix_functionality import *
+from obj_parser import build_palette
+from rasterizer import fill_faces, normal_z_columns, shade_faces, release_pixels, collect_edges, draw_edges, draw_outlines
+from clipping import (transform_vertices, transform_vertices_parallel, clip_to_screen, classify_faces,
+                      classify_faces_parallel, clip_near, parallel_chunks, PARALLEL_MIN_VERTICES, PARALLEL_MIN_FACES)
+from numba import njit, prange
+from bvh import BVH
+from hull import Hull, transform_equations
+from mesh_optimizer import build_edges
 
-@njit(fastmath=True)
-#A Numba-optimized function to check if any element in the array equals 'a' or 'b'.
-def any_func(arr, a, b):
-    return np.any((arr == a) | (arr == b))
+# Levels of detail are picked so that every drawn face covers about this many pixels or more
+LOD_PIXELS_PER_FACE = 12
+# Seconds of simulated time per update step, see Renderer.update
+UPDATE_STEP = 1 / 60
+# Speed of the automatic rotation (the rotate checkboxes) in radians per second
+ROTATION_SPEED = 0.15
+
+def pack_faces(faces, material_names):
+    """
+    Pack a list of Face instances into flat arrays.
+
+    Args:
+    - faces (list): List of Face instances.
+    - material_names (list): Material names, the position of a name is its material index.
+
+    Returns:
+    - tuple: (face_offsets, face_indices, face_materials) numpy arrays.
+      The vertices of face i are face_indices[face_offsets[i]:face_offsets[i + 1]].
+    """
+    material_index = {name: i for i, name in enumerate(material_names)}
+    face_offsets = np.zeros(len(faces) + 1, dtype=np.int64)
+    face_offsets[1:] = np.cumsum([len(face.vertices) for face in faces])
+    face_indices = np.array([i for face in faces for i in face.vertices], dtype=np.int32)
+    face_materials = np.array([material_index.get(face.material_name, 0) for face in faces], dtype=np.int32)
+    return face_offsets, face_indices, face_materials
+
+@njit(fastmath=True, cache=True)
+def face_planes(vertices, face_offsets, face_indices):
+    """
+    Compute the plane of every face with Newell's method, which also works for non-planar polygons.
+
+    Args:
+    - vertices (numpy array): (N, 4) vertices.
+    - face_offsets, face_indices (numpy arrays): The mesh faces.
+
+    Returns:
+    - tuple: ((F, 3) normals following the counter-clockwise winding, (F,) plane offsets),
+      a point p lies in front of face f when normals[f] @ p + offsets[f] > 0.
+    """
+    face_count = face_offsets.shape[0] - 1
+    normals = np.zeros((face_count, 3))
+    offsets = np.zeros(face_count)
+    for f in range(face_count):
+        start, end = face_offsets[f], face_offsets[f + 1]
+        nx = ny = nz = cx = cy = cz = 0.0
+        for k in range(start, end):
+            a = face_indices[k]
+            b = face_indices[k + 1] if k + 1 < end else face_indices[start]
+            nx += (vertices[a, 1] - vertices[b, 1]) * (vertices[a, 2] + vertices[b, 2])
+            ny += (vertices[a, 2] - vertices[b, 2]) * (vertices[a, 0] + vertices[b, 0])
+            nz += (vertices[a, 0] - vertices[b, 0]) * (vertices[a, 1] + vertices[b, 1])
+            cx += vertices[a, 0]
+            cy += vertices[a, 1]
+            cz += vertices[a, 2]
+        if end > start:
+            count = end - start
+            normals[f, 0], normals[f, 1], normals[f, 2] = nx, ny, nz
+            offsets[f] = -(nx * cx + ny * cy + nz * cz) / count
+    return normals, offsets
+
+def is_closed_mesh(face_offsets, face_indices, tolerance=0.01):
+    """
+    Check whether a mesh is closed and consistently wound, i.e. every directed edge a->b is matched
+    by exactly one b->a of a neighbouring face, or by as many b->a as there are a->b where closed parts
+    touch along an edge (welded meshes, see mesh_optimizer.py). Only for such meshes back faces can never
+    be seen. Exported meshes often have a few seams or non-manifold edges, so a small share of unmatched
+    edges is tolerated.
+
+    Args:
+    - face_offsets, face_indices (numpy arrays): The mesh faces.
+    - tolerance (float): Share of directed edges allowed to be unmatched or duplicated.
+
+    Returns:
+    - bool: True if back-face culling is safe.
+    """
+    if len(face_indices) == 0 or np.diff(face_offsets).min() < 3:
+        return False
+    # The next corner of every corner, wrapping around to the first corner of its face
+    following = np.arange(1, len(face_indices) + 1)
+    following[face_offsets[1:] - 1] = face_offsets[:-1]
+    a, b = face_indices.astype(np.int64), face_indices[following].astype(np.int64)
+    vertex_count = int(face_indices.max()) + 1
+    # One plain sort, this runs on the main thread whenever an object is created. Both directions of an
+    # edge share a key (lower vertex first, see mesh_optimizer.build_edges) with the direction in its lowest
+    # bit, so every edge is a run of its a->b followed by its b->a. Corners repeating the previous one are
+    # their own reverse and left out
+    proper = a != b
+    if not proper.any():
+        return True
+    a, b = a[proper], b[proper]
+    keys = np.sort((np.minimum(a, b) * vertex_count + np.maximum(a, b)) * 2 + (a < b))
+    starts = np.flatnonzero(np.r_[True, keys[1:] >> 1 != keys[:-1] >> 1])
+    forward = np.add.reduceat(keys & 1, starts)
+    backward = np.diff(np.r_[starts, len(keys)]) - forward
+    # An unmatched direction counts every time it is used, a repeated one only when its reverse is not
+    # repeated as often
+    bad = 0
+    for counts, reverse_counts in ((forward, backward), (backward, forward)):
+        repeated = (reverse_counts != counts) & (reverse_counts > 0) & (counts > 0)
+        bad += counts[reverse_counts == 0].sum() + (counts - 1)[repeated].sum()
+    return bad <= tolerance * len(face_indices)
+
+class WorkBuffers:
+    """
+    Per-frame arrays of a mesh, reused from frame to frame so that drawing allocates nothing proportional
+    to the size of the mesh. Shared by all instances of the mesh and sized for the most instances drawn
+    in one batch so far.
+
+    Attributes:
+    - instances: Number of instances the arrays have room for.
+    - clip, codes, xy, depth: Vertex outputs of clipping.transform_vertices, instance after instance.
+    - front: Back-face mask of every face of every instance.
+    - drawn_faces, drawn_bases, clipped_faces, clipped_bases: Outputs of clipping.classify_faces.
+    - classes: Class of every face, scratch space of clipping.classify_faces_parallel.
+    - colors: Shaded color of every drawn face.
+    - edge_marks, edge_list, edge_bases, edge_faces: Scratch space and outputs of rasterizer.collect_edges.
+    """
+    def __init__(self):
+        self.instances = 0
+
+    def reserve(self, vertex_count, face_count, instances, edge_count=0):
+        """
+        Make room for a batch of instances, reallocating only if there is not enough.
+
+        Args:
+        - vertex_count (int): Vertices of the mesh.
+        - face_count (int): Faces of the mesh.
+        - instances (int): Instances in the batch.
+        - edge_count (int): Edges of the mesh.
+        """
+        if instances <= self.instances:
+            return
+        self.instances = instances
+        vertices, faces = vertex_count * instances, face_count * instances
+        self.clip = np.empty((vertices, 4), dtype=np.float32)
+        self.codes = np.empty(vertices, dtype=np.uint8)
+        self.xy = np.empty((vertices, 2))
+        self.depth = np.empty(vertices)
+        self.front = np.empty(faces, dtype=np.bool_)
+        self.drawn_faces, self.drawn_bases = np.empty(faces, dtype=np.int64), np.empty(faces, dtype=np.int64)
+        self.clipped_faces, self.clipped_bases = np.empty(faces, dtype=np.int64), np.empty(faces, dtype=np.int64)
+        self.classes = np.empty(faces, dtype=np.uint8)
+        self.colors = np.empty((faces, 3), dtype=np.uint8)
+        edges = edge_count * instances
+        self.edge_marks = np.zeros(edges, dtype=np.bool_)
+        self.edge_list, self.edge_bases, self.edge_faces = (np.empty(edges, dtype=np.int64) for _ in range(3))
+
+@njit(fastmath=True, cache=True)
+def faces_facing(normals, plane_d, point, flip, out):
+    #Mask of the faces whose front side the point is on (the back side if flip), written to out
+    for f in range(normals.shape[0]):
+        side = normals[f, 0] * point[0] + normals[f, 1] * point[1] + normals[f, 2] * point[2] + plane_d[f]
+        out[f] = side <= 0 if flip else side >= 0
+
+@njit(fastmath=True, cache=True, parallel=True)
+def faces_facing_parallel(normals, plane_d, point, flip, out, chunks):
+    #faces_facing on all cores
+    size = (normals.shape[0] + chunks - 1) // chunks
+    for c in prange(chunks):
+        faces_facing(normals[c * size:(c + 1) * size], plane_d[c * size:(c + 1) * size], point, flip,
+                     out[c * size:(c + 1) * size])
+
+@njit(fastmath=True, cache=True)
+def count_triangles(face_offsets, faces):
+    #Triangles of the fans of the given faces
+    total = 0
+    for f in faces:
+        total += max(face_offsets[f + 1] - face_offsets[f] - 2, 0)
+    return total
+
+def draw_instances(render, objects, render_mode="wireframe", parallel=None):
+    """
+    Project and draw one or more objects sharing the same mesh in one batched pass.
+
+    All instances are transformed, classified and rasterized (or outlined) together by kernels that
+    write into the mesh's WorkBuffers; Python only loops over the faces of wireframes. Big batches are
+    transformed and classified on all cores, see clipping.parallel_chunks. Under frame-budget pressure
+    only every render.face_stride-th face that passed culling is drawn (see governor.py). Wireframes
+    draw every edge of the faces in view once, from the edge list of the mesh.
+
+    Args:
+    - render: The Renderer instance.
+    - objects (list): Object3D instances sharing vertices_untouched and the face arrays.
+    - render_mode (str): One of Object3D.RENDER_MODES.
+    - parallel (bool): Force the parallel (True) or serial (False) kernels, None to pick them by batch size.
+
+    Returns:
+    - int: Number of triangles drawn (polygons count as the triangles of their fans).
+    """
+    camera, mesh, profiler = render.camera, objects[0], render.profiler
+    vertex_count, face_count = len(mesh.vertices_untouched), mesh.polygon_count
+    buffers = mesh.work_buffers
+    buffers.reserve(vertex_count, face_count, len(objects), len(mesh.edges))
+    vertices_used, faces_used = vertex_count * len(objects), face_count * len(objects)
+    with profiler.stage("matrices"):
+        matrices = [obj.frame_matrices() for obj in objects]
+
+    # Model, camera and projection matrices are fused so the mesh is multiplied exactly once per instance,
+    # the outcodes and screen coordinates are computed in the same pass
+    with profiler.stage("transform"):
+        model_view_projection = np.stack([matrix for _, matrix in matrices])
+        clip, xy, depth = buffers.clip[:vertices_used], buffers.xy[:vertices_used], buffers.depth[:vertices_used]
+        chunks = parallel_chunks(vertices_used, PARALLEL_MIN_VERTICES, parallel)
+        if chunks:
+            transform_vertices_parallel(mesh.vertices_untouched, model_view_projection, camera.near_plane,
+                                        camera.far_plane, render.H_WIDTH, render.H_HEIGHT, clip, buffers.codes,
+                                        xy, depth, chunks)
+        else:
+            transform_vertices(mesh.vertices_untouched, model_view_projection, camera.near_plane, camera.far_plane,
+                               render.H_WIDTH, render.H_HEIGHT, clip, buffers.codes, xy, depth)
+
+    # Back faces and faces outside one frustum plane are culled, faces crossing the near plane get clipped
+    with profiler.stage("classify"):
+        if len(objects) == 1:
+            front = mesh.front
+        else:
+            front = np.concatenate([obj.front for obj in objects], out=buffers.front[:faces_used])
+        chunks = parallel_chunks(faces_used, PARALLEL_MIN_FACES, parallel)
+        if chunks:
+            n_drawn, n_clipped = classify_faces_parallel(buffers.codes[:vertices_used], front, vertex_count,
+                                                         mesh.face_offsets, mesh.face_indices, buffers.drawn_faces,
+                                                         buffers.drawn_bases, buffers.clipped_faces,
+                                                         buffers.clipped_bases, buffers.classes, chunks)
+        else:
+            n_drawn, n_clipped = classify_faces(buffers.codes[:vertices_used], front, vertex_count, mesh.face_offsets,
+                                                mesh.face_indices, buffers.drawn_faces, buffers.drawn_bases,
+                                                buffers.clipped_faces, buffers.clipped_bases)
+        faces, bases = buffers.drawn_faces[:n_drawn], buffers.drawn_bases[:n_drawn]
+        if render.face_stride > 1:
+            #Copied so the kernels keep getting contiguous arrays
+            faces, bases = faces[::render.face_stride].copy(), bases[::render.face_stride].copy()
+        clipped_faces, clipped_bases = buffers.clipped_faces[:n_clipped], buffers.clipped_bases[:n_clipped]
+    profiler.count("faces considered", faces_used)
+    profiler.count("faces culled", faces_used - n_drawn - n_clipped)
+    profiler.count("faces clipped", n_clipped)
+    with profiler.stage("clip"):
+        new_vertices, clip_offsets, clip_indices, clip_sources = clip_near(
+            clip, clipped_faces, clipped_bases, mesh.face_offsets, mesh.face_indices, camera.near_plane)
+
+    with profiler.stage("project"):
+        # Clipped polygons only index into their own vertices
+        clip_xy, clip_depth = clip_to_screen(new_vertices, render.H_WIDTH, render.H_HEIGHT)
+        clip_faces = np.arange(len(clip_sources))
+        # Two sets of polygons: mesh faces offset to their instance, and clipped polygons with their own indices
+        face_sets = [(xy, depth, faces, bases, mesh.face_offsets, mesh.face_indices, faces, bases),
+                     (clip_xy, clip_depth, clip_faces, np.zeros_like(clip_faces), clip_offsets, clip_indices,
+                      clipped_faces[clip_sources], clipped_bases[clip_sources])]
+
+    if render_mode == "filled":
+        with profiler.stage("shade"):
+            columns = normal_z_columns(np.stack([matrix for matrix, _ in matrices]))
+            colors = [buffers.colors[:len(faces)], np.empty((len(clip_faces), 3), dtype=np.uint8)]
+            for (_, _, _, _, _, _, sources, source_bases), set_colors in zip(face_sets, colors):
+                shade_faces(mesh.palette, mesh.face_materials, mesh.face_normals, mesh.face_normal_lengths,
+                            columns, sources, source_bases, vertex_count, set_colors)
+        with profiler.stage("raster"):
+            pixels = pg.surfarray.pixels3d(render.screen)
+            for (set_xy, set_depth, set_faces, set_bases, offsets, indices, _, _), set_colors in zip(face_sets, colors):
+                if len(set_faces):
+                    fill_faces(pixels, render.depth_buffer, set_xy, set_depth, set_faces, set_bases, set_colors,
+                               offsets, indices)
+            # The screen stays locked while the pixel array exists
+            del pixels
+            release_pixels(render.screen)
+    elif not mesh.label:
+        with profiler.stage("raster"):
+            n_edges = collect_edges(faces, bases, mesh.face_offsets, mesh.face_edges, vertex_count, len(mesh.edges),
+                                    buffers.edge_marks, buffers.edge_list, buffers.edge_bases, buffers.edge_faces)
+            pixels = pg.surfarray.pixels3d(render.screen)
+            draw_edges(pixels, xy, mesh.edges, buffers.edge_list[:n_edges], buffers.edge_bases[:n_edges],
+                       buffers.edge_faces[:n_edges], mesh.palette, mesh.face_materials)
+            # Polygons cut by the near plane have vertices of their own, they are outlined one by one
+            draw_outlines(pixels, clip_xy, clip_faces, np.zeros_like(clip_faces), clip_offsets, clip_indices,
+                          clipped_faces[clip_sources], mesh.palette, mesh.face_materials)
+            del pixels
+            release_pixels(render.screen)
+        profiler.count("edges drawn", n_edges)
+    else:
+        with profiler.stage("raster"):
+            # Labelled faces (the axes) are outlined by pygame, with Python looping over the faces that get drawn
+            for set_xy, _, set_faces, set_bases, offsets, indices, sources, _ in face_sets:
+                for face, base, source in zip(set_faces, set_bases, sources):
+                    polygon = set_xy[indices[offsets[face]:offsets[face + 1]] + base]
+                    pg.draw.polygon(render.screen, mesh.colors[mesh.face_materials[source]], polygon, 2)
+                    text = mesh.font.render(mesh.label[source], True, pg.Color('white'))
+                    render.screen.blit(text, polygon[-1])
+    profiler.count("faces drawn", len(faces) + len(clip_faces))
+    return int(count_triangles(mesh.face_offsets, faces) + count_triangles(clip_offsets, clip_faces))
 
 class Object3D:
+    # "wireframe" draws polygon outlines, "filled" rasterizes shaded polygons with a depth test
+    RENDER_MODES = ("wireframe", "filled")
+
     def __init__(self, render, vertices='', faces='', materials=None):
         """
         Initialize a 3D object.
@@ -19,22 +314,275 @@ class Object3D:
         - materials (dict): Dictionary of materials associated with the object's faces.
 
         Attributes worth mentioning:
-        - vertices_untouched (numpy array): unchanged vertices to reset the object after any transformations
+        - vertices_untouched (numpy array): the (N, 4) float32 mesh vertices, never rewritten by transformations
+        - work_buffers: Per-frame arrays reused by draw_instances, shared with the instances of the mesh
+        - face_offsets, face_indices (numpy arrays): ragged polygon layout, see pack_faces
+        - edges, face_edges (numpy arrays): every edge of the mesh once and the edge of every polygon corner,
+          drawn by the wireframe mode, see mesh_optimizer.build_edges
+        - original_face, original_indices (numpy arrays): index of every face and vertex index of every polygon
+          corner in the model file, None when the mesh was not reordered, see source_face
+        - face_materials (numpy array): material index of every face
+        - palette (numpy array): RGB color of every material index
+        - transform (numpy array): 4x4 model matrix composed of all transformations, vertices = vertices_untouched @ transform
+        - transform_version: Incremented whenever transform changes, see frame_matrices
+        - local_bounds: Bounding sphere (center, radius) of vertices_untouched, see bounds()
+        - local_box: (2, 3) lowest and highest corner of the bounding box of vertices_untouched
+        - face_normals, face_plane_d (numpy arrays): Face planes of vertices_untouched, see face_planes
+        - backface_culling: Skip faces turned away from the camera, on by default for closed meshes only
         - movement_flag: Boolean flag for applying movement
+        - render_mode: One of RENDER_MODES to always draw the object with, None to follow the renderer
+        - visible: Whether the object is drawn at all
+        - lods: Simplified versions of the mesh (Object3D instances, shared by all instances), see set_lods
+        - bvh: Bounding volume hierarchy over the faces for picking, built on first use unless set at load
+        - hull: Convex hulls of the mesh and its parts for collisions, built on first use unless set at load
         """
         self.render = render
-        self.materials = materials
-        self.vertices_untouched = np.array(vertices) 
-        self.vertices = np.array(vertices)
-        self.faces = faces
+        self.materials = materials if materials is not None else {}
+        self.vertices_untouched = np.ascontiguousarray(vertices, dtype=np.float32)
+        self.work_buffers = WorkBuffers()
+        self.bvh = None
+        self.hull = None
+        self.hull_key, self.world_hull_planes = None, None
+        self.original_face, self.original_indices = None, None
+        self.transform = np.identity(4)
+        self.transform_version = 0
+        self.matrices_key = None
+        self.lods, self.lod_instances = [], {}
+        self.freeze_bounds()
+        self.material_names, self.palette = build_palette(self.materials)
+        self.set_faces(*pack_faces(faces, self.material_names))
         self.translate([0.0001, 0.0001, 0.0001])
-        self.polygon_count = len(faces)
-        self.materials_count = len(materials)
-        self.font = pg.font.SysFont('Arial', 30, bold=True)
+        self.materials_count = len(self.materials)
+        # Only objects with labels need a font, looking up system fonts is slow
+        self.font = None
         self.movement_flag = False
+        self.render_mode = None
+        self.visible = True
         self.label = ''
+
+    @classmethod
+    def from_arrays(cls, render, vertices, face_offsets, face_indices, face_materials, material_names, palette,
+                    edges=None, face_edges=None, original_face=None, original_indices=None):
+        """
+        Create an object straight from flat mesh arrays, skipping Face instances entirely.
+
+        Args:
+        - render: The Renderer instance.
+        - vertices (numpy array): (N, 4) homogeneous vertices, converted to float32 unless they already are.
+        - face_offsets, face_indices, face_materials (numpy arrays): Faces as returned by pack_faces.
+        - material_names (list): Material names, indexed by face_materials.
+        - palette (numpy array): (M, 3) RGB colors, indexed by face_materials.
+        - edges, face_edges (numpy arrays): Edge list of the faces (see mesh_optimizer.build_edges), built if not given.
+        - original_face, original_indices (numpy arrays): Index of every face and vertex index of every corner
+          in the model file, see mesh_optimizer.optimize_mesh, None if the mesh was not reordered.
+
+        Returns:
+        - Object3D: The new object.
+        """
+        materials = {name: list(color) for name, color in zip(material_names, palette)}
+        obj = cls(render, vertices, [], materials)
+        obj.material_names, obj.palette = list(material_names), np.asarray(palette, dtype=np.uint8)
+        obj.set_faces(face_offsets, face_indices, face_materials, edges, face_edges)
+        obj.original_face, obj.original_indices = original_face, original_indices
+        return obj
+
+    def instance(self):
+        """
+        Create another instance of this object. The mesh arrays are shared, only the model matrix is its own.
+
+        Returns:
+        - Object3D: The new instance, with the same transformation as this object.
+        """
+        obj = copy.copy(self)
+        obj.transform = self.transform.copy()
+        obj.matrices_key = None
+        obj.hull_key = None
+        obj.front_mask = None
+        obj.lod_instances = {}
+        return obj
+
+    def set_lods(self, lods):
+        """
+        Set the simplified versions of the mesh that are drawn when the object is small on screen.
+
+        Args:
+        - lods (list): Level arrays from fine to coarse, as returned by lod.build_lods.
+        """
+        self.lods = []
+        for level in lods:
+            lod = Object3D.from_arrays(self.render, material_names=self.material_names, palette=self.palette, **level)
+            lod.font = self.font
+            self.lods.append(lod)
+        self.lod_instances = {}
+
+    def lod_level(self, pixel_radius):
+        """
+        Pick the level of detail for the projected size of the object.
+
+        Args:
+        - pixel_radius (float): Radius of the bounding sphere on screen in pixels.
+
+        Returns:
+        - int: 0 for the full mesh, n for lods[n - 1]. The finest level with no more faces than
+          LOD_PIXELS_PER_FACE pixels of the covered area allow, the coarsest one if none does.
+        """
+        budget = np.pi * pixel_radius ** 2 / LOD_PIXELS_PER_FACE
+        for level, mesh in enumerate([self] + self.lods):
+            if mesh.polygon_count <= budget:
+                return level
+        return len(self.lods)
+
+    def level_of_detail(self, level):
+        """
+        The object to draw for a level of detail: a level mesh following this object's transformation.
+
+        Args:
+        - level (int): 0 for the full mesh, n for lods[n - 1].
+
+        Returns:
+        - Object3D: This object for level 0, otherwise an instance of the level mesh owned by this object.
+        """
+        if level == 0 or not self.lods:
+            return self
+        level = min(level, len(self.lods))
+        lod = self.lod_instances.get(level)
+        if lod is None:
+            lod = self.lod_instances[level] = self.lods[level - 1].instance()
+        # The instance shares the model matrix, its version keeps the cached frame matrices valid
+        lod.transform, lod.transform_version = self.transform, self.transform_version
+        lod.backface_culling, lod.render_mode = self.backface_culling, self.render_mode
+        return lod
+
+    def freeze_bounds(self):
+        #Compute the bounding sphere and the bounding box of vertices_untouched
+        vertices = self.vertices_untouched
+        if vertices.ndim == 2 and len(vertices):
+            aabb_min, aabb_max = vertices[:, :3].min(axis=0), vertices[:, :3].max(axis=0)
+            center = (aabb_min + aabb_max) / 2
+            radius = float(np.sqrt(((vertices[:, :3] - center) ** 2).sum(axis=1).max()))
+        else:
+            aabb_min = aabb_max = center = np.zeros(3)
+            radius = 0.0
+        self.local_bounds = np.array([*center, 1.0]), radius
+        self.local_box = np.array([aabb_min, aabb_max], dtype=np.float64)
+
+    def freeze(self):
+        #Make the current (transformed) state the one reset() returns to
+        transform = self.transform
+        self.vertices_untouched = np.ascontiguousarray(self.vertices, dtype=np.float32)
+        self.transform = np.identity(4)
+        self.transform_version += 1
+        self.freeze_bounds()
+        self.update_face_planes()
+        self.bvh = None
+        self.hull, self.hull_key = None, None
+        # The level meshes are shared with other instances, so they are replaced by frozen copies
+        lods = []
+        for lod in self.lods:
+            lod = lod.instance()
+            lod.transform = transform
+            lod.freeze()
+            lods.append(lod)
+        self.lods, self.lod_instances = lods, {}
+
+    def update_face_planes(self):
+        #Face planes of vertices_untouched, used for back-face culling and flat shading
+        self.face_normals, self.face_plane_d = face_planes(self.vertices_untouched, self.face_offsets, self.face_indices)
+        self.face_normal_lengths = np.linalg.norm(self.face_normals, axis=1)
+
+    @property
+    def vertices(self):
+        #The transformed vertices, only computed on request since drawing applies the model matrix on the fly
+        return self.vertices_untouched @ self.transform
+
+    @property
+    def state_key(self):
+        #Everything the picture of the object depends on besides the camera and the renderer settings
+        return (self.transform_version, self.visible, self.backface_culling, self.render_mode)
+
+    def bounds(self):
+        """
+        Bounding sphere of the current vertices.
+
+        Returns:
+        - tuple: (center as a homogeneous 4-vector, radius).
+        """
+        center, radius = self.local_bounds
+        return center @ self.transform, radius * np.linalg.norm(self.transform[:3, :3], axis=1).max()
+
+    def frame_matrices(self):
+        """
+        Matrices and masks that only depend on the camera and the model matrix.
+        They are cached and only recomputed when either of them changed since the last frame.
+
+        Returns:
+        - tuple: (view_matrix, model_view_projection) 4x4 matrices.
+        """
+        camera = self.render.camera
+        key = (camera.update(), self.transform_version, self.backface_culling)
+        if key != self.matrices_key:
+            self.matrices_key = key
+            self.view_matrix = self.transform @ camera.view_matrix
+            self.model_view_projection = self.transform @ camera.view_projection
+            self.front = self.front_faces(camera.position)
+        return self.view_matrix, self.model_view_projection
+
+    def front_faces(self, camera_position, parallel=None):
+        """
+        Batched back-face test against the camera position.
+
+        Args:
+        - camera_position (numpy array): Homogeneous world space camera position.
+        - parallel (bool): Force the parallel (True) or serial (False) kernel, None to pick it by mesh size.
+
+        Returns:
+        - numpy array: (F,) boolean mask of the faces turned towards the camera (all True when culling is off).
+        """
+        if not self.backface_culling:
+            return self.all_faces
+        # Bring the camera into the untouched object space instead of moving every face plane, as a point (w = 1)
+        local_camera = np.r_[camera_position[:3], 1.0] @ np.linalg.inv(self.transform)
+        # The mask is written in place, every instance has its own
+        if self.front_mask is None:
+            self.front_mask = np.empty(self.polygon_count, dtype=np.bool_)
+        # Mirroring transformations flip the winding
+        point, flip = local_camera[:3] / local_camera[3], np.linalg.det(self.transform[:3, :3]) < 0
+        chunks = parallel_chunks(self.polygon_count, PARALLEL_MIN_FACES, parallel)
+        if chunks:
+            faces_facing_parallel(self.face_normals, self.face_plane_d, point, flip, self.front_mask, chunks)
+        else:
+            faces_facing(self.face_normals, self.face_plane_d, point, flip, self.front_mask)
+        return self.front_mask
+
+    def set_faces(self, face_offsets, face_indices, face_materials, edges=None, face_edges=None):
+        """
+        Replace the faces of the object.
+
+        Args:
+        - face_offsets, face_indices, face_materials (numpy arrays): Faces as returned by pack_faces.
+        - edges, face_edges (numpy arrays): Edge list of the faces (see mesh_optimizer.build_edges), built if not given.
+        """
+        self.face_offsets = np.ascontiguousarray(face_offsets, dtype=np.int64)
+        self.face_indices = np.ascontiguousarray(face_indices, dtype=np.int32)
+        self.face_materials = np.ascontiguousarray(face_materials, dtype=np.int32)
+        if edges is None:
+            edges, face_edges = build_edges(self.face_offsets, self.face_indices)
+        self.edges = np.ascontiguousarray(edges, dtype=np.int32)
+        self.face_edges = np.ascontiguousarray(face_edges, dtype=np.int32)
+        self.colors = [pg.Color(*map(int, rgb)) for rgb in self.palette]
+        self.polygon_count = len(self.face_materials)
+        self.face_triangles = np.maximum(np.diff(self.face_offsets) - 2, 0)
+        self.update_face_planes()
+        self.backface_culling = is_closed_mesh(self.face_offsets, self.face_indices)
+        self.all_faces = np.ones(self.polygon_count, dtype=np.bool_)
+        self.front_mask = None
+        self.matrices_key = None
+        self.bvh = None
+        self.hull, self.hull_key = None, None
+        # Levels of detail describe the previous faces
+        self.lods, self.lod_instances = [], {}
     
-    def draw(self, rotateX, rortateY, rotateZ):
+    def draw(self, rotateX, rortateY, rotateZ, render_mode=None):
         """
         Draw the 3D object on the screen.
 
@@ -42,53 +590,132 @@ class Object3D:
         - rotateX (bool): Flag indicating whether to rotate around the X-axis.
         - rortateY (bool): Flag indicating whether to rotate around the Y-axis.
         - rotateZ (bool): Flag indicating whether to rotate around the Z-axis.
+        - render_mode (str): One of RENDER_MODES, used unless the object has its own render_mode.
+        """
+        self.update(rotateX, rortateY, rotateZ)
+        self.screen_projection(self.render_mode or render_mode or "wireframe")
+
+    def update(self, rotateX, rortateY, rotateZ, dt=UPDATE_STEP):
+        """
+        Apply the movement of a time step without drawing, used when the object is drawn as part of a Scene.
+
+        Args:
+        - rotateX (bool): Flag indicating whether to rotate around the X-axis.
+        - rortateY (bool): Flag indicating whether to rotate around the Y-axis.
+        - rotateZ (bool): Flag indicating whether to rotate around the Z-axis.
+        - dt (float): Seconds of movement to apply.
         """
         if(rotateX or rortateY or rotateZ): 
             self.movement_flag = True
-            self.movement(rotateX, rortateY, rotateZ)
+            self.movement(rotateX, rortateY, rotateZ, dt)
         else: self.movement_flag = False
-        self.screen_projection()
 
-    def movement(self, x, y, z):
+    def movement(self, x, y, z, dt=UPDATE_STEP):
         """
-        Apply movement (currently only rotation) to the 3D object.
+        Apply movement (currently only rotation at ROTATION_SPEED) to the 3D object.
 
         Args:
         - x (bool): Flag indicating whether to rotate around the X-axis.
         - y (bool): Flag indicating whether to rotate around the Y-axis.
         - z (bool): Flag indicating whether to rotate around the Z-axis.
+        - dt (float): Seconds of movement to apply.
         """
         if self.movement_flag:
-            if x: self.rotate(-(pg.time.get_ticks() % 0.005), "x")
-            if y: self.rotate(-(pg.time.get_ticks() % 0.005), "y")
-            if z: self.rotate(-(pg.time.get_ticks() % 0.005), "z")
+            if x: self.rotate(-ROTATION_SPEED * dt, "x")
+            if y: self.rotate(-ROTATION_SPEED * dt, "y")
+            if z: self.rotate(-ROTATION_SPEED * dt, "z")
 
     def reset(self):
         #Reset the object to its original state
-        self.vertices = self.vertices_untouched
+        self.transform = np.identity(4)
+        self.transform_version += 1
     
-    def screen_projection(self):
-        ##Project the object onto the screen and draw it.
-        vertices = self.vertices @ self.render.camera.camera_matrix()
-        vertices = vertices @ self.render.projection.projection_matrix
-        
-        # Normalize homogeneous coordinates
-        vertices /= vertices[:, -1].reshape(-1, 1)
-        vertices[(vertices > 1) | (vertices < -1)] = 0
-
-        # Transform to screen coordinates
-        vertices = vertices @ self.render.projection.to_screen_matrix
-        vertices = vertices[:, :2]
-
-        for index, face in enumerate(self.faces):
-            color, face = pg.Color(self.materials[face.material_name]), face
-            polygon = vertices[face.vertices]
-            if not any_func(polygon, self.render.H_WIDTH, self.render.H_HEIGHT):
-                pg.draw.polygon(self.render.screen, color, polygon, 2)
-                #Currently only used when displaying axes
-                if self.label:
-                    text = self.font.render(self.label[index], True, pg.Color('white'))
-                    self.render.screen.blit(text, polygon[-1])
+    def screen_projection(self, render_mode="wireframe"):
+        """
+        Project the object onto the screen and draw it.
+
+        Args:
+        - render_mode (str): One of RENDER_MODES.
+
+        Returns:
+        - int: Number of triangles drawn.
+        """
+        camera = self.render.camera
+        with self.render.profiler.stage("cull"):
+            camera.update()
+
+            # Objects completely outside the view frustum skip all per-vertex work
+            center, radius = self.bounds()
+            if not self.visible or not camera.spheres_in_frustum((center @ camera.view_matrix).reshape(1, -1), [radius])[0]:
+                return 0
+            level = self.lod_level(camera.projected_radii(center.reshape(1, -1), [radius])[0])
+        return draw_instances(self.render, [self.level_of_detail(level)], render_mode)
+
+    def pick(self, origin, direction):
+        """
+        Closest face hit by a world space ray.
+
+        Args:
+        - origin, direction (numpy arrays): Start and direction of the ray (3 components).
+
+        Returns:
+        - tuple: (face index, or -1 if the ray misses, distance along the ray in units of direction).
+        """
+        if self.bvh is None:
+            self.bvh = BVH.build(self.vertices_untouched, self.face_offsets, self.face_indices)
+        # The ray is brought into the untouched object space, distances along it stay the same
+        inverse = np.linalg.inv(self.transform)
+        local_origin = np.array([*origin[:3], 1.0]) @ inverse
+        local_direction = np.array([*direction[:3], 0.0]) @ inverse
+        return self.bvh.intersect(self.vertices_untouched, self.face_offsets, self.face_indices,
+                                  local_origin[:3] / local_origin[3], local_direction[:3])
+
+    def source_face(self, face):
+        """
+        The index a face and its corners have in the model file, the mesh may have been reordered since.
+
+        Args:
+        - face (int): Index of the face, as returned by pick.
+
+        Returns:
+        - tuple: (face index, list of vertex indices), 0-based like the mesh arrays. Corners welded into
+          the one before them are left out, see mesh_optimizer.weld_vertices.
+        """
+        corners = slice(self.face_offsets[face], self.face_offsets[face + 1])
+        indices = (self.original_indices if self.original_indices is not None else self.face_indices)[corners]
+        if self.original_face is not None:
+            face = self.original_face[face]
+        return int(face), [int(index) for index in indices]
+
+    def world_hull(self):
+        """
+        Convex hulls of the object as it is currently transformed, see hull.Hull.
+
+        Returns:
+        - tuple: ((K, 4) planes of the hull around the whole object, (P, K, 4) planes of its parts), in world space.
+        """
+        if self.hull is None:
+            self.hull = Hull.build(self.vertices_untouched, self.face_offsets, self.face_indices, self.bvh)
+        if self.hull_key != self.transform_version:
+            self.hull_key = self.transform_version
+            self.world_hull_planes = (transform_equations(self.hull.equations, self.transform),
+                                      transform_equations(self.hull.parts, self.transform))
+        return self.world_hull_planes
+
+    def apply_matrix(self, matrix):
+        """
+        Transform the object by a 4x4 matrix. Only the model matrix changes, the mesh itself is untouched.
+
+        Args:
+        - matrix (numpy array): The transformation matrix.
+        """
+        self.transform = self.transform @ matrix
+        self.transform_version += 1
+
+    def orthonormalize(self):
+        #Remove the drift that repeated small rotations accumulate in the model matrix, keeping its scale
+        u, singular, vt = np.linalg.svd(self.transform[:3, :3])
+        self.transform[:3, :3] = singular.mean() * (u @ vt)
 
     def translate(self, pos):
         """
@@ -97,7 +724,7 @@ class Object3D:
         Args:
         - pos (list): The translation vector (tx, ty, tz).
         """
-        self.vertices = self.vertices @ translate(pos)
+        self.apply_matrix(translate(pos))
 
     def scale(self, scale_to):
         """
@@ -106,7 +733,7 @@ class Object3D:
         Args:
         - scale_to (float): The scaling factor.
         """
-        self.vertices = self.vertices @ scale(scale_to)
+        self.apply_matrix(scale(scale_to))
 
     def rotate(self, angle, axis):
         """
@@ -116,12 +743,9 @@ class Object3D:
         - angle (float): The rotation angle in radians.
         - axis (str): The rotation axis ('x', 'y', or 'z').
         """
-        if axis == "x":
-            self.vertices = self.vertices @ rotate(angle, "x")
-        elif axis == "y":
-            self.vertices = self.vertices @ rotate(angle, "y")
-        elif axis == "z":
-            self.vertices = self.vertices @ rotate(angle, "z")
+        if axis in ("x", "y", "z"):
+            self.apply_matrix(rotate(angle, axis))
+            self.orthonormalize()
 
 class Face:
     """
@@ -144,10 +768,10 @@ class Axes(Object3D):
     - render: The Renderer instance.
     """
     def __init__(self, render):
-        super().__init__(render)
-        self.vertices = np.array([(0, 0, 0, 1), (1, 0, 0, 1), (0, 1, 0, 1), (0, 0, 1, 1)])
-        self.faces = [Face([0, 1]), Face([0, 2]), Face([0, 3])]
-        self.colors = [pg.Color('red'), pg.Color('green'), pg.Color('blue')]
-        self.color_faces = [(color, face) for color, face in zip(self.colors, self.faces)]
+        materials = {'x': pg.Color('red'), 'y': pg.Color('green'), 'z': pg.Color('blue')}
+        faces = [Face([0, 1], 'x'), Face([0, 2], 'y'), Face([0, 3], 'z')]
+        super().__init__(render, [(0, 0, 0, 1), (1, 0, 0, 1), (0, 1, 0, 1), (0, 0, 1, 1)], faces, materials)
         self.draw_vertices = False
-        self.label = 'XYZ'
\ No newline at end of file
+        self.render_mode = "wireframe"
+        self.font = pg.font.SysFont('Arial', 30, bold=True)
+        self.label = 'XYZ'
@@ -0,0 +1,163 @@
+"""
+Per-frame timing of the stages of the render loop, with counters and a rolling history.
+
+Code that belongs to a stage runs inside "with profiler.stage(name):", counters are bumped with
+profiler.count(name, n), and the renderer closes every frame with end_frame(). Stages must not be
+nested, so the stage times of a frame add up to the time spent in the profiled code. When the profiler
+is disabled a stage costs a single attribute check.
+
+The last HISTORY frames are kept for the on-screen overlay (means, percentiles and a histogram of the
+frame times) and can be written to a trace file in the Chrome trace event format, which chrome://tracing
+and https://ui.perfetto.dev open.
+"""
+
+import os
+import json
+import time
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+
+# Frames kept in the rolling history
+HISTORY = 240
+
+class Profiler:
+    """
+    Collects how long every stage took in every frame, plus per-frame counters.
+
+    Attributes:
+    - enabled: Whether stages are timed and counted at all.
+    - frame: Seconds spent in every stage so far in the current frame.
+    - counts: Counters of the current frame.
+    - frames: Stage times of every completed frame, only kept while record is True.
+    - record: Whether completed frames are appended to frames (unbounded, unlike the history).
+    - history: The last HISTORY frames as (start, duration, stage times, counts, events) tuples,
+      events being (stage, start, duration) for every time a stage was entered.
+    """
+    def __init__(self, enabled=False, record=False, history=HISTORY):
+        self.enabled = enabled
+        self.record = record
+        self.frame = {}
+        self.counts = {}
+        self.events = []
+        self.frames = []
+        self.history = deque(maxlen=history)
+        self.frame_start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time the code in the with block as part of a stage. A stage may be entered several times per frame.
+
+        Args:
+        - name (str): Name of the stage.
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.frame[name] = self.frame.get(name, 0.0) + duration
+            self.events.append((name, start, duration))
+
+    def count(self, name, n=1):
+        """
+        Add to a counter of the current frame.
+
+        Args:
+        - name (str): Name of the counter.
+        - n (int): Amount to add.
+        """
+        if self.enabled:
+            self.counts[name] = self.counts.get(name, 0) + int(n)
+
+    def end_frame(self):
+        """
+        Close the current frame.
+
+        Returns:
+        - dict: Seconds spent in every stage during the frame.
+        """
+        now = time.perf_counter()
+        frame, counts, events = self.frame, self.counts, self.events
+        self.frame, self.counts, self.events = {}, {}, []
+        if self.enabled:
+            self.history.append((self.frame_start, now - self.frame_start, frame, counts, events))
+            if self.record:
+                self.frames.append(frame)
+        self.frame_start = now
+        return frame
+
+    def reset(self):
+        #Forget the history, e.g. after the profiler was off for a while
+        self.history.clear()
+        self.frame, self.counts, self.events = {}, {}, []
+        self.frame_start = time.perf_counter()
+
+    def stage_summary(self):
+        """
+        Timing statistics of every stage over the history.
+
+        Returns:
+        - dict: Stage name -> (mean, 95th percentile) in milliseconds, "frame" for the whole frames.
+        """
+        if not self.history:
+            return {}
+        stages = {name for _, _, frame, _, _ in self.history for name in frame}
+        summary = {}
+        for name in sorted(stages):
+            values = np.array([frame.get(name, 0.0) for _, _, frame, _, _ in self.history]) * 1000
+            summary[name] = (values.mean(), np.percentile(values, 95))
+        durations = np.array([duration for _, duration, _, _, _ in self.history]) * 1000
+        summary["frame"] = (durations.mean(), np.percentile(durations, 95))
+        return summary
+
+    def count_summary(self):
+        #Mean of every counter over the history
+        if not self.history:
+            return {}
+        names = {name for _, _, _, counts, _ in self.history for name in counts}
+        return {name: np.mean([counts.get(name, 0) for _, _, _, counts, _ in self.history]) for name in sorted(names)}
+
+    def frame_histogram(self, bins=16):
+        """
+        Histogram of the frame times over the history.
+
+        Args:
+        - bins (int): Number of bins between the shortest and the longest frame.
+
+        Returns:
+        - tuple: (counts, bin edges in milliseconds) numpy arrays.
+        """
+        durations = np.array([duration for _, duration, _, _, _ in self.history]) * 1000
+        if len(durations) == 0:
+            return np.zeros(bins, dtype=np.int64), np.zeros(bins + 1)
+        return np.histogram(durations, bins=bins)
+
+    def export_trace(self, filename):
+        """
+        Write the history to a Chrome trace event file: one event per stage entry, one per frame and
+        the counters of every frame.
+
+        Args:
+        - filename (str): Path of the .json file.
+
+        Returns:
+        - str: The absolute path written.
+        """
+        pid = os.getpid()
+        trace = []
+        for frame_start, duration, _, counts, events in self.history:
+            trace.append({"name": "frame", "ph": "X", "ts": frame_start * 1e6, "dur": duration * 1e6,
+                          "pid": pid, "tid": 0})
+            for name, start, stage_duration in events:
+                trace.append({"name": name, "ph": "X", "ts": start * 1e6, "dur": stage_duration * 1e6,
+                              "pid": pid, "tid": 1})
+            if counts:
+                trace.append({"name": "counters", "ph": "C", "ts": frame_start * 1e6, "pid": pid, "args": counts})
+        with open(filename, "w") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+        return os.path.abspath(filename)
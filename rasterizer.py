@@ -0,0 +1,243 @@
+"""
+Filled polygon rendering with a depth buffer, and wireframe lines.
+
+Polygons are split into triangle fans and rasterized with edge functions straight into the pixel
+array of the screen (pg.surfarray.pixels3d, indexed [x, y]). Every face is flat shaded: its material
+color is scaled by how much the face is turned towards the camera, computed from the face normals
+precomputed at load. Wireframes are drawn into the same array, every edge shared by faces in view once
+(see mesh_optimizer.build_edges).
+"""
+
+import gc
+import numpy as np
+from numba import njit
+
+# Share of the material color a face keeps even when seen exactly edge-on
+AMBIENT = 0.25
+# "Infinitely far" depth, kept finite since the kernels are compiled with fastmath
+DEPTH_CLEAR = np.finfo(np.float32).max
+
+def new_depth_buffer(width, height):
+    #Depth buffer matching pg.surfarray.pixels3d indexing
+    return np.full((width, height), DEPTH_CLEAR, dtype=np.float32)
+
+def release_pixels(surface):
+    #Compiling a kernel keeps its arguments alive in reference cycles for a while, collect them so the surface unlocks
+    if surface.get_locked():
+        gc.collect()
+
+@njit(fastmath=True, cache=True)
+def fill_triangle(pixels, depth, xy, z, i0, i1, i2, r, g, b):
+    width, height = depth.shape
+    x0, y0, x1, y1, x2, y2 = xy[i0, 0], xy[i0, 1], xy[i1, 0], xy[i1, 1], xy[i2, 0], xy[i2, 1]
+    area = (x1 - x0) * (y2 - y0) - (y1 - y0) * (x2 - x0)
+    if area == 0:
+        return
+    # Bounding box of the triangle clipped to the screen
+    min_x = max(int(np.floor(min(x0, x1, x2))), 0)
+    max_x = min(int(np.ceil(max(x0, x1, x2))), width - 1)
+    min_y = max(int(np.floor(min(y0, y1, y2))), 0)
+    max_y = min(int(np.ceil(max(y0, y1, y2))), height - 1)
+    inv_area = 1.0 / area
+    z0, z1, z2 = z[i0], z[i1], z[i2]
+    # Barycentric weights are linear in x along a row: w = a * px + c
+    a0, a1 = -(y2 - y1) * inv_area, -(y0 - y2) * inv_area
+    a2 = -(a0 + a1)
+    for y in range(min_y, max_y + 1):
+        py = y + 0.5
+        c0 = ((x2 - x1) * (py - y1) + (y2 - y1) * x1) * inv_area
+        c1 = ((x0 - x2) * (py - y2) + (y0 - y2) * x2) * inv_area
+        c2 = 1.0 - c0 - c1
+        # Scanline span where all three weights are non-negative
+        lo, hi = min_x + 0.5, max_x + 0.5
+        empty = False
+        for a, c in ((a0, c0), (a1, c1), (a2, c2)):
+            if a > 0:
+                lo = max(lo, -c / a)
+            elif a < 0:
+                hi = min(hi, -c / a)
+            elif c < 0:
+                empty = True
+        if empty or lo > hi:
+            continue
+        for x in range(max(int(np.floor(lo - 0.5)), min_x), min(int(np.ceil(hi - 0.5)), max_x) + 1):
+            px = x + 0.5
+            w0, w1 = a0 * px + c0, a1 * px + c1
+            w2 = 1.0 - w0 - w1
+            if w0 < 0 or w1 < 0 or w2 < 0:
+                continue
+            pz = w0 * z0 + w1 * z1 + w2 * z2
+            if pz < depth[x, y]:
+                depth[x, y] = pz
+                pixels[x, y, 0] = r
+                pixels[x, y, 1] = g
+                pixels[x, y, 2] = b
+
+@njit(fastmath=True, cache=True)
+def fill_faces(pixels, depth, xy, z, faces, bases, colors, face_offsets, face_indices):
+    """
+    Rasterize the given faces with a depth test.
+
+    Args:
+    - pixels (numpy array): (W, H, 3) uint8 screen pixels.
+    - depth (numpy array): (W, H) float32 depth buffer.
+    - xy (numpy array): (N, 2) screen coordinates of the vertices.
+    - z (numpy array): (N,) normalized depth of the vertices.
+    - faces (numpy array): Indices of the faces to draw.
+    - bases (numpy array): Offset added to the vertex indices of every face (the first vertex of its instance).
+    - colors (numpy array): (len(faces), 3) uint8 shaded color of every face, see shade_faces.
+    - face_offsets, face_indices (numpy arrays): The mesh faces.
+    """
+    for i in range(faces.shape[0]):
+        f, base = faces[i], bases[i]
+        start, end = face_offsets[f], face_offsets[f + 1]
+        if end - start < 3:
+            continue
+        r, g, b = colors[i, 0], colors[i, 1], colors[i, 2]
+        i0 = base + face_indices[start]
+        for k in range(start + 1, end - 1):
+            fill_triangle(pixels, depth, xy, z, i0, base + face_indices[k], base + face_indices[k + 1], r, g, b)
+
+def normal_z_columns(view_matrices):
+    """
+    Column that maps an object space normal to its camera space z, for every view matrix.
+
+    Args:
+    - view_matrices (numpy array): (K, 4, 4) object-to-camera-space matrices (row vectors).
+
+    Returns:
+    - numpy array: (K, 3) columns, normalized so that the result is the cosine for a unit normal.
+    """
+    # Normals transform with the inverse transpose, only their camera space z is needed
+    columns = np.linalg.inv(view_matrices[:, :3, :3]).transpose(0, 2, 1)[:, :, 2]
+    return columns / np.linalg.norm(columns, axis=1).reshape(-1, 1)
+
+@njit(fastmath=True, cache=True)
+def shade_faces(palette, face_materials, normals, normal_lengths, columns, faces, bases, vertex_count, colors):
+    """
+    Flat shaded color of every face: its material color scaled by how much it is turned towards the camera.
+
+    Args:
+    - palette (numpy array): (M, 3) material colors.
+    - face_materials (numpy array): Material index of every mesh face.
+    - normals (numpy array): (F, 3) object space face normals.
+    - normal_lengths (numpy array): (F,) lengths of the normals, 0 for degenerate faces.
+    - columns (numpy array): (K, 3) normal_z_columns of every instance.
+    - faces (numpy array): (D,) mesh faces to shade.
+    - bases (numpy array): (D,) index of the first vertex of the instance of every face.
+    - vertex_count (int): Vertices per instance, bases // vertex_count is the instance.
+    - colors (numpy array): (D, 3) uint8 output.
+    """
+    for i in range(faces.shape[0]):
+        f, instance = faces[i], bases[i] // vertex_count
+        shade = 1.0
+        if normal_lengths[f] > 0:
+            cosine = abs(normals[f, 0] * columns[instance, 0] + normals[f, 1] * columns[instance, 1]
+                         + normals[f, 2] * columns[instance, 2]) / normal_lengths[f]
+            shade = AMBIENT + (1.0 - AMBIENT) * min(cosine, 1.0)
+        m = face_materials[f]
+        for channel in range(3):
+            colors[i, channel] = np.uint8(palette[m, channel] * shade)
+
+@njit(fastmath=True, cache=True)
+def clip_parameter(p, q, t0, t1):
+    #Liang-Barsky step: narrow [t0, t1] to where p * t <= q, t0 > t1 if nothing is left
+    if p == 0:
+        return (t0, t1) if q >= 0 else (1.0, 0.0)
+    t = q / p
+    return (t0, min(t1, t)) if p > 0 else (max(t0, t), t1)
+
+@njit(fastmath=True, cache=True)
+def draw_line(pixels, x0, y0, x1, y1, r, g, b):
+    #Line two pixels wide (like pg.draw.polygon with width 2), clipped to the screen and stepped along its longer axis
+    width, height = pixels.shape[0], pixels.shape[1]
+    dx, dy = x1 - x0, y1 - y0
+    t0, t1 = clip_parameter(-dx, x0, 0.0, 1.0)
+    t0, t1 = clip_parameter(dx, width - 1 - x0, t0, t1)
+    t0, t1 = clip_parameter(-dy, y0, t0, t1)
+    t0, t1 = clip_parameter(dy, height - 1 - y0, t0, t1)
+    if t0 > t1:
+        return
+    xa, ya = x0 + t0 * dx, y0 + t0 * dy
+    sx, sy = (t1 - t0) * dx, (t1 - t0) * dy
+    steps = int(max(abs(sx), abs(sy)))
+    # The second pixel is put next to the first across the longer axis
+    ox, oy = (0, 1) if abs(sx) >= abs(sy) else (1, 0)
+    for i in range(steps + 1):
+        t = i / steps if steps > 0 else 0.0
+        x, y = int(xa + t * sx + 0.5), int(ya + t * sy + 0.5)
+        for px, py in ((x, y), (x + ox, y + oy)):
+            if 0 <= px < width and 0 <= py < height:
+                pixels[px, py, 0] = r
+                pixels[px, py, 1] = g
+                pixels[px, py, 2] = b
+
+@njit(fastmath=True, cache=True)
+def collect_edges(faces, bases, face_offsets, face_edges, vertex_count, edge_count, marks, edges, edge_bases, edge_faces):
+    """
+    List the edges of the given faces once each, instance by instance.
+
+    Args:
+    - faces (numpy array): Indices of the faces drawn.
+    - bases (numpy array): Index of the first vertex of the instance of every face.
+    - face_offsets (numpy array): The mesh faces.
+    - face_edges (numpy array): Edge of every polygon corner, see mesh_optimizer.build_edges.
+    - vertex_count, edge_count (int): Vertices and edges per instance.
+    - marks (numpy array): False for every edge of every instance, left that way on return.
+    - edges, edge_bases, edge_faces (numpy arrays): Output, mesh edge, instance base and the first face
+      drawn using it of every edge listed.
+
+    Returns:
+    - int: Number of edges listed.
+    """
+    n = 0
+    for i in range(faces.shape[0]):
+        f, base = faces[i], bases[i]
+        offset = base // vertex_count * edge_count
+        for k in range(face_offsets[f], face_offsets[f + 1]):
+            e = face_edges[k]
+            if not marks[offset + e]:
+                marks[offset + e] = True
+                edges[n], edge_bases[n], edge_faces[n] = e, base, f
+                n += 1
+    for i in range(n):
+        marks[edge_bases[i] // vertex_count * edge_count + edges[i]] = False
+    return n
+
+@njit(fastmath=True, cache=True)
+def draw_edges(pixels, xy, mesh_edges, edges, edge_bases, edge_faces, palette, face_materials):
+    """
+    Draw the edges listed by collect_edges in the material color of their face.
+
+    Args:
+    - pixels (numpy array): (W, H, 3) uint8 screen pixels.
+    - xy (numpy array): (N, 2) screen coordinates of the vertices.
+    - mesh_edges (numpy array): (E, 2) vertex indices of the mesh edges.
+    - edges, edge_bases, edge_faces (numpy arrays): Output of collect_edges.
+    - palette, face_materials (numpy arrays): Material colors and the material of every mesh face.
+    """
+    for i in range(edges.shape[0]):
+        a, b = mesh_edges[edges[i], 0] + edge_bases[i], mesh_edges[edges[i], 1] + edge_bases[i]
+        m = face_materials[edge_faces[i]]
+        draw_line(pixels, xy[a, 0], xy[a, 1], xy[b, 0], xy[b, 1], palette[m, 0], palette[m, 1], palette[m, 2])
+
+@njit(fastmath=True, cache=True)
+def draw_outlines(pixels, xy, faces, bases, face_offsets, face_indices, sources, palette, face_materials):
+    """
+    Draw the outline of every given polygon, for polygons without an edge list (the ones cut by the near plane).
+
+    Args:
+    - pixels (numpy array): (W, H, 3) uint8 screen pixels.
+    - xy (numpy array): (N, 2) screen coordinates of the vertices.
+    - faces, bases (numpy arrays): The polygons and the offset added to their vertex indices.
+    - face_offsets, face_indices (numpy arrays): The polygons' corners.
+    - sources (numpy array): Mesh face of every polygon, its material is the color of the outline.
+    - palette, face_materials (numpy arrays): Material colors and the material of every mesh face.
+    """
+    for i in range(faces.shape[0]):
+        f, base = faces[i], bases[i]
+        start, end = face_offsets[f], face_offsets[f + 1]
+        m = face_materials[sources[i]]
+        for k in range(start, end):
+            a, b = base + face_indices[k], base + face_indices[k + 1 if k + 1 < end else start]
+            draw_line(pixels, xy[a, 0], xy[a, 1], xy[b, 0], xy[b, 1], palette[m, 0], palette[m, 1], palette[m, 2])
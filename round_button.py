@@ -11,6 +11,8 @@ class RoundButton:
     - radius: Radius of the rounded corners of the button.
     - hover_factor: Factor to darken the button color when hovered.
     - is_hovered: A boolean indicating whether the button is currently being hovered over.
+    - font: Pygame font of the text.
+    - surfaces: Rendered button surfaces, keyed by (text, is_hovered).
 
     Methods:
     - draw: Draw the button on the screen.
@@ -24,16 +26,43 @@ class RoundButton:
         self.radius = radius
         self.hover_factor = hover_factor
         self.is_hovered = False
-    def draw(self):
+        self.font = pg.font.Font(None, 36)
+        self.surfaces = {}
+
+    @property
+    def state_key(self):
+        #Everything the look of the button depends on
+        return (self.text, self.is_hovered)
+
+    def render(self):
+        """
+        Render the button in its current state on a surface of its own size.
+
+        Returns:
+        - pygame.Surface: The button with a transparent background outside the rounded corners.
+        """
+        surface = pg.Surface(self.rect.size, pg.SRCALPHA)
         # Darken the color if hovered
         if self.is_hovered:
             hover_color = tuple(int(component * self.hover_factor) for component in self.color)
-            pg.draw.rect(self.screen, hover_color, self.rect, border_radius=self.radius)
+            pg.draw.rect(surface, hover_color, surface.get_rect(), border_radius=self.radius)
         else:
-            pg.draw.rect(self.screen, self.color, self.rect, border_radius=self.radius)
+            pg.draw.rect(surface, self.color, surface.get_rect(), border_radius=self.radius)
         if self.text != '':
             # Draw text
-            font = pg.font.Font(None, 36)
-            text_surface = font.render(self.text, True, self.text_color)
-            text_rect = text_surface.get_rect(center=self.rect.center)
-            self.screen.blit(text_surface, text_rect)
\ No newline at end of file
+            text_surface = self.font.render(self.text, True, self.text_color)
+            text_rect = text_surface.get_rect(center=surface.get_rect().center)
+            surface.blit(text_surface, text_rect)
+        return surface
+
+    def draw(self):
+        """
+        Draw the button on the screen, rendering it only the first time it is drawn in a state.
+
+        Returns:
+        - pygame.Rect: The area of the screen drawn.
+        """
+        key = self.state_key
+        if key not in self.surfaces:
+            self.surfaces[key] = self.render()
+        return self.screen.blit(self.surfaces[key], self.rect)
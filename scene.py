@@ -0,0 +1,241 @@
+from object3d import *
+from hull import segment_entries
+from chunked_mesh import ChunkedObject
+
+# Corners of a box are numbered by the bits x = 4, y = 2, z = 1 of their highest coordinates, edges join
+# corners differing in one of them
+BOX_CORNERS = np.array([[x, y, z] for x in (0, 1) for y in (0, 1) for z in (0, 1)])
+BOX_EDGES = [(a, a | bit) for a in range(8) for bit in (1, 2, 4) if not a & bit]
+
+class Scene:
+    """
+    A collection of 3D objects drawn together.
+
+    Objects sharing a mesh (see Object3D.instance) are projected, culled and drawn in one batched pass
+    per mesh, and the bounding spheres of all objects are tested against the view frustum at once.
+    Objects that are small on screen are drawn with one of their levels of detail. Out-of-core objects
+    (see chunked_mesh.ChunkedObject) are drawn through the chunks of them in view, every chunk is a mesh
+    of its own.
+
+    Attributes:
+    - render: The Renderer instance.
+    - objects: List of Object3D instances in drawing order.
+    - use_lods: Whether levels of detail are used, otherwise every object is drawn at full detail.
+    - triangles_drawn: Number of triangles drawn by the last draw call.
+    - drawn_rect: Screen area the last draw call may have drawn to (a pygame Rect), None if nothing was drawn.
+    - version: Incremented whenever objects are added, removed or replaced.
+    - complete: Whether the last draw call drew everything in view, False while chunks are still paged in.
+    """
+    def __init__(self, render):
+        self.render = render
+        self.objects = []
+        self.use_lods = True
+        self.triangles_drawn = 0
+        self.drawn_rect = None
+        self.version = 0
+        self.complete = True
+
+    def add(self, obj):
+        """
+        Add an object to the scene.
+
+        Args:
+        - obj (Object3D): The object.
+
+        Returns:
+        - Object3D: The same object.
+        """
+        self.objects.append(obj)
+        self.version += 1
+        return obj
+
+    def remove(self, obj):
+        #Remove an object from the scene, ignoring objects that are not in it
+        if obj in self.objects:
+            self.objects.remove(obj)
+            self.version += 1
+
+    def replace(self, old, new):
+        #Put new where old was, or add it if old is not in the scene
+        if old in self.objects:
+            self.objects[self.objects.index(old)] = new
+        else:
+            self.objects.append(new)
+        self.version += 1
+
+    def add_instance(self, obj, pos=(0, 0, 0)):
+        """
+        Add another instance of an object's mesh, translated by pos relative to the original.
+
+        Args:
+        - obj (Object3D): The object to instance.
+        - pos (tuple): Translation vector (tx, ty, tz).
+
+        Returns:
+        - Object3D: The new instance.
+        """
+        instance = obj.instance()
+        instance.translate(pos)
+        return self.add(instance)
+
+    def pick(self, position):
+        """
+        Find the face under a point of the screen.
+
+        Args:
+        - position (tuple): (x, y) screen position in pixels.
+
+        Returns:
+        - tuple: (object, face index) of the closest face hit, (None, -1) if there is none.
+        """
+        origin, direction = self.render.camera.ray(position)
+        length = np.linalg.norm(direction)
+        best, best_face, best_t = None, -1, np.inf
+        for obj in self.objects:
+            if not obj.visible:
+                continue
+            # Objects whose bounding sphere the ray misses, or only enters beyond the closest hit so far, are skipped
+            center, radius = obj.bounds()
+            to_center = center[:3] - origin
+            along = to_center @ direction / length
+            if to_center @ to_center - along ** 2 > radius ** 2 or along + radius < 0:
+                continue
+            if (along - radius) / length >= best_t:
+                continue
+            face, t = obj.pick(origin, direction)
+            if face >= 0 and t < best_t:
+                best, best_face, best_t = obj, face, t
+        return best, best_face
+
+    def collide(self, start, end, radius):
+        """
+        Find where a moving point would first come closer than radius to an object, see hull.segment_entries.
+        The whole hulls of all objects are tested at once, the hulls of their parts only for the objects
+        the movement reaches. Objects are not solid to a point that starts inside of them.
+
+        Args:
+        - start, end (numpy arrays): World space start and end of the movement (3 components).
+        - radius (float): Distance to keep from the objects.
+
+        Returns:
+        - tuple: (share of the movement before the first contact, world space normal of the surface hit)
+          or (inf, None) if the movement is free.
+        """
+        hulls = [obj.world_hull() for obj in self.objects if obj.visible]
+        hulls = [(whole, parts) for whole, parts in hulls if len(parts)]
+        if not hulls:
+            return np.inf, None
+        reached, _ = segment_entries(np.stack([whole for whole, _ in hulls]), start, end, radius)
+        best_t, best_normal = np.inf, None
+        for i in np.flatnonzero(reached <= 1):
+            parts = hulls[i][1]
+            t, planes = segment_entries(parts, start, end, radius)
+            t[planes < 0] = np.inf
+            j = t.argmin()
+            if t[j] < best_t:
+                best_t, best_normal = t[j], parts[j, planes[j], :3]
+        return best_t, best_normal
+
+    def visible_objects(self):
+        """
+        Test all objects against the view frustum in one batched pass.
+
+        Returns:
+        - tuple: (list of the objects that may be visible, (M,) on-screen radii of their bounding spheres in pixels,
+          (M, 4) screen bounds of their bounding spheres, see Camera.screen_bounds).
+        """
+        camera = self.render.camera
+        camera.update()
+        objects = [obj for obj in self.objects if obj.visible]
+        if not objects:
+            return [], np.zeros(0), np.zeros((0, 4))
+        bounds = [obj.bounds() for obj in objects]
+        centers, radii = np.stack([center for center, _ in bounds]), np.array([radius for _, radius in bounds])
+        view_centers = centers @ camera.view_matrix
+        inside = camera.spheres_in_frustum(view_centers, radii)
+        return ([obj for obj, keep in zip(objects, inside) if keep], camera.projected_radii(centers[inside], radii[inside]),
+                camera.screen_bounds(view_centers[inside], radii[inside]))
+
+    def screen_rect(self, objects, screen_bounds):
+        """
+        Screen area the objects may draw to: their bounds widened by the line width and their labels.
+
+        Args:
+        - objects (list): Visible objects.
+        - screen_bounds (numpy array): (M, 4) screen bounds of their bounding spheres.
+
+        Returns:
+        - pygame.Rect or None: The union of the areas, None without objects.
+        """
+        rects = []
+        for obj, (left, top, right, bottom) in zip(objects, screen_bounds):
+            rect = pg.Rect(int(left) - 2, int(top) - 2, int(right - left) + 5, int(bottom - top) + 5)
+            if obj.label:
+                # Labels are drawn right below the last vertex of their face
+                rect.width += obj.font.size(obj.label)[0]
+                rect.height += obj.font.get_linesize()
+            rects.append(rect)
+        if not rects:
+            return None
+        return rects[0].unionall(rects[1:]).clip(self.render.screen.get_rect())
+
+    def draw(self, render_mode="wireframe"):
+        """
+        Draw every visible object.
+
+        Args:
+        - render_mode (str): One of Object3D.RENDER_MODES, used for objects without their own render_mode.
+
+        Returns:
+        - int: Number of triangles drawn.
+        """
+        # Group the instances by mesh (level of detail included) and render mode, every group is drawn with one batched call
+        groups = {}
+        self.complete = True
+        with self.render.profiler.stage("cull"):
+            objects, pixel_radii, screen_bounds = self.visible_objects()
+            self.drawn_rect = self.screen_rect(objects, screen_bounds)
+            for obj, pixel_radius in zip(objects, pixel_radii):
+                if isinstance(obj, ChunkedObject):
+                    meshes = obj.visible_chunks()
+                    self.complete = self.complete and obj.complete
+                elif self.use_lods:
+                    meshes = [obj.level_of_detail(obj.lod_level(pixel_radius))]
+                else:
+                    meshes = [obj]
+                for mesh in meshes:
+                    mode = mesh.render_mode or render_mode
+                    groups.setdefault((id(mesh.vertices_untouched), id(mesh.face_indices), mode), []).append(mesh)
+        self.render.profiler.count("objects drawn", sum(len(objects) for objects in groups.values()))
+        self.triangles_drawn = 0
+        for (_, _, mode), objects in groups.items():
+            self.triangles_drawn += draw_instances(self.render, objects, mode)
+        return self.triangles_drawn
+
+    def draw_boxes(self):
+        """
+        Draw the bounding boxes of the visible objects instead of their meshes, the cheapest stand-in for a
+        scene in motion (see governor.py). Edges reaching behind the near plane are left out.
+
+        Returns:
+        - int: Number of triangles drawn, always 0.
+        """
+        render, camera = self.render, self.render.camera
+        with render.profiler.stage("cull"):
+            objects, _, screen_bounds = self.visible_objects()
+            self.drawn_rect = self.screen_rect(objects, screen_bounds)
+            self.complete = True
+        with render.profiler.stage("raster"):
+            view_projection = camera.view_projection_matrix()
+            for obj in objects:
+                low, high = obj.local_box
+                corners = np.column_stack([low + BOX_CORNERS * (high - low), np.ones(8)]) @ obj.transform @ view_projection
+                w = corners[:, 3]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    xy = np.column_stack([render.H_WIDTH * (corners[:, 0] / w + 1), render.H_HEIGHT * (1 - corners[:, 1] / w)])
+                for a, b in BOX_EDGES:
+                    if w[a] > camera.near_plane and w[b] > camera.near_plane:
+                        pg.draw.line(render.screen, obj.colors[0], xy[a], xy[b], 2)
+        self.render.profiler.count("objects drawn", len(objects))
+        self.triangles_drawn = 0
+        return 0
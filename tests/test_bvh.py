@@ -0,0 +1,49 @@
+import os
+import numpy as np
+from bvh import BVH
+from obj_parser import parse_obj
+
+def brute_force(vertices, face_offsets, face_indices, origin, direction):
+    #Closest hit of the ray with the fan triangles of every face, (face, distance) or (-1, inf)
+    counts = np.diff(face_offsets) - 2
+    faces = np.repeat(np.arange(len(counts)), counts)
+    corners = np.arange(len(faces)) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(face_offsets[:-1], counts)
+    a = vertices[face_indices[face_offsets[faces]], :3].astype(np.float64)
+    e1 = vertices[face_indices[corners + 1], :3] - a
+    e2 = vertices[face_indices[corners + 2], :3] - a
+    p = np.cross(direction, e2)
+    det = (e1 * p).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = origin - a
+        u = (s * p).sum(axis=1) / det
+        q = np.cross(s, e1)
+        v = (q @ direction) / det
+        t = (e2 * q).sum(axis=1) / det
+    hit = (np.abs(det) >= 1e-12) & (u >= 0) & (u <= 1) & (v >= 0) & (u + v <= 1) & (t > 0)
+    if not hit.any():
+        return -1, np.inf
+    best = np.flatnonzero(hit)[np.argmin(t[hit])]
+    return faces[best], t[best]
+
+def test_pick_matches_brute_force():
+    mesh = parse_obj(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "res", "Bear.obj"))
+    vertices = mesh["vertices"].astype(np.float32)
+    bvh = BVH.build(vertices, mesh["face_offsets"], mesh["face_indices"])
+    low, high = vertices[:, :3].min(axis=0), vertices[:, :3].max(axis=0)
+    center, radius = (low + high) / 2, float(np.linalg.norm(high - low))
+    rng = np.random.default_rng(1)
+    hits = 0
+    for _ in range(300):
+        # From a random point around the mesh towards a random point in its bounding box
+        away = rng.normal(size=3)
+        origin = center + away / np.linalg.norm(away) * radius
+        direction = rng.uniform(low, high) - origin
+        face, t = bvh.intersect(vertices, mesh["face_offsets"], mesh["face_indices"], origin, direction)
+        expected_face, expected_t = brute_force(vertices, mesh["face_offsets"], mesh["face_indices"], origin, direction)
+        assert np.isclose(t, expected_t, rtol=1e-6) or t == expected_t == np.inf
+        hits += face != -1
+        # Faces at the same distance (a shared edge) may be hit by either
+        assert face == expected_face or np.isclose(t, expected_t, rtol=1e-9)
+    assert hits > 100
+    # A ray pointing away from the mesh misses it
+    assert bvh.intersect(vertices, mesh["face_offsets"], mesh["face_indices"], high + 1, np.ones(3))[0] == -1
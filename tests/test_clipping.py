@@ -0,0 +1,25 @@
+import numpy as np
+from clipping import clip_near
+
+NEAR = 0.1
+
+def test_triangle_straddling_the_near_plane_becomes_a_quad():
+    clip = np.array([[0.0, 0.0, 0.5, 1.0], [1.0, 0.0, 1.5, 2.0], [0.0, 1.0, -1.5, -1.0]])
+    new_vertices, offsets, indices, sources = clip_near(clip, np.array([0]), np.array([0]), np.array([0, 3]),
+                                                        np.array([0, 1, 2]), NEAR)
+    assert offsets.tolist() == [0, 4] and sources.tolist() == [0]
+    polygon = new_vertices[indices]
+    assert np.allclose(polygon[:2], clip[:2])
+    assert np.allclose(polygon[2:, 3], NEAR)
+    # The new corners lie on the edges that cross the plane, from the second to the third vertex and back to the first
+    for corner, (a, b) in zip(polygon[2:], ((1, 2), (2, 0))):
+        t = (NEAR - clip[a, 3]) / (clip[b, 3] - clip[a, 3])
+        assert np.allclose(corner, clip[a] + t * (clip[b] - clip[a]))
+
+def test_faces_in_front_are_kept_and_faces_behind_dropped():
+    clip = np.array([[0.0, 0.0, 0.5, 1.0], [1.0, 0.0, 0.5, 1.0], [0.0, 1.0, 0.5, 1.0],
+                     [0.0, 0.0, -0.5, -1.0], [1.0, 0.0, -0.5, -1.0], [0.0, 1.0, -0.5, -1.0]])
+    new_vertices, offsets, indices, sources = clip_near(clip, np.array([0, 1]), np.array([0, 0]), np.array([0, 3, 6]),
+                                                        np.arange(6), NEAR)
+    assert sources.tolist() == [0] and offsets.tolist() == [0, 3]
+    assert np.array_equal(new_vertices[indices], clip[:3])
@@ -0,0 +1,42 @@
+import numpy as np
+from mesh_cache import MeshCache
+from obj_parser import parse_obj
+
+def write_triangle(path, z):
+    path.write_text("v 0 0 %d\nv 1 0 %d\nv 0 1 %d\nf 1 2 3\n" % (z, z, z))
+    return str(path)
+
+def test_store_and_load_round_trip(tmp_path):
+    filename = write_triangle(tmp_path / "triangle.obj", 0)
+    mesh = parse_obj(filename)
+    mesh["edges"] = np.array([[0, 1], [0, 2], [1, 2]], dtype=np.int32)
+    cache = MeshCache(str(tmp_path / "cache"))
+    assert cache.load(filename) is None
+    cache.store(filename, mesh)
+    loaded = cache.load(filename)
+    assert set(loaded) == set(mesh)
+    for name, value in mesh.items():
+        if isinstance(value, np.ndarray):
+            assert isinstance(loaded[name], np.memmap) and loaded[name].dtype == value.dtype
+            assert np.array_equal(loaded[name], value)
+    assert loaded["material_names"] == mesh["material_names"]
+    # Other key material is another entry, a changed file is a miss
+    assert cache.load(filename, "no-lods") is None
+    write_triangle(tmp_path / "triangle.obj", 1)
+    assert cache.load(filename) is None
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    filenames = [write_triangle(tmp_path / ("triangle_%d.obj" % z), z) for z in range(3)]
+    cache = MeshCache(str(tmp_path / "cache"))
+    cache.store(filenames[0], parse_obj(filenames[0]))
+    cache.max_bytes = 2 * cache.size()
+    cache.store(filenames[1], parse_obj(filenames[1]))
+    cache.load(filenames[0])
+    cache.store(filenames[2], parse_obj(filenames[2]))
+    assert cache.load(filenames[1]) is None
+    assert cache.load(filenames[0]) is not None and cache.load(filenames[2]) is not None
+    # The entry just stored stays even when it is bigger than the whole cache
+    cache.max_bytes = 1
+    cache.store(filenames[1], parse_obj(filenames[1]))
+    assert cache.load(filenames[1]) is not None
+    assert cache.load(filenames[0]) is None and cache.load(filenames[2]) is None
@@ -0,0 +1,57 @@
+import os
+import numpy as np
+from mesh_optimizer import optimize_mesh, WELD_TOLERANCE
+from obj_parser import parse_obj
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def grid_soup(side):
+    #A flat grid of side x side quads split into triangles, every triangle with vertices of its own
+    x, y = np.meshgrid(np.arange(side + 1), np.arange(side + 1), indexing="ij")
+    points = np.column_stack([x.ravel(), y.ravel(), np.zeros(x.size), np.ones(x.size)])
+    i, j = np.meshgrid(np.arange(side), np.arange(side), indexing="ij")
+    a = (i * (side + 1) + j).ravel()
+    triangles = np.stack([a, a + side + 1, a + 1, a + 1, a + side + 1, a + side + 2], axis=1).reshape(-1, 3)
+    return {"vertices": points[triangles.ravel()], "face_offsets": np.arange(0, triangles.size + 1, 3),
+            "face_indices": np.arange(triangles.size, dtype=np.int32),
+            "face_materials": np.zeros(len(triangles), dtype=np.int32), "material_names": ["default"],
+            "palette": np.zeros((1, 3), dtype=np.uint8)}
+
+def face_corners(mesh, face):
+    return mesh["vertices"][mesh["face_indices"][mesh["face_offsets"][face]:mesh["face_offsets"][face + 1]], :3]
+
+def test_optimized_faces_keep_their_corners():
+    mesh = parse_obj(os.path.join(ROOT, "res", "Tree.obj"))
+    optimized = dict(mesh)
+    counts = optimize_mesh(optimized)
+    tolerance = WELD_TOLERANCE * np.ptp(mesh["vertices"][:, :3], axis=0).max() * 2
+    assert counts["vertices"][1] < counts["vertices"][0]
+    assert len(np.unique(optimized["original_face"])) == len(optimized["original_face"])
+    for face, source in enumerate(optimized["original_face"]):
+        corners = slice(optimized["face_offsets"][face], optimized["face_offsets"][face + 1])
+        # Every corner is the file's corner it came from, at most moved by the welding
+        assert np.abs(face_corners(optimized, face) - mesh["vertices"][optimized["original_indices"][corners], :3]).max() <= tolerance
+        assert set(optimized["original_indices"][corners]) <= set(mesh["face_indices"][mesh["face_offsets"][source]:mesh["face_offsets"][source + 1]])
+        assert optimized["face_materials"][face] == mesh["face_materials"][source]
+    # The faces dropped collapsed to less than a triangle
+    for source in np.setdiff1d(np.arange(len(mesh["face_materials"])), optimized["original_face"]):
+        assert len(np.unique(np.round(face_corners(mesh, source) / tolerance), axis=0)) < 3
+    # Every polygon side is one of the edges
+    edges = optimized["edges"][optimized["face_edges"]]
+    following = np.arange(1, len(optimized["face_indices"]) + 1)
+    following[optimized["face_offsets"][1:] - 1] = optimized["face_offsets"][:-1]
+    sides = np.sort(np.column_stack([optimized["face_indices"], optimized["face_indices"][following]]), axis=1)
+    assert np.array_equal(edges, sides)
+
+def test_triangle_soup_is_welded_into_the_grid():
+    side = 20
+    mesh = grid_soup(side)
+    counts = optimize_mesh(mesh)
+    assert counts["vertices"] == (6 * side * side, (side + 1) ** 2)
+    assert counts["faces"] == (2 * side * side, 2 * side * side)
+    assert counts["edges"][1] == 2 * side * (side + 1) + side * side
+    # The surface is the same: the area of the grid, every unit square once
+    a, b, c = (mesh["vertices"][mesh["face_indices"][k::3], :3] for k in range(3))
+    areas = np.linalg.norm(np.cross(b - a, c - a), axis=1) / 2
+    assert np.allclose(areas, 0.5) and np.isclose(areas.sum(), side * side)
+    assert len(np.unique(np.round((a + b + c) / 3, 6), axis=0)) == 2 * side * side
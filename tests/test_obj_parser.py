@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from obj_parser import parse_obj
+from parser_benchmark import legacy_parse
+
+def write_quads(path, count, negative):
+    #Quads with texture coordinates and a normal each, every one written right after its records. The faces
+    #use positive indices, or negative ones counting back from the records read so far
+    rng = np.random.default_rng(0)
+    with open(path.with_suffix(".mtl"), "w") as mtl:
+        mtl.write("newmtl red\nKd 1 0 0\nnewmtl blue\nKd 0 0 1\n")
+    with open(path, "w") as f:
+        f.write("mtllib %s\n" % path.with_suffix(".mtl").name)
+        for q in range(count):
+            if q % 3 == 0:
+                f.write("usemtl %s\n" % ("red", "blue")[q // 3 % 2])
+            for x, y, z in rng.uniform(-1, 1, (4, 3)):
+                f.write("v %.6f %.6f %.6f\n" % (x, y, z))
+            for u, v in rng.uniform(0, 1, (4, 2)):
+                f.write("vt %.6f %.6f\n" % (u, v))
+            f.write("vn 0 0 1\n")
+            if negative:
+                f.write("f %s\n" % " ".join("%d/%d/-1" % (k - 4, k - 4) for k in range(4)))
+            else:
+                f.write("f %s\n" % " ".join("%d/%d/%d" % (4 * q + k + 1, 4 * q + k + 1, q + 1) for k in range(4)))
+
+def test_negative_and_attribute_indices_match_legacy_parser(tmp_path):
+    write_quads(tmp_path / "positive.obj", 10, negative=False)
+    write_quads(tmp_path / "negative.obj", 10, negative=True)
+    vertices, faces, _ = legacy_parse(str(tmp_path / "positive.obj"))
+    mesh = parse_obj(str(tmp_path / "negative.obj"), attributes=True)
+    assert np.allclose(mesh["vertices"], vertices)
+    assert mesh["face_offsets"].tolist() == np.cumsum([0] + [len(face.vertices) for face in faces]).tolist()
+    assert mesh["face_indices"].tolist() == [index for face in faces for index in face.vertices]
+    assert [mesh["material_names"][m] for m in mesh["face_materials"]] == [face.material_name for face in faces]
+    assert mesh["face_texcoords"].tolist() == mesh["face_indices"].tolist()
+    assert mesh["face_normals"].tolist() == np.repeat(np.arange(10), 4).tolist()
+    assert mesh["texcoords"].shape == (40, 2) and mesh["normals"].tolist() == [[0, 0, 1]] * 10
+
+def test_chunks_and_directory_give_the_same_mesh(tmp_path):
+    write_quads(tmp_path / "negative.obj", 50, negative=True)
+    whole = parse_obj(str(tmp_path / "negative.obj"), attributes=True)
+    chunked = parse_obj(str(tmp_path / "negative.obj"), attributes=True, chunk_size=100)
+    stored = parse_obj(str(tmp_path / "negative.obj"), attributes=True, chunk_size=100, directory=str(tmp_path))
+    for mesh in (chunked, stored):
+        for name, value in whole.items():
+            assert np.array_equal(mesh[name], value) if isinstance(value, np.ndarray) else mesh[name] == value
+    assert isinstance(stored["face_indices"], np.memmap)
+
+@pytest.mark.parametrize("face, error", [
+    ("f 0 2 3", "line 6: invalid vertex index '0'"),
+    ("f 1 2 4", "line 6: invalid vertex index '4'"),
+    ("f 1 2 -4", "line 6: invalid vertex index '-4'"),
+    ("f 1 2 x", "line 6: invalid vertex index 'x'"),
+    ("f 1/2 2/1 3/1", "line 6: invalid texture coordinate index '2'"),
+    ("f 1//1 2//2 3//1", "line 6: invalid normal index '2'"),
+])
+def test_invalid_indices_raise_with_the_line(tmp_path, face, error):
+    path = tmp_path / "bad.obj"
+    path.write_text("v 0 0 0\nv 1 0 0\nv 0 1 0\nvt 0 0\nvn 0 0 1\n" + face + "\n")
+    with pytest.raises(ValueError, match=error):
+        parse_obj(str(path))
+
+def test_trailing_comment_ends_a_face(tmp_path):
+    path = tmp_path / "comment.obj"
+    path.write_text("v 0 0 0\nv 1 0 0\nv 0 1 0\nf 1 2 3 # a triangle\n")
+    mesh = parse_obj(str(path))
+    assert mesh["face_offsets"].tolist() == [0, 3] and mesh["face_indices"].tolist() == [0, 1, 2]
@@ -0,0 +1,317 @@
+"""
+Headless thumbnail and turntable rendering of model files.
+
+Usage: python thumbnails.py [--output thumbnails] [--size 256 256] [--frames 1] [--mode filled]
+                            [--background 255 255 255] [--workers N] PATH...
+
+PATH is a model file or a directory searched for .obj, .fbx and .3ds files. Every model is loaded
+with Renderer.get_object_from_file (without levels of detail, and without the mesh cache, which is not
+safe to write from several processes), moved and scaled so that its bounding sphere fills the view, and
+drawn by the regular scene code onto an offscreen surface. With --frames 1 one <name>.png is written per
+model, otherwise a turntable <name>_<frame>.png of the camera orbiting the model once. Images mirror the
+layout of the searched directories below the output directory.
+
+Files are spread over worker processes that take the next file as soon as they are done with one. Every
+worker encodes and writes its images on a background thread: the encoder compresses with zlib, which
+releases the GIL (pygame's PNG writer does not), so rendering never waits for it. Throughput is
+reported in models per second.
+"""
+
+import os
+import sys
+import math
+import time
+import zlib
+import queue
+import struct
+import argparse
+import threading
+import multiprocessing
+import numpy as np
+import pygame as pg
+from main import Renderer
+from camera import Camera
+from matrix_functionality import Projection
+from scene import Scene
+from object3d import Object3D
+from profiler import Profiler
+from ui_layer import UILayer
+from rasterizer import new_depth_buffer
+from loader import find_models, CONVERTED_FORMATS
+from chunked_mesh import ChunkedObject
+from governor import QUALITY_LEVELS
+
+# Models are scaled to this bounding sphere radius, well inside the near and far planes of the camera
+FRAME_RADIUS = 10.0
+# Space left around the bounding sphere, relative to its radius
+FRAME_MARGIN = 1.1
+# Angle of the camera above the horizon
+CAMERA_ELEVATION = math.radians(20)
+# Frames waiting to be written per worker, rendering blocks when the writer falls that far behind
+WRITE_QUEUE_SIZE = 64
+
+def encode_png(width, height, pixels, level=6):
+    """
+    Encode 8-bit RGB pixels as a PNG file.
+
+    Args:
+    - width, height (int): Image size.
+    - pixels (bytes): Rows of RGB pixels, top to bottom.
+    - level (int): zlib compression level.
+
+    Returns:
+    - bytes: The PNG file.
+    """
+    rows = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    #Every row starts with its filter type, 0 for none
+    rows[:, 1:] = np.frombuffer(pixels, dtype=np.uint8).reshape(height, width * 3)
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows.tobytes(), level))
+            + chunk(b"IEND", b""))
+
+class ImageWriter:
+    """
+    Encodes and writes images on a background thread.
+
+    Attributes:
+    - queue: Pending (filename, width, height, pixels) images.
+    - written: Number of images written.
+    - errors: Messages of the writes that failed.
+    """
+    def __init__(self, queue_size=WRITE_QUEUE_SIZE):
+        self.queue = queue.Queue(queue_size)
+        self.written = 0
+        self.errors = []
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def put(self, filename, surface):
+        """
+        Queue a surface to be written as a PNG file. The pixels are copied, the surface can be drawn to right away.
+
+        Args:
+        - filename (str): Path of the image, missing directories are created.
+        - surface (pygame.Surface): The image.
+        """
+        width, height = surface.get_size()
+        self.queue.put((filename, width, height, pg.image.tobytes(surface, "RGB")))
+
+    def run(self):
+        #Body of the writer thread, a None item stops it
+        for filename, width, height, pixels in iter(self.queue.get, None):
+            try:
+                os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+                with open(filename, "wb") as f:
+                    f.write(encode_png(width, height, pixels))
+                self.written += 1
+            except OSError as error:
+                self.errors.append("%s: %s" % (filename, error))
+
+    def close(self):
+        #Write the remaining images and stop the thread
+        self.queue.put(None)
+        self.thread.join()
+
+class OffscreenRenderer(Renderer):
+    """
+    Renderer that draws single models onto an offscreen surface, without a window or user interface.
+
+    Attributes (on top of the ones of Renderer that drawing uses):
+    - background: RGB color behind the model.
+    """
+    def __init__(self, size=(256, 256), render_mode="filled", background=(255, 255, 255)):
+        """
+        Initialize the offscreen renderer.
+
+        Args:
+        - size (tuple): (width, height) of the images.
+        - render_mode (str): One of Object3D.RENDER_MODES.
+        - background (tuple): RGB color behind the model.
+        """
+        self.RES = self.WIDTH, self.HEIGHT = size
+        self.H_WIDTH, self.H_HEIGHT = self.WIDTH // 2, self.HEIGHT // 2
+        self.screen = pg.Surface(self.RES)
+        self.background = background
+        self.skybox_image = pg.Surface(self.RES)
+        self.skybox_image.fill(background)
+        self.ui = UILayer(self.screen, None)
+        self.rotateX_checked = self.rotateY_checked = self.rotateZ_checked = False
+        self.mesh_cache = None
+        self.render_mode = render_mode
+        self.depth_buffer = new_depth_buffer(self.WIDTH, self.HEIGHT)
+        self.profiler = Profiler()
+        self.picked = None
+        self.face_stride, self.resolution_scale, self.proxy_boxes = QUALITY_LEVELS[0]
+        self.frame, self.frame_reused = None, False
+        self.camera = Camera(self, [0, 0, -1])
+        self.projection = Projection(self)
+        self.scene = Scene(self)
+        # Images are small, every model is drawn at full detail
+        self.scene.use_lods = False
+        self.object = None
+
+    def load(self, filename):
+        """
+        Load a model and make it fill the view.
+
+        Args:
+        - filename (str): Path to the model file.
+
+        Returns:
+        - Object3D: The loaded object.
+        """
+        obj = self.get_object_from_file(filename, lods=False)
+        if isinstance(obj, ChunkedObject):
+            # Every image is a single frame, all chunks in view are paged in for it
+            obj.loads_per_frame = None
+        center, radius = obj.bounds()
+        obj.translate(-center[:3])
+        if radius > 0:
+            obj.scale(FRAME_RADIUS / radius)
+        self.set_object(obj)
+        return obj
+
+    def orbit(self, angle):
+        """
+        Put the camera on the turntable orbit, looking at the model.
+
+        Args:
+        - angle (float): Angle around the vertical axis in radians, 0 is in front of the model.
+        """
+        #Distance at which the framed bounding sphere touches the narrower side of the view
+        distance = FRAME_RADIUS * FRAME_MARGIN / math.sin(min(self.camera.h_fov, self.camera.v_fov) / 2)
+        direction = np.array([math.sin(angle) * math.cos(CAMERA_ELEVATION), math.sin(CAMERA_ELEVATION),
+                              -math.cos(angle) * math.cos(CAMERA_ELEVATION)])
+        self.camera.position = np.array([*(direction * distance), 1.0])
+        self.camera.look_at(np.zeros(3))
+
+    def render(self, filename, frames, writer, output):
+        """
+        Draw the frames of a model and queue them for writing.
+
+        Args:
+        - filename (str): Path to the model file.
+        - frames (int): Number of frames, 1 for a single thumbnail.
+        - writer (ImageWriter): Writer of the images.
+        - output (str): Path of the images without the extension.
+
+        Returns:
+        - int: Number of faces of the model.
+        """
+        obj = self.load(filename)
+        for frame in range(frames):
+            self.orbit(2 * math.pi * frame / frames)
+            self.draw()
+            writer.put(output + (".png" if frames == 1 else "_%03d.png" % frame), self.screen)
+        return obj.polygon_count
+
+def find_jobs(paths, output, extensions=(".obj",) + CONVERTED_FORMATS):
+    """
+    Model files to render and where their images go.
+
+    Args:
+    - paths (list): Model files and directories to search.
+    - output (str): Output directory.
+    - extensions (tuple): File extensions of the models.
+
+    Returns:
+    - list: (model path, image path without extension) tuples.
+    """
+    jobs = []
+    for path in paths:
+        if os.path.isdir(path):
+            jobs.extend((model, os.path.join(output, os.path.splitext(os.path.relpath(model, path))[0]))
+                        for model in find_models([path], extensions))
+        else:
+            jobs.append((path, os.path.join(output, os.path.splitext(os.path.basename(path))[0])))
+    return jobs
+
+def render_worker(jobs, results, size, frames, render_mode, background):
+    #Entry point of the worker processes, renders jobs until a None job and reports every one to results
+    app = OffscreenRenderer(size, render_mode, background)
+    writer = ImageWriter()
+    for filename, output in iter(jobs.get, None):
+        start = time.perf_counter()
+        try:
+            faces = app.render(filename, frames, writer, output)
+        except Exception as error:
+            results.put(("error", filename, "%s: %s" % (type(error).__name__, error)))
+        else:
+            results.put(("done", filename, faces, time.perf_counter() - start))
+    writer.close()
+    results.put(("exit", writer.written, writer.errors))
+
+def render_all(jobs, workers=None, size=(256, 256), frames=1, render_mode="filled", background=(255, 255, 255)):
+    """
+    Render models on a pool of worker processes.
+
+    Args:
+    - jobs (list): (model path, image path without extension) tuples, see find_jobs.
+    - workers (int): Number of worker processes, the number of CPUs by default.
+    - size (tuple): (width, height) of the images.
+    - frames (int): Frames per model, 1 for a single thumbnail.
+    - render_mode (str): One of Object3D.RENDER_MODES.
+    - background (tuple): RGB color behind the models.
+
+    Returns:
+    - dict: Numbers of models rendered and failed, images written, seconds and models per second.
+    """
+    workers = max(min(workers or os.cpu_count() or 1, len(jobs)), 1)
+    context = multiprocessing.get_context("spawn")
+    job_queue, results = context.Queue(), context.Queue()
+    for job in jobs:
+        job_queue.put(job)
+    for _ in range(workers):
+        job_queue.put(None)
+    start = time.perf_counter()
+    processes = [context.Process(target=render_worker, args=(job_queue, results, size, frames, render_mode, background),
+                                 daemon=True) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    rendered = failed = written = exited = 0
+    while exited < workers:
+        try:
+            message = results.get(timeout=1)
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                print("Workers stopped unexpectedly")
+                break
+            continue
+        if message[0] == "done":
+            rendered += 1
+            print("[%d/%d] %s: %d faces, %.0f ms" % (rendered + failed, len(jobs), message[1], message[2], message[3] * 1000))
+        elif message[0] == "error":
+            failed += 1
+            print("[%d/%d] %s failed: %s" % (rendered + failed, len(jobs), message[1], message[2]))
+        else:
+            exited += 1
+            written += message[1]
+            for error in message[2]:
+                print("Writing failed: " + error)
+    for process in processes:
+        process.join()
+    seconds = time.perf_counter() - start
+    return {"rendered": rendered, "failed": failed, "images": written, "seconds": seconds,
+            "models_per_second": rendered / seconds if seconds > 0 else 0.0}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--output", default="thumbnails", help="directory the images are written to")
+    parser.add_argument("--size", type=int, nargs=2, default=(256, 256), metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--frames", type=int, default=1, help="turntable frames per model, 1 for a thumbnail")
+    parser.add_argument("--mode", default="filled", choices=Object3D.RENDER_MODES)
+    parser.add_argument("--background", type=int, nargs=3, default=(255, 255, 255), metavar=("R", "G", "B"))
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    args = parser.parse_args()
+    jobs = find_jobs(args.paths, args.output)
+    if not jobs:
+        print("No models found")
+        sys.exit(1)
+    summary = render_all(jobs, args.workers, tuple(args.size), max(args.frames, 1), args.mode, tuple(args.background))
+    print("Rendered %d models (%d images) in %.1fs: %.2f models/s, %d failed" % (
+        summary["rendered"], summary["images"], summary["seconds"], summary["models_per_second"], summary["failed"]))
+    sys.exit(1 if summary["failed"] else 0)
@@ -0,0 +1,103 @@
+"""
+Cached drawing of the user interface and tracking of the screen regions that changed.
+
+The screen is composed from scratch every frame, but most of the interface looks the same from one
+frame to the next: text is rendered once per (text, color) and reused, and every element drawn is
+recorded with a key describing its content. Comparing the elements of two frames gives the regions
+whose pixels may differ, so only those have to be pushed to the display with pg.display.update(rects)
+instead of flipping the whole window.
+"""
+
+import pygame as pg
+
+# Rendered text surfaces kept, the oldest unused one is dropped first
+TEXT_CACHE_SIZE = 256
+
+class UILayer:
+    """
+    Draws interface elements from cached surfaces and collects the dirty rectangles of every frame.
+
+    Attributes:
+    - screen: Pygame display surface.
+    - font: Pygame font used by text().
+    - text_surfaces: Rendered text surfaces keyed by (text, color), least recently used first.
+    - items: (key, rect) of every keyed element drawn in the current frame.
+    - dirty: Rectangles that change every frame, e.g. the area the scene was drawn to.
+    - full_redraw: Whether the whole window has to be pushed to the display at the end of the frame.
+    """
+    def __init__(self, screen, font, cache_size=TEXT_CACHE_SIZE):
+        self.screen = screen
+        self.font = font
+        self.cache_size = cache_size
+        self.text_surfaces = {}
+        self.items, self.previous_items = set(), set()
+        self.dirty, self.previous_dirty = [], []
+        self.full_redraw = True
+
+    def text_surface(self, text, color):
+        """
+        Rendered text, from the cache when it was rendered before.
+
+        Args:
+        - text (str): Text to be rendered.
+        - color (tuple): RGB color tuple.
+
+        Returns:
+        - pygame.Surface: The rendered text.
+        """
+        key = (text, tuple(color))
+        surface = self.text_surfaces.pop(key, None)
+        if surface is None:
+            surface = self.font.render(text, True, color)
+            if len(self.text_surfaces) >= self.cache_size:
+                del self.text_surfaces[next(iter(self.text_surfaces))]
+        #Reinserted last, so the dict stays ordered by last use
+        self.text_surfaces[key] = surface
+        return surface
+
+    def text(self, text, color, position):
+        """
+        Draw text on the screen.
+
+        Args:
+        - text (str): Text to be rendered.
+        - color (tuple): RGB color tuple.
+        - position (tuple): (x, y) position of the text on the screen.
+
+        Returns:
+        - pygame.Rect: The area of the screen drawn.
+        """
+        rect = self.screen.blit(self.text_surface(text, color), position)
+        self.add(("text", text, tuple(color)), rect)
+        return rect
+
+    def add(self, key, rect):
+        """
+        Record an element drawn in the current frame.
+
+        Args:
+        - key (hashable): Everything the pixels of the element depend on.
+        - rect (pygame.Rect): The area of the screen drawn.
+        """
+        self.items.add((key, tuple(rect)))
+
+    def add_dirty(self, rect):
+        #Record an area that is redrawn differently every frame
+        if rect:
+            self.dirty.append(pg.Rect(rect))
+
+    def end_frame(self):
+        """
+        Close the current frame.
+
+        Returns:
+        - list: Rectangles that may differ from the previous frame, None if the whole window does.
+        """
+        changed = self.items ^ self.previous_items
+        rects = [pg.Rect(rect) for _, rect in changed] + self.dirty + self.previous_dirty
+        self.previous_items, self.items = self.items, set()
+        self.previous_dirty, self.dirty = self.dirty, []
+        if self.full_redraw:
+            self.full_redraw = False
+            return None
+        return rects